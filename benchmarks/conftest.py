@@ -0,0 +1,122 @@
+"""
+Shared fixtures of the benchmark suite
+
+The trace sizes are set with GRADEIT_BENCH_SIZES, a comma separated list of
+point counts (by default 1000,100000), e.g.
+
+    GRADEIT_BENCH_SIZES=1000,100000,1000000,10000000 pytest benchmarks
+"""
+
+import os
+import tracemalloc
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from gradeit.testing import FakeEPQSServer, write_synthetic_tile
+from gradeit.trace import Trace
+
+pytest.importorskip("pytest_benchmark")
+
+DEFAULT_SIZES = "1000,100000"
+# the EPQS stand-in answers one point per request, so keep its traces small
+API_MAX_POINTS = int(os.environ.get("GRADEIT_BENCH_API_MAX_POINTS", "1000"))
+
+
+def bench_sizes():
+    sizes = os.environ.get("GRADEIT_BENCH_SIZES", DEFAULT_SIZES)
+    return [int(size) for size in sizes.split(",") if size.strip()]
+
+
+def pytest_generate_tests(metafunc):
+    if "n_points" in metafunc.fixturenames:
+        sizes = bench_sizes()
+        if metafunc.definition.get_closest_marker("api"):
+            sizes = [size for size in sizes if size <= API_MAX_POINTS] or [API_MAX_POINTS]
+        metafunc.parametrize("n_points", sizes, ids=[f"{size}pts" for size in sizes])
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "api: benchmarks against the EPQS stand-in")
+
+
+@pytest.fixture(scope="session")
+def usgs_db_path(tmp_path_factory):
+    db_path = tmp_path_factory.mktemp("usgs_db")
+    for grid_ref in ["n40w106", "n41w106"]:
+        write_synthetic_tile(db_path, grid_ref)
+    return db_path
+
+
+@pytest.fixture(scope="session")
+def epqs_server():
+    with FakeEPQSServer() as server:
+        yield server
+
+
+def make_trace(n_points: int) -> Trace:
+    """
+    A looping trace of n_points ~10 ft steps that stays within the
+    synthetic tiles (latitude 39-41, longitude -106 to -105)
+    """
+    t = np.arange(n_points) * 2.7e-5
+    lats = 40.0 + 0.9 * np.sin(t)
+    lons = -105.5 + 0.45 * np.sin(2.3 * t)
+    return Trace.from_lat_lon(lats, lons)
+
+
+def make_trace_df(n_points: int) -> pd.DataFrame:
+    trace = make_trace(n_points)
+    return pd.DataFrame({"latitude": trace.latitude, "longitude": trace.longitude})
+
+
+# (name, n_points, points per second, peak MB) of every benchmark that ran
+_results: List[Tuple[str, int, float, float]] = []
+
+
+def run_benchmark(
+    benchmark,
+    function: Callable,
+    n_points: int,
+    args: tuple = (),
+    kwargs: Optional[dict] = None,
+    rounds: Optional[int] = None,
+):
+    """
+    Benchmark function(*args, **kwargs) and record its throughput (points
+    per second) and the peak memory (in MB) that Python and numpy allocated
+    during one call. The first call, which measures memory, also warms up
+    any caches, so the timed rounds measure warm performance.
+    """
+    kwargs = kwargs or {}
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    if rounds is None:
+        rounds = max(1, min(10, 1_000_000 // max(n_points, 1)))
+    result = benchmark.pedantic(function, args=args, kwargs=kwargs, rounds=rounds, iterations=1)
+
+    points_per_s = n_points / benchmark.stats.stats.mean
+    peak_mb = peak / 1e6
+    benchmark.extra_info["n_points"] = n_points
+    benchmark.extra_info["points_per_s"] = round(points_per_s)
+    benchmark.extra_info["peak_mb"] = round(peak_mb, 1)
+    _results.append((benchmark.name, n_points, points_per_s, peak_mb))
+    return result
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _results:
+        return
+    terminalreporter.section("throughput and peak memory")
+    terminalreporter.write_line(f"{'benchmark':<55} {'points':>10} {'points/s':>14} {'peak MB':>9}")
+    for name, n_points, points_per_s, peak_mb in _results:
+        terminalreporter.write_line(
+            f"{name:<55} {n_points:>10,} {points_per_s:>14,.0f} {peak_mb:>9.1f}"
+        )
@@ -0,0 +1,31 @@
+import pytest
+
+from gradeit.elevation.raster_cache import RasterCache
+from gradeit.elevation.usgs_api import USGSApi
+from gradeit.elevation.usgs_local import get_raster_elev_profile
+
+from conftest import make_trace, run_benchmark
+
+
+def test_get_raster_elev_profile(benchmark, usgs_db_path, n_points):
+    trace = make_trace(n_points)
+    cache = RasterCache()
+    run_benchmark(benchmark, get_raster_elev_profile, n_points, (trace, usgs_db_path, cache))
+
+
+def test_get_raster_elev_profile_uncached(benchmark, usgs_db_path, n_points):
+    trace = make_trace(n_points)
+    run_benchmark(benchmark, get_raster_elev_profile, n_points, (trace, usgs_db_path))
+
+
+@pytest.mark.api
+def test_usgs_api(benchmark, epqs_server, n_points):
+    trace = make_trace(n_points)
+    model = USGSApi(max_in_flight=16, url=epqs_server.url)
+    run_benchmark(
+        benchmark,
+        model.get_elevation_array,
+        n_points,
+        (trace.latitude, trace.longitude),
+        rounds=3,
+    )
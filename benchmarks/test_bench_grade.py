@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from gradeit.elevation.filtering import elevation_filter, segmented_elevation_filter
+from gradeit.filter_bridge import BridgeParams, gradeCorrection_bridge
+from gradeit.grade import get_distances, get_grade
+from gradeit.testing import synthetic_elevation_m
+
+from conftest import make_trace, run_benchmark
+
+
+@pytest.fixture
+def trace(n_points):
+    return make_trace(n_points)
+
+
+@pytest.fixture
+def elevation_ft(trace):
+    return synthetic_elevation_m(trace.latitude, trace.longitude) * 3.28084
+
+
+def test_get_distances(benchmark, trace, n_points):
+    run_benchmark(benchmark, get_distances, n_points, (trace,))
+
+
+def test_get_grade(benchmark, trace, elevation_ft, n_points):
+    distances_ft = get_distances(trace)
+    run_benchmark(benchmark, get_grade, n_points, (elevation_ft, distances_ft))
+
+
+def test_elevation_filter(benchmark, trace, elevation_ft, n_points):
+    distances_ft = get_distances(trace)
+    run_benchmark(
+        benchmark,
+        elevation_filter,
+        n_points,
+        (elevation_ft, trace),
+        dict(distances=distances_ft),
+    )
+
+
+def test_segmented_elevation_filter(benchmark, trace, elevation_ft, n_points):
+    # a dropout (nan run) every 1000 points, so the trace splits into many segments
+    distances_ft = get_distances(trace)
+    elevation_ft = elevation_ft.copy()
+    elevation_ft[500::1000] = np.nan
+    run_benchmark(
+        benchmark,
+        segmented_elevation_filter,
+        n_points,
+        (elevation_ft, trace),
+        dict(distances=distances_ft, sg_window=0),
+    )
+
+
+def test_gradeCorrection_bridge(benchmark, trace, elevation_ft, n_points):
+    distances_ft = np.append(0, get_distances(trace))
+    grade = get_grade(elevation_ft, distances_ft[1:])
+    df = pd.DataFrame(
+        {
+            "distances_ft": distances_ft,
+            "grade_dec_unfiltered": grade,
+            "grade_dec_filtered": grade,
+        }
+    )
+    run_benchmark(benchmark, lambda: gradeCorrection_bridge(df.copy(), BridgeParams()), n_points)
@@ -0,0 +1,21 @@
+from gradeit.gradeit import gradeit
+
+from conftest import make_trace_df, run_benchmark
+
+
+def test_gradeit_local(benchmark, usgs_db_path, n_points):
+    df = make_trace_df(n_points)
+    run_benchmark(
+        benchmark,
+        lambda: gradeit(df.copy(), source="usgs-local", usgs_db_path=usgs_db_path),
+        n_points,
+    )
+
+
+def test_gradeit_local_filtered(benchmark, usgs_db_path, n_points):
+    df = make_trace_df(n_points)
+    run_benchmark(
+        benchmark,
+        lambda: gradeit(df.copy(), source="usgs-local", usgs_db_path=usgs_db_path, filtering=True),
+        n_points,
+    )
@@ -0,0 +1,16 @@
+import subprocess
+import sys
+
+import pytest
+
+from gradeit import repo_root
+
+
+def import_in_fresh_interpreter(module: str):
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=repo_root(), check=True)
+
+
+@pytest.mark.parametrize("module", ["gradeit.grade", "gradeit.gradeit", "gradeit.cli"])
+def test_cold_import(benchmark, module):
+    # the cold start of a short-lived job: a new interpreter importing gradeit
+    benchmark.pedantic(import_in_fresh_interpreter, args=(module,), rounds=5, iterations=1)
@@ -0,0 +1,119 @@
+"""
+gradeit for asyncio services
+
+    model = AsyncUSGSApi()  # or AsyncExecutorModel(USGSLocal(usgs_db_path))
+    graded = await gradeit_async(df, elevation_model=model, filtering=True)
+
+Share one elevation model between all the requests of a service so that
+they share its connections and caches.
+"""
+
+import asyncio
+from pathlib import Path
+from typing import Optional, Union
+
+import pandas as pd
+
+from gradeit.elevation.async_elevation_model import AsyncElevationModel, AsyncExecutorModel
+from gradeit.elevation.async_usgs_api import AsyncUSGSApi
+from gradeit.elevation.elevation_model import ElevationModel
+from gradeit.elevation.filtering import SegmentParams
+from gradeit.filter_bridge import BridgeParams
+from gradeit.grade import get_distances
+from gradeit.gradeit import append_grade, build_elevation_model
+from gradeit.instrumentation import NULL_METRICS, Metrics
+from gradeit.trace import Trace
+
+# traces with at least this many points are graded on a worker thread
+OFFLOAD_POINTS = 10_000
+
+
+async def gradeit_async(
+    df: pd.DataFrame,
+    elevation_model: Union[AsyncElevationModel, ElevationModel],
+    lat_col: str = "latitude",
+    lon_col: str = "longitude",
+    filtering: bool = False,
+    des_sg: int = 17,
+    bridge_params: Optional[BridgeParams] = None,
+    metrics: Optional[Metrics] = None,
+    offload_points: int = OFFLOAD_POINTS,
+    segment_params: Optional[SegmentParams] = None,
+) -> pd.DataFrame:
+    """
+    Add grade to an input dataframe with latitude and longitude columns
+    without blocking the event loop; the async counterpart of gradeit()
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        dataframe with latitude and longitude columns
+    elevation_model : Union[AsyncElevationModel, ElevationModel]
+        the model to look up elevation with, e.g. an AsyncUSGSApi or an
+        AsyncExecutorModel shared between requests; a blocking
+        ElevationModel is run on the default executor of the event loop
+    offload_points : int, optional
+        grade traces with at least this many points on the default executor
+        of the event loop instead of on the event loop itself, by default
+        OFFLOAD_POINTS
+
+    The other parameters are the same as for gradeit().
+
+    Returns
+    -------
+    pd.DataFrame
+        dataframe with grade columns appended
+    """
+    metrics = metrics if metrics is not None else NULL_METRICS
+    loop = asyncio.get_running_loop()
+    offload = len(df) >= offload_points
+
+    with metrics.timer("gradeit.trace"):
+        trace = Trace.from_lat_lon(df[lat_col].values, df[lon_col].values)
+    metrics.count("gradeit.points", len(trace))
+
+    with metrics.timer("gradeit.distance"):
+        if offload:
+            distances_ft = await loop.run_in_executor(None, get_distances, trace)
+        else:
+            distances_ft = get_distances(trace)
+
+    with metrics.timer("gradeit.elevation"):
+        if isinstance(elevation_model, AsyncElevationModel):
+            elevation_ft = await elevation_model.get_elevation_array(
+                trace.latitude, trace.longitude
+            )
+        else:
+            elevation_ft = await loop.run_in_executor(
+                None, elevation_model.get_elevation_array, trace.latitude, trace.longitude
+            )
+
+    args = (
+        df,
+        trace,
+        distances_ft,
+        elevation_ft,
+        filtering,
+        des_sg,
+        bridge_params,
+        metrics,
+        segment_params,
+    )
+    if offload:
+        return await loop.run_in_executor(None, append_grade, *args)
+    return append_grade(*args)
+
+
+def build_async_elevation_model(
+    source: str = "usgs-api",
+    usgs_db_path: Optional[Union[str, Path]] = None,
+    metrics: Optional[Metrics] = None,
+) -> AsyncElevationModel:
+    """
+    Build the async elevation model for the user's desired data source:
+    an AsyncUSGSApi for "usgs-api", otherwise the model from
+    build_elevation_model() run on a thread pool by an AsyncExecutorModel
+    """
+    if source == "usgs-api":
+        return AsyncUSGSApi(metrics=metrics)
+    return AsyncExecutorModel(build_elevation_model(source, usgs_db_path, metrics=metrics))
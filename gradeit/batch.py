@@ -0,0 +1,203 @@
+import traceback
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from gradeit.elevation.elevation_model import ElevationModel
+from gradeit.elevation.shared_tiles import SharedTileRegistry
+from gradeit.elevation.usgs_local import USGSLocal, build_grid_keys
+from gradeit.gradeit import build_elevation_model, gradeit
+
+Trips = Union[pd.DataFrame, Iterable[Tuple[Hashable, pd.DataFrame]]]
+
+
+@dataclass
+class TripResult:
+    """
+    The outcome of grading one trip in a batch: either the graded dataframe
+    or the error that was raised while grading it
+    """
+
+    trip_id: Hashable
+    result: Optional[pd.DataFrame] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def gradeit_batch(
+    trips: Trips,
+    trip_col: str = "trip_id",
+    lat_col: str = "latitude",
+    lon_col: str = "longitude",
+    filtering: bool = False,
+    source: str = "usgs-api",
+    usgs_db_path: Optional[Union[str, Path]] = None,
+    des_sg: int = 17,
+    n_workers: int = 4,
+    executor: str = "process",
+    shared_tile_bytes: Optional[int] = None,
+) -> List[TripResult]:
+    """
+    Add grade to many trips in parallel
+
+    Trips are grouped by the DEM tile most of their points fall in, and each
+    group is graded by a single worker so that its tile cache stays warm.
+
+    Parameters
+    ----------
+    trips : Union[pd.DataFrame, Iterable[Tuple[Hashable, pd.DataFrame]]]
+        either a long dataframe with a trip id column or an iterable of
+        (trip_id, dataframe) pairs
+    trip_col : str, optional
+        name of the trip id column of a long dataframe, by default "trip_id"
+    lat_col : str, optional
+        name of the latitude column, by default "latitude"
+    lon_col : str, optional
+        name of the longitude column, by default "longitude"
+    filtering : bool, optional
+        whether to filter the elevation data, by default False
+    source : str, optional
+        data source for elevation data, by default "usgs-api"
+    usgs_db_path : Optional[Union[str, Path]], optional
+        path to local USGS raster tiles, by default None
+    des_sg : int, optional
+        Savitzky-Golay filter window size, by default 17
+    n_workers : int, optional
+        number of workers, by default 4
+    executor : str, optional
+        "process" or "thread", by default "process"
+    shared_tile_bytes : Optional[int], optional
+        with source "usgs-local", decode whole tiles into shared memory
+        (up to this many bytes) so that worker processes share one copy of
+        each tile, by default None
+
+    Returns
+    -------
+    List[TripResult]
+        one result per trip, in input order
+    """
+    if isinstance(trips, pd.DataFrame):
+        trip_list = [(trip_id, df) for trip_id, df in trips.groupby(trip_col, sort=False)]
+    else:
+        trip_list = list(trips)
+
+    options = dict(
+        lat_col=lat_col,
+        lon_col=lon_col,
+        filtering=filtering,
+        source=source,
+        usgs_db_path=usgs_db_path,
+        des_sg=des_sg,
+    )
+
+    groups = schedule_trips(
+        [trip[1] for trip in trip_list], n_workers, lat_col=lat_col, lon_col=lon_col
+    )
+    tasks = [[(i, trip_list[i][0], trip_list[i][1]) for i in group] for group in groups]
+
+    results: List[Optional[TripResult]] = [None] * len(trip_list)
+
+    shared_tiles = None
+    if shared_tile_bytes is not None and source == "usgs-local":
+        shared_tiles = SharedTileRegistry(max_bytes=shared_tile_bytes)
+
+    pool: Executor
+    if executor == "process":
+        pool = ProcessPoolExecutor(max_workers=n_workers)
+    elif executor == "thread":
+        pool = ThreadPoolExecutor(max_workers=n_workers)
+    else:
+        raise ValueError("Invalid executor. Provide one of these options: ['process','thread']")
+
+    try:
+        with pool:
+            for task_results in pool.map(
+                _grade_trips, tasks, [options] * len(tasks), [shared_tiles] * len(tasks)
+            ):
+                for i, result in task_results:
+                    results[i] = result
+    finally:
+        if shared_tiles is not None:
+            shared_tiles.close()
+
+    return [result for result in results if result is not None]
+
+
+def schedule_trips(
+    trips: List[pd.DataFrame],
+    n_workers: int,
+    lat_col: str = "latitude",
+    lon_col: str = "longitude",
+) -> List[List[int]]:
+    """
+    Group trips (by position) so that trips that mostly fall in the same
+    DEM tile are graded together. Groups larger than an even share of the
+    trips are split so that all workers have work to do.
+
+    Returns
+    -------
+    List[List[int]]
+        groups of trip positions
+    """
+    primary_tiles = np.array([_primary_tile(df, lat_col, lon_col) for df in trips], dtype=np.int64)
+    order = np.argsort(primary_tiles, kind="stable")
+    _, starts = np.unique(primary_tiles[order], return_index=True)
+
+    max_group = max(1, -(-len(trips) // max(n_workers, 1)))
+    groups = []
+    for group in np.split(order, starts[1:]):
+        for start in range(0, len(group), max_group):
+            groups.append(group[start : start + max_group].tolist())
+
+    # hand out the largest groups first so stragglers are short
+    groups.sort(key=len, reverse=True)
+    return groups
+
+
+def _primary_tile(df: pd.DataFrame, lat_col: str, lon_col: str) -> int:
+    keys = build_grid_keys(df[lat_col].values, df[lon_col].values)
+    if len(keys) == 0:
+        return -1
+    unique_keys, counts = np.unique(keys, return_counts=True)
+    return int(unique_keys[np.argmax(counts)])
+
+
+_worker_models: Dict[Tuple[str, Optional[str]], ElevationModel] = {}
+
+
+def _worker_model(
+    source: str,
+    usgs_db_path: Optional[Union[str, Path]],
+    shared_tiles: Optional[SharedTileRegistry] = None,
+) -> ElevationModel:
+    if shared_tiles is not None and usgs_db_path is not None:
+        # the registry belongs to a single batch, so the model is not kept
+        return USGSLocal(usgs_db_path, shared_tiles=shared_tiles)
+    # each worker keeps one model (and so one warm cache) per data source
+    key = (source, None if usgs_db_path is None else str(usgs_db_path))
+    if key not in _worker_models:
+        _worker_models[key] = build_elevation_model(source, usgs_db_path)
+    return _worker_models[key]
+
+
+def _grade_trips(
+    trips: List[Tuple[int, Hashable, pd.DataFrame]],
+    options: Dict[str, Any],
+    shared_tiles: Optional[SharedTileRegistry] = None,
+) -> List[Tuple[int, TripResult]]:
+    results = []
+    for i, trip_id, df in trips:
+        try:
+            model = _worker_model(options["source"], options["usgs_db_path"], shared_tiles)
+            graded = gradeit(df.copy(), elevation_model=model, **options)
+            results.append((i, TripResult(trip_id=trip_id, result=graded)))
+        except Exception:
+            results.append((i, TripResult(trip_id=trip_id, error=traceback.format_exc())))
+    return results
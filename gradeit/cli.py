@@ -0,0 +1,308 @@
+"""
+The gradeit console script: grade a directory or glob of trip files in
+parallel and write the graded trips as Parquet
+
+    gradeit trips/ --output-dir graded/ --source usgs-local --usgs-db-path tiles/ --filtering
+"""
+
+import argparse
+import glob
+import logging
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Sequence, Set, Union
+
+import numpy as np
+import pandas as pd
+
+from gradeit.elevation.elevation_model import ElevationModel
+from gradeit.elevation.manifest import TileManifest
+from gradeit.elevation.usgs_local import USGSLocal
+from gradeit.filter_bridge import BridgeParams
+from gradeit.gradeit import build_elevation_model, gradeit
+from gradeit.result_cache import ResultCache
+
+log = logging.getLogger(__name__)
+
+TRIP_SUFFIXES = (".csv", ".parquet")
+
+
+@dataclass
+class FileResult:
+    """
+    The outcome of grading one trip file
+    """
+
+    path: Path
+    output_path: Path
+    n_points: int = 0
+    seconds: float = 0.0
+    skipped: bool = False
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def find_trip_files(inputs: Sequence[Union[str, Path]]) -> List[Path]:
+    """
+    Expand files, directories (searched recursively) and glob patterns into
+    a sorted list of CSV and Parquet trip files
+    """
+    paths: Set[Path] = set()
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            candidates = [p for p in path.rglob("*") if p.is_file()]
+        elif path.exists():
+            candidates = [path]
+        else:
+            candidates = [Path(p) for p in glob.glob(str(item), recursive=True)]
+        paths.update(p for p in candidates if p.suffix.lower() in TRIP_SUFFIXES)
+    return sorted(paths)
+
+
+def output_path_for(path: Path, output_dir: Path) -> Path:
+    return output_dir / f"{path.stem}.parquet"
+
+
+def grade_files(
+    paths: Sequence[Path],
+    output_dir: Union[str, Path],
+    lat_col: str = "latitude",
+    lon_col: str = "longitude",
+    filtering: bool = False,
+    source: str = "usgs-api",
+    usgs_db_path: Optional[Union[str, Path]] = None,
+    des_sg: int = 17,
+    bridge_params: Optional[BridgeParams] = None,
+    columns: Optional[List[str]] = None,
+    overwrite: bool = False,
+    use_manifest: bool = False,
+    n_workers: int = 4,
+    result_cache_path: Optional[Union[str, Path]] = None,
+) -> List[FileResult]:
+    """
+    Grade trip files in parallel, writing each to
+    <output_dir>/<file stem>.parquet
+
+    Outputs are written to a temporary file and renamed once complete, so
+    an interrupted run can be resumed: files whose output already exists
+    are skipped unless overwrite is set.
+
+    Parameters
+    ----------
+    paths : Sequence[Path]
+        CSV or Parquet trip files, e.g. from find_trip_files
+    output_dir : Union[str, Path]
+        directory to write the graded trips to
+    columns : Optional[List[str]], optional
+        the columns to write, by default all of them
+    overwrite : bool, optional
+        regrade files that already have an output, by default False
+    use_manifest : bool, optional
+        build (or load) the TileManifest of the tiles once before grading
+        and locate tiles through it in every worker; points outside of the
+        tiles get a nan elevation. Before a worker grades a file it opens
+        the tiles of that file and decodes the raster blocks it touches, in
+        tile order, up to the budget of its RasterCache. Only for source
+        "usgs-local", by default False
+    n_workers : int, optional
+        number of worker processes, by default 4
+    result_cache_path : Optional[Union[str, Path]], optional
+        the directory of a ResultCache shared by the workers, so that trips
+        graded by an earlier run with the same options are read back
+        instead of regraded, by default None
+
+    The other parameters are passed to gradeit().
+
+    Returns
+    -------
+    List[FileResult]
+        one result per file, in input order
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    output_paths = [output_path_for(path, output_dir) for path in paths]
+    if len(set(output_paths)) != len(output_paths):
+        raise ValueError("trip files must have distinct names, their outputs would collide")
+
+    results = [FileResult(path=path, output_path=out) for path, out in zip(paths, output_paths)]
+    todo = [i for i, out in enumerate(output_paths) if overwrite or not out.exists()]
+    for i in set(range(len(paths))) - set(todo):
+        results[i].skipped = True
+
+    manifest = None
+    if use_manifest:
+        if source != "usgs-local" or usgs_db_path is None:
+            raise ValueError("use_manifest needs source 'usgs-local' and a usgs_db_path")
+        manifest = TileManifest.load(usgs_db_path)
+        log.info(f"loaded the manifest of {len(manifest.tiles)} tiles")
+
+    options = dict(
+        lat_col=lat_col,
+        lon_col=lon_col,
+        filtering=filtering,
+        des_sg=des_sg,
+        bridge_params=bridge_params,
+    )
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        initializer=_init_worker,
+        initargs=(source, usgs_db_path, manifest, result_cache_path),
+    ) as pool:
+        futures = {
+            pool.submit(_grade_file, paths[i], output_paths[i], columns, options): i for i in todo
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            result = results[i]
+            if result.ok:
+                log.info(f"graded {result.path} ({result.n_points} points, {result.seconds:.1f}s)")
+            else:
+                log.error(f"failed to grade {result.path}:\n{result.error}")
+
+    return results
+
+
+_model: Optional[ElevationModel] = None
+_result_cache: Optional[ResultCache] = None
+
+
+def _init_worker(
+    source: str,
+    usgs_db_path: Optional[Union[str, Path]],
+    manifest: Optional[TileManifest],
+    result_cache_path: Optional[Union[str, Path]] = None,
+):
+    global _model, _result_cache
+    if result_cache_path is not None:
+        _result_cache = ResultCache(result_cache_path)
+    if manifest is not None and usgs_db_path is not None:
+        _model = USGSLocal(usgs_db_path, manifest=manifest)
+    else:
+        _model = build_elevation_model(source, usgs_db_path)
+
+
+def _grade_file(
+    path: Path, output_path: Path, columns: Optional[List[str]], options: dict
+) -> FileResult:
+    start = time.perf_counter()
+    result = FileResult(path=path, output_path=output_path)
+    try:
+        if path.suffix.lower() == ".parquet":
+            df = pd.read_parquet(path)
+        else:
+            df = pd.read_csv(path)
+        if isinstance(_model, USGSLocal) and _model.manifest is not None:
+            # warm the cache with the blocks of this file only, read tile by tile
+            n_blocks = _model.prefetch(
+                df[options["lat_col"]].to_numpy(dtype=np.float64),
+                df[options["lon_col"]].to_numpy(dtype=np.float64),
+            )
+            log.debug(f"prefetched {n_blocks} raster blocks for {path}")
+        graded = gradeit(df, elevation_model=_model, result_cache=_result_cache, **options)
+        if columns is not None:
+            graded = graded[columns]
+
+        # write to a temporary file so that only complete outputs exist
+        tmp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.tmp")
+        graded.to_parquet(tmp_path)
+        os.replace(tmp_path, output_path)
+        result.n_points = len(graded)
+    except Exception:
+        result.error = traceback.format_exc()
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+parser = argparse.ArgumentParser(
+    prog="gradeit", description="Append elevation and road grade to trip files"
+)
+parser.add_argument(
+    "inputs", nargs="+", help="CSV or Parquet trip files, directories or glob patterns"
+)
+parser.add_argument(
+    "--output-dir", required=True, help="Directory to write the graded trips (Parquet) to"
+)
+parser.add_argument(
+    "--source",
+    default="usgs-api",
+    choices=["usgs-api", "usgs-local", "usgs-compiled", "usgs-tiered"],
+    help="Elevation data source",
+)
+parser.add_argument("--usgs-db-path", default=None, help="Path to the local USGS raster tiles")
+parser.add_argument("--lat-col", default="latitude", help="Name of the latitude column")
+parser.add_argument("--lon-col", default="longitude", help="Name of the longitude column")
+parser.add_argument("--filtering", action="store_true", help="Filter the elevation data")
+parser.add_argument("--des-sg", type=int, default=17, help="Savitzky-Golay filter window size")
+parser.add_argument("--bridge", action="store_true", help="Apply the bridge filter")
+parser.add_argument("--columns", default=None, help="Comma separated list of the columns to write")
+parser.add_argument(
+    "--overwrite", action="store_true", help="Regrade files that already have an output"
+)
+parser.add_argument(
+    "--manifest",
+    action="store_true",
+    help="Build the tile manifest up front and locate tiles through it (usgs-local only)",
+)
+parser.add_argument("--nprocs", type=int, default=4, help="Number of processes to use")
+parser.add_argument(
+    "--result-cache",
+    default=None,
+    help="Directory of a result cache; trips graded before with the same options are read back",
+)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parser.parse_args(argv)
+    if args.manifest and (args.source != "usgs-local" or args.usgs_db_path is None):
+        parser.error("--manifest requires --source usgs-local and --usgs-db-path")
+    logging.basicConfig(level=logging.INFO)
+
+    paths = find_trip_files(args.inputs)
+    if not paths:
+        log.error("no CSV or Parquet trip files found")
+        return 1
+    log.info(f"grading {len(paths)} trip files..")
+
+    start = time.perf_counter()
+    results = grade_files(
+        paths,
+        args.output_dir,
+        lat_col=args.lat_col,
+        lon_col=args.lon_col,
+        filtering=args.filtering,
+        source=args.source,
+        usgs_db_path=args.usgs_db_path,
+        des_sg=args.des_sg,
+        bridge_params=BridgeParams() if args.bridge else None,
+        columns=args.columns.split(",") if args.columns else None,
+        overwrite=args.overwrite,
+        use_manifest=args.manifest,
+        n_workers=args.nprocs,
+        result_cache_path=args.result_cache,
+    )
+    seconds = time.perf_counter() - start
+
+    graded = [r for r in results if r.ok and not r.skipped]
+    failed = [r for r in results if not r.ok]
+    skipped = [r for r in results if r.skipped]
+    n_points = sum(r.n_points for r in graded)
+    log.info(
+        f"graded {len(graded)} files ({n_points} points) in {seconds:.1f}s, "
+        f"{n_points / max(seconds, 1e-9):.0f} points/s; "
+        f"{len(skipped)} already done, {len(failed)} failed"
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
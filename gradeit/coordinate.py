@@ -1,7 +1,9 @@
 from __future__ import annotations
 from dataclasses import dataclass
+from typing import TYPE_CHECKING
 
-from shapely.geometry import Point
+if TYPE_CHECKING:
+    from shapely.geometry import Point
 
 
 @dataclass
@@ -13,6 +15,8 @@ class Coordinate:
         """
         Create a Coordinate from a latitude and longitude
         """
+        from shapely.geometry import Point
+
         return Coordinate(geometry=Point(longitude, latitude))
 
     @property
@@ -0,0 +1,100 @@
+import asyncio
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+from gradeit.elevation.elevation_model import ElevationModel
+from gradeit.instrumentation import NULL_METRICS, Metrics
+
+
+class AsyncElevationModel(metaclass=ABCMeta):
+    """
+    Abstract class for elevation lookup models that are awaited from an
+    asyncio event loop
+
+    A single instance is meant to be shared by every request served by the
+    event loop, so that they share its connections and caches. Use it as an
+    async context manager, or await close() when done with it.
+    """
+
+    metrics: Metrics = NULL_METRICS
+
+    @abstractmethod
+    async def get_elevation_array(self, latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+        """
+        Get elevation (in feet) for arrays of latitudes and longitudes
+        """
+        pass
+
+    async def close(self):
+        """
+        Release the connections and threads held by the model
+        """
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class AsyncExecutorModel(AsyncElevationModel):
+    """
+    Runs a blocking ElevationModel, e.g. USGSLocal or a
+    TieredElevationModel, on a thread pool so that raster reads and cache
+    lookups happen off the event loop.
+
+    The blocking models keep their caches behind locks, so one wrapped
+    model can serve any number of concurrent requests. Requests larger than
+    chunk_size points are looked up one chunk at a time, which keeps a few
+    long routes from holding every thread while short ones wait.
+
+    Parameters:
+        model: the blocking elevation model to run
+        max_workers: the number of threads of the pool the model creates
+            (and shuts down on close) when no executor is given
+        executor: an executor to run the lookups on instead
+        chunk_size: the largest number of points looked up in one call
+    """
+
+    def __init__(
+        self,
+        model: ElevationModel,
+        max_workers: Optional[int] = None,
+        executor: Optional[Executor] = None,
+        chunk_size: Optional[int] = 10_000,
+    ):
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        self.model = model
+        self.chunk_size = chunk_size
+        self._owns_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="gradeit-elevation"
+        )
+        self.metrics = model.metrics
+
+    async def get_elevation_array(self, latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        loop = asyncio.get_running_loop()
+
+        step = self.chunk_size or max(len(latitude), 1)
+        chunks = []
+        for start in range(0, len(latitude), step):
+            chunk = await loop.run_in_executor(
+                self.executor,
+                self.model.get_elevation_array,
+                latitude[start : start + step],
+                longitude[start : start + step],
+            )
+            chunks.append(np.asarray(chunk, dtype=np.float64))
+        if not chunks:
+            return np.empty(0, dtype=np.float64)
+        return np.concatenate(chunks)
+
+    async def close(self):
+        if self._owns_executor:
+            self.executor.shutdown(wait=False)
@@ -0,0 +1,139 @@
+import asyncio
+import json
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from gradeit.elevation.async_elevation_model import AsyncElevationModel
+from gradeit.elevation.usgs_api import (
+    URL,
+    RetryableQueryError,
+    TokenBucket,
+    build_query_url,
+    parse_elevation,
+)
+from gradeit.instrumentation import Metrics
+
+
+class AsyncUSGSApi(AsyncElevationModel):
+    """
+    The USGS API elevation model for asyncio services, see USGSApi. It
+    needs the optional aiohttp dependency (pip install "gradeit[async]").
+
+    All requests share one pooled aiohttp session, and at most
+    max_in_flight queries are sent at once across all of them; the request
+    timeout only starts once a query gets its turn, so a burst of routes
+    queues instead of timing out. Concurrent lookups of the same point share
+    one query. Queries are optionally rate limited and retried with
+    exponential backoff like USGSApi.
+
+    The session is bound to the event loop that first uses the model.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 32,
+        requests_per_second: Optional[float] = None,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        timeout: Optional[float] = 30.0,
+        url: str = URL,
+        metrics: Optional[Metrics] = None,
+    ):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.url = url
+        self.rate_limiter = (
+            TokenBucket(requests_per_second) if requests_per_second is not None else None
+        )
+        if metrics is not None:
+            self.metrics = metrics
+
+        self._session: Any = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pending: Dict[Tuple[float, float], "asyncio.Future[float]"] = {}
+
+    async def get_elevation_array(self, latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+        points = list(zip(np.asarray(latitude).tolist(), np.asarray(longitude).tolist()))
+        with self.metrics.timer("elevation.api"):
+            elevations = await asyncio.gather(*(self._lookup(lat, lon) for lat, lon in points))
+        self.metrics.count("elevation.api.points", len(points))
+        return np.array(elevations, dtype=np.float64)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _lookup(self, latitude: float, longitude: float) -> float:
+        key = (latitude, longitude)
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._query(latitude, longitude))
+            self._pending[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+        elif self.metrics.enabled:
+            self.metrics.count("api.coalesced")
+        # a cancelled request must not cancel the query for the others
+        return await asyncio.shield(future)
+
+    def _forget(self, key: Tuple[float, float], future: "asyncio.Future[float]"):
+        self._pending.pop(key, None)
+        if not future.cancelled():
+            # mark the error as retrieved in case every waiter was cancelled
+            future.exception()
+
+    async def _query(self, latitude: float, longitude: float) -> float:
+        import aiohttp
+
+        session, semaphore = self._connect()
+        query = build_query_url(latitude, longitude, self.url)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        attempt = 0
+        while True:
+            await self._acquire()
+            self.metrics.count("api.requests")
+            try:
+                async with semaphore:
+                    async with session.get(query, timeout=timeout) as response:
+                        if response.status >= 500:
+                            raise RetryableQueryError(
+                                "Error when querying USGS API: server returned "
+                                f"{response.status}"
+                            )
+                        text = await response.text()
+                try:
+                    result = json.loads(text)
+                except ValueError as e:
+                    raise RetryableQueryError(f"Error when querying USGS API: {text}") from e
+                return parse_elevation(result)
+            except (RetryableQueryError, aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= self.max_retries:
+                    self.metrics.count("api.errors")
+                    raise
+            self.metrics.count("api.retries")
+            await asyncio.sleep(self.backoff * 2**attempt)
+            attempt += 1
+
+    async def _acquire(self):
+        if self.rate_limiter is None:
+            return
+        wait = self.rate_limiter.try_acquire()
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self.rate_limiter.try_acquire()
+
+    def _connect(self) -> Tuple[Any, asyncio.Semaphore]:
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_in_flight)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        assert self._semaphore is not None
+        return self._session, self._semaphore
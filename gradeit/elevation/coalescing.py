@@ -0,0 +1,164 @@
+import queue
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from gradeit.coordinate import Coordinate
+from gradeit.elevation.elevation_model import ElevationModel
+from gradeit.instrumentation import Metrics
+from gradeit.trace import as_trace
+
+Lookup = Tuple[np.ndarray, np.ndarray, "Future[np.ndarray]"]
+
+
+@dataclass
+class CoalescingStats:
+    """
+    Counters describing how many lookups a CoalescingElevationModel merged
+    """
+
+    batches: int = 0
+    lookups: int = 0
+    points: int = 0
+    distinct_points: int = 0
+
+
+class CoalescingElevationModel(ElevationModel):
+    """
+    An elevation model that merges the lookups of concurrent callers, e.g.
+    the request threads of a server, into batches for a wrapped model.
+
+    Worker threads take every lookup waiting in the queue (up to
+    max_batch_points points), look up the distinct points of the batch
+    with one call to the wrapped model and hand each caller its part, so
+    traces that share tiles or blocks share the reads. Lookups that arrive
+    while a batch is running form the next batch; an idle model adds no
+    delay. If the batched call fails, each lookup of the batch is retried on
+    its own, so an error only reaches the callers whose points caused it.
+
+    Parameters:
+        model: the elevation model to look points up with; it must be safe
+            to call from several threads if n_workers is more than 1
+        n_workers: the number of batches looked up at once
+        max_batch_points: the number of points at which a batch is closed
+    """
+
+    def __init__(
+        self,
+        model: ElevationModel,
+        n_workers: int = 2,
+        max_batch_points: int = 1_000_000,
+        metrics: Optional[Metrics] = None,
+    ):
+        if n_workers < 1:
+            raise ValueError("n_workers must be at least 1")
+        self.model = model
+        self.max_batch_points = max_batch_points
+        self.stats = CoalescingStats()
+        self.metrics = metrics if metrics is not None else model.metrics
+
+        self._queue: "queue.Queue[Optional[Lookup]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._workers = [
+            threading.Thread(target=self._run, name="gradeit-coalescing", daemon=True)
+            for _ in range(n_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def source_id(self) -> Optional[str]:
+        return self.model.source_id
+
+    def get_elevation(self, trace: List[Coordinate]) -> List[float]:
+        points = as_trace(trace)
+        return self.get_elevation_array(points.latitude, points.longitude).tolist()
+
+    def get_elevation_array(self, latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        if len(latitude) == 0:
+            return np.empty(0, dtype=np.float64)
+        if self._closed:
+            raise RuntimeError("the coalescing elevation model is closed")
+
+        future: "Future[np.ndarray]" = Future()
+        self._queue.put((latitude, longitude, future))
+        return future.result()
+
+    def close(self):
+        """
+        Stop the worker threads once the queued lookups are done
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            n_points = len(first[0])
+            stop = False
+            while n_points < self.max_batch_points:
+                try:
+                    lookup = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if lookup is None:
+                    stop = True
+                    break
+                batch.append(lookup)
+                n_points += len(lookup[0])
+
+            self._lookup(batch)
+            if stop:
+                return
+
+    def _lookup(self, batch: List[Lookup]):
+        latitude = np.concatenate([lats for lats, _, _ in batch])
+        longitude = np.concatenate([lons for _, lons, _ in batch])
+        points = np.stack([latitude, longitude], axis=1)
+        distinct, inverse = np.unique(points, axis=0, return_inverse=True)
+
+        try:
+            with self.metrics.timer("coalescing.batch"):
+                found = self.model.get_elevation_array(distinct[:, 0], distinct[:, 1])
+            elevation = np.asarray(found, dtype=np.float64)[inverse.reshape(-1)]
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][2].set_exception(e)
+                return
+            # one bad lookup must not fail the others merged into its batch
+            self.metrics.count("coalescing.batch_errors")
+            for lookup in batch:
+                self._lookup([lookup])
+            return
+        except BaseException as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        with self._lock:
+            self.stats.batches += 1
+            self.stats.lookups += len(batch)
+            self.stats.points += len(points)
+            self.stats.distinct_points += len(distinct)
+        if self.metrics.enabled:
+            self.metrics.count("coalescing.lookups", len(batch))
+            self.metrics.count("coalescing.points", len(points))
+            self.metrics.count("coalescing.distinct_points", len(distinct))
+
+        ends = np.cumsum([len(lats) for lats, _, _ in batch])
+        for (_, _, future), part in zip(batch, np.split(elevation, ends[:-1])):
+            future.set_result(part)
@@ -0,0 +1,310 @@
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Callable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from gradeit.coordinate import Coordinate
+from gradeit.elevation.elevation_model import ElevationModel
+from gradeit.instrumentation import Metrics
+from gradeit.trace import as_trace
+
+# the 1/3 arc-second DEM has 10800 pixels per degree
+PIXELS_PER_DEGREE = 10800
+DEFAULT_TOUCH_INTERVAL_S = 3600.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS elevation (
+    lat_q INTEGER NOT NULL,
+    lon_q INTEGER NOT NULL,
+    elevation_ft REAL NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (lat_q, lon_q)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS elevation_accessed ON elevation (accessed);
+"""
+
+
+def quantize(
+    latitude, longitude, pixels_per_degree: int = PIXELS_PER_DEGREE
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Snap latitudes and longitudes to the integer index of the DEM pixel
+    that contains them
+
+    Returns:
+        a tuple of int64 arrays (lat_q, lon_q)
+    """
+    lat_q = np.floor(np.asarray(latitude, dtype=np.float64) * pixels_per_degree)
+    lon_q = np.floor(np.asarray(longitude, dtype=np.float64) * pixels_per_degree)
+    return lat_q.astype(np.int64), lon_q.astype(np.int64)
+
+
+class ElevationCache:
+    """
+    A persistent elevation cache stored in a SQLite database and keyed by
+    latitude and longitude snapped to the DEM pixel grid.
+
+    The database is opened in write-ahead-log mode so that several worker
+    processes can read and write the same cache file concurrently. When
+    max_entries is set, the least recently used entries are evicted once
+    the cache grows past it.
+
+    A read only records the access time of entries that were last accessed
+    more than touch_interval_s ago, so that reads of recently used entries
+    do not take the database write lock. Least recently used is therefore
+    only accurate to touch_interval_s. clock returns the current time in
+    seconds, time.time by default.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        max_entries: Optional[int] = None,
+        pixels_per_degree: int = PIXELS_PER_DEGREE,
+        timeout: float = 30.0,
+        touch_interval_s: float = DEFAULT_TOUCH_INTERVAL_S,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.pixels_per_degree = pixels_per_degree
+        self.timeout = timeout
+        self.touch_interval_s = touch_interval_s
+        self.clock = clock
+
+        self._lock = Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM elevation").fetchone()[0]
+
+    def get_many(self, latitude, longitude) -> np.ndarray:
+        """
+        Look up the cached elevation (in feet) of each point
+
+        Returns:
+            a float64 array with nan for every point that is not cached
+        """
+        lat_q, lon_q = quantize(latitude, longitude, self.pixels_per_degree)
+        elevation = np.full(len(lat_q), np.nan, dtype=np.float64)
+        if len(lat_q) == 0:
+            return elevation
+
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                self._load_query(conn, lat_q, lon_q)
+                rows = conn.execute(
+                    "SELECT q.idx, e.elevation_ft, e.accessed FROM temp.query q "
+                    "JOIN elevation e ON e.lat_q = q.lat_q AND e.lon_q = q.lon_q"
+                ).fetchall()
+                now = self.clock()
+                stale = now - self.touch_interval_s
+                if any(accessed < stale for _, _, accessed in rows):
+                    conn.execute(
+                        "UPDATE elevation SET accessed = ? WHERE accessed < ? "
+                        "AND (lat_q, lon_q) IN (SELECT lat_q, lon_q FROM temp.query)",
+                        (now, stale),
+                    )
+
+        if rows:
+            idx, values, _ = zip(*rows)
+            elevation[list(idx)] = values
+        return elevation
+
+    def put_many(self, latitude, longitude, elevation_ft):
+        """
+        Store the elevation (in feet) of each point; nan values are skipped
+        """
+        lat_q, lon_q = quantize(latitude, longitude, self.pixels_per_degree)
+        elevation_ft = np.asarray(elevation_ft, dtype=np.float64)
+        keep = np.isfinite(elevation_ft)
+        if not keep.any():
+            return
+
+        now = self.clock()
+        rows = zip(lat_q[keep].tolist(), lon_q[keep].tolist(), elevation_ft[keep].tolist())
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO elevation VALUES (?, ?, ?, ?)",
+                    ((lat, lon, elev, now) for lat, lon, elev in rows),
+                )
+                self._evict(conn)
+
+    def clear(self):
+        """
+        Remove all cached entries
+        """
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM elevation")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # a connection must never be shared with a forked worker process
+        if self._conn is None or self._pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=self.timeout, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            conn.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS query "
+                "(idx INTEGER PRIMARY KEY, lat_q INTEGER, lon_q INTEGER)"
+            )
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _load_query(self, conn: sqlite3.Connection, lat_q: np.ndarray, lon_q: np.ndarray):
+        conn.execute("DELETE FROM temp.query")
+        conn.executemany(
+            "INSERT INTO temp.query VALUES (?, ?, ?)",
+            zip(range(len(lat_q)), lat_q.tolist(), lon_q.tolist()),
+        )
+
+    def _evict(self, conn: sqlite3.Connection):
+        if self.max_entries is None:
+            return
+        count = conn.execute("SELECT COUNT(*) FROM elevation").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM elevation WHERE (lat_q, lon_q) IN "
+                "(SELECT lat_q, lon_q FROM elevation ORDER BY accessed LIMIT ?)",
+                (excess,),
+            )
+
+
+class MemoryElevationCache:
+    """
+    An in-memory elevation cache with the same interface as ElevationCache,
+    keyed by latitude and longitude snapped to the DEM pixel grid. The least
+    recently used entries are evicted once it holds max_entries.
+
+    The cache is safe to share between threads.
+    """
+
+    def __init__(self, max_entries: int = 1_000_000, pixels_per_degree: int = PIXELS_PER_DEGREE):
+        self.max_entries = max_entries
+        self.pixels_per_degree = pixels_per_degree
+
+        self._lock = Lock()
+        self._entries: "OrderedDict[Tuple[int, int], float]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_many(self, latitude, longitude) -> np.ndarray:
+        """
+        Look up the cached elevation (in feet) of each point
+
+        Returns:
+            a float64 array with nan for every point that is not cached
+        """
+        lat_q, lon_q = quantize(latitude, longitude, self.pixels_per_degree)
+        elevation = np.full(len(lat_q), np.nan, dtype=np.float64)
+
+        with self._lock:
+            for i, key in enumerate(zip(lat_q.tolist(), lon_q.tolist())):
+                value = self._entries.get(key)
+                if value is not None:
+                    self._entries.move_to_end(key)
+                    elevation[i] = value
+        return elevation
+
+    def put_many(self, latitude, longitude, elevation_ft):
+        """
+        Store the elevation (in feet) of each point; nan values are skipped
+        """
+        lat_q, lon_q = quantize(latitude, longitude, self.pixels_per_degree)
+        elevation_ft = np.asarray(elevation_ft, dtype=np.float64)
+        keep = np.isfinite(elevation_ft)
+
+        with self._lock:
+            for key_lat, key_lon, elev in zip(
+                lat_q[keep].tolist(), lon_q[keep].tolist(), elevation_ft[keep].tolist()
+            ):
+                self._entries[(key_lat, key_lon)] = elev
+                self._entries.move_to_end((key_lat, key_lon))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all cached entries
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+def default_cache_path() -> Path:
+    """
+    Return the default location of the persistent elevation cache,
+    $XDG_CACHE_HOME/gradeit/elevation.sqlite (~/.cache by default)
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "gradeit" / "elevation.sqlite"
+
+
+class CachedElevationModel(ElevationModel):
+    """
+    Wrap any ElevationModel with an ElevationCache so that only points
+    that are not already cached are looked up with the wrapped model.
+    Points that share a DEM pixel are looked up once.
+    """
+
+    def __init__(
+        self, model: ElevationModel, cache: ElevationCache, metrics: Optional[Metrics] = None
+    ):
+        self.model = model
+        self.cache = cache
+        if metrics is not None:
+            self.metrics = metrics
+
+    @property
+    def source_id(self) -> Optional[str]:
+        return self.model.source_id
+
+    def get_elevation(self, trace: List[Coordinate]) -> List[float]:
+        points = as_trace(trace)
+        return self.get_elevation_array(points.latitude, points.longitude).tolist()
+
+    def get_elevation_array(self, latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+
+        with self.metrics.timer("cache.get"):
+            elevation = self.cache.get_many(latitude, longitude)
+        miss = np.flatnonzero(np.isnan(elevation))
+        self.metrics.count("cache.hits", len(elevation) - len(miss))
+        self.metrics.count("cache.misses", len(miss))
+        if len(miss) == 0:
+            return elevation
+
+        # look up one representative point per missing pixel
+        lat_q, lon_q = quantize(latitude[miss], longitude[miss], self.cache.pixels_per_degree)
+        keys = np.stack([lat_q, lon_q], axis=1)
+        _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        query = miss[first]
+
+        fetched = self.model.get_elevation_array(latitude[query], longitude[query])
+        self.cache.put_many(latitude[query], longitude[query], fetched)
+        elevation[miss] = np.asarray(fetched, dtype=np.float64)[inverse.reshape(-1)]
+
+        return elevation
@@ -1,18 +1,45 @@
 from abc import ABCMeta, abstractmethod
-from typing import List
+from typing import List, Optional
 
+import numpy as np
 
 from gradeit.coordinate import Coordinate
+from gradeit.instrumentation import NULL_METRICS, Metrics
+from gradeit.trace import Trace
 
 
 class ElevationModel(metaclass=ABCMeta):
     """
     Abstract class for elevation lookup models
+
+    Implementations report their timings and counters to the metrics
+    attribute, which ignores everything unless a Metrics object is given.
     """
 
+    metrics: Metrics = NULL_METRICS
+
+    @property
+    def source_id(self) -> Optional[str]:
+        """
+        Identifies the elevation data the model returns, e.g. the API url or
+        the version of the tiles, so that results computed with the model
+        can be cached; None if its results cannot be cached
+        """
+        return None
+
     @abstractmethod
     def get_elevation(self, trace: List[Coordinate]) -> List[float]:
         """
         Get elevation (in feet) for a list of points in a trace
         """
         pass
+
+    def get_elevation_array(self, latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+        """
+        Get elevation (in feet) for arrays of latitudes and longitudes.
+
+        Models that can work on arrays directly should override this; the
+        default implementation falls back to get_elevation.
+        """
+        trace = Trace.from_lat_lon(latitude, longitude)
+        return np.asarray(self.get_elevation(trace.to_coordinates()), dtype=np.float64)
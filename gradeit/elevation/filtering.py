@@ -1,15 +1,21 @@
-from typing import List
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional, Tuple
 
 import numpy as np
-from scipy import signal
+from numpy.lib.stride_tricks import sliding_window_view
+from numpy.typing import ArrayLike
 
-from gradeit.coordinate import Coordinate
 from gradeit.grade import get_distances
+from gradeit.trace import TraceLike
 
 
 def elevation_filter(
-    elevation_profile=List[float], coordinates=List[Coordinate], sg_window: int = 17
-) -> List[float]:
+    elevation_profile: ArrayLike,
+    coordinates: TraceLike,
+    sg_window: int = 17,
+    distances: Optional[ArrayLike] = None,
+) -> np.ndarray:
     """
     This implementation applies the SG filter in the temporal domain
     as opposed to the spatial domain. Filtering spatially requires
@@ -18,18 +24,26 @@ def elevation_filter(
 
     Parameters:
         elevation_profile: a list of elevation values
-        coordinates: a list of Coordinate objects
+        coordinates: a Trace or a list of Coordinate objects
         sg_window: the Savitzky-Golay filter window size
+        distances: the distances between each coordinate pair, if already
+            computed with get_distances
 
     Returns:
-        a list of filtered elevation values
+        an array of filtered elevation values
     """
 
-    distances = get_distances(coordinates)
+    if distances is None:
+        distances = get_distances(coordinates)
     cuml_dist = list(np.append(0, np.cumsum(distances)))
 
     # note: run final check on user SG value, provide default value if necessary
     sg_window = check_sg(sg_window, cuml_dist)
+    if sg_window <= 3:
+        # too few points to fit the polynomial
+        return np.asarray(elevation_profile, dtype=np.float64)
+
+    from scipy import signal
 
     # run SavGol filter
     elev_linear_sg = signal.savgol_filter(elevation_profile, window_length=sg_window, polyorder=3)
@@ -38,31 +52,250 @@ def elevation_filter(
 
 
 def check_sg(sg_window: int, cumlDist: List[float]) -> int:
+    return int(check_sg_segments(sg_window, np.array([cumlDist[-1]]), np.array([len(cumlDist)]))[0])
+
+
+def check_sg_segments(sg_window: int, lengths_ft: ArrayLike, n_points: ArrayLike) -> np.ndarray:
+    """
+    The check_sg window of each of a number of segments, given the distance
+    each one spans and its number of points
+    """
+    lengths_ft = np.asarray(lengths_ft, dtype=np.float64)
+    n_points = np.asarray(n_points, dtype=np.int64)
+
     # compute the default value of SG window.
-    avg_spd = cumlDist[-1] / len(cumlDist)  # vehicle avg speed in ft/s
-    filter_width = 2500  # in [ft], width of the spike to be filtered (tentative)
-    filter_factor = 5
-    polyorder = 3  # fixed value, do not change!
-    df_filter = round(
-        filter_width / avg_spd * filter_factor
-    )  # (estimated formula, change filter_width and filter_factor to get desired effect)
-    if df_filter < polyorder:
-        df_filter = polyorder + 2
-    elif df_filter > len(cumlDist):
-        df_filter = int(round(len(cumlDist) * 0.75))  # safeguard against crossing sg array size
-    sg_default = df_filter
-    if sg_default % 2 == 0:
-        sg_default += 1  # if even, transform to odd
+    with np.errstate(divide="ignore"):
+        avg_spd = lengths_ft / n_points  # vehicle avg speed in ft/s
+        filter_width = 2500  # in [ft], width of the spike to be filtered (tentative)
+        filter_factor = 5
+        polyorder = 3  # fixed value, do not change!
+        # (estimated formula, change filter_width and filter_factor to get desired effect)
+        df_filter = np.round(filter_width / avg_spd * filter_factor)
+    # a stationary segment gets the widest window
+    sg_default = np.where(
+        df_filter < polyorder,
+        polyorder + 2,
+        # safeguard against crossing sg array size
+        np.where(df_filter > n_points, np.round(n_points * 0.75), df_filter),
+    ).astype(np.int64)
+    sg_default += sg_default % 2 == 0  # if even, transform to odd
 
     # user inputs 0 to access the default value (see basic.py)
     if sg_window == 0:
-        return sg_default
+        windows = sg_default
     else:
         # checks the validility of the user defined window
         if sg_window % 2 == 0:
             sg_window += 1
-        if (sg_window > len(cumlDist)) or (
-            sg_window < 3
-        ):  # sg_window must be greater than polyorder = 3 and less than df size
-            sg_window = sg_default
-        return sg_window
+        # sg_window must be greater than polyorder = 3 and less than df size
+        windows = np.where((sg_window > n_points) | (sg_window <= polyorder), sg_default, sg_window)
+    # no window may be wider than its segment, including the default that was
+    # rounded up to odd: use the largest odd window that fits. A segment too
+    # short for a window wider than polyorder is left unfiltered.
+    return np.minimum(windows, n_points - (n_points % 2 == 0)).astype(np.int64)
+
+
+DEFAULT_MAX_GAP_FT = 1000.0
+DEFAULT_MAX_GAP_S = 30.0
+
+
+@dataclass
+class SegmentParams:
+    """
+    Parameters of the segment-aware elevation filter
+
+    Attributes:
+        max_gap_ft: split the trace where consecutive points are further
+            apart than this (in feet), e.g. across a tunnel; None disables
+        max_gap_s: split the trace where consecutive points are further
+            apart than this (in seconds); needs time_col
+        time_col: the column with the time of each point, either datetimes
+            or seconds, by default None
+    """
+
+    max_gap_ft: Optional[float] = DEFAULT_MAX_GAP_FT
+    max_gap_s: Optional[float] = DEFAULT_MAX_GAP_S
+    time_col: Optional[str] = None
+
+
+def find_segments(
+    elevation_profile: ArrayLike,
+    distances: ArrayLike,
+    timestamps: Optional[ArrayLike] = None,
+    max_gap_ft: Optional[float] = DEFAULT_MAX_GAP_FT,
+    max_gap_s: Optional[float] = DEFAULT_MAX_GAP_S,
+    trace_starts: Optional[ArrayLike] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Split a trace into runs of points with a finite elevation and no
+    distance or time gap between consecutive points
+
+    Parameters:
+        elevation_profile: the elevation of each point
+        distances: the n - 1 distances between the points
+        timestamps: the time (in seconds) of each point, if known
+        max_gap_ft: the largest distance between the points of a segment
+        max_gap_s: the largest time between the points of a segment
+        trace_starts: the positions where a new trace starts, when several
+            traces are concatenated
+
+    Returns:
+        the start and stop positions of the segments
+    """
+    elevation = np.asarray(elevation_profile, dtype=np.float64)
+    n = len(elevation)
+    if n == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    # breaks[i] marks that point i does not continue the segment of i - 1
+    breaks = np.zeros(n, dtype=bool)
+    breaks[0] = True
+    if max_gap_ft is not None:
+        breaks[1:] |= np.asarray(distances, dtype=np.float64) > max_gap_ft
+    if timestamps is not None and max_gap_s is not None:
+        breaks[1:] |= np.diff(np.asarray(timestamps, dtype=np.float64)) > max_gap_s
+    if trace_starts is not None:
+        breaks[np.asarray(trace_starts, dtype=np.int64)] = True
+
+    finite = np.isfinite(elevation)
+    breaks[1:] |= ~finite[:-1]
+    starts = np.flatnonzero(finite & breaks)
+    ends = np.append(breaks[1:], True) | np.append(~finite[1:], True)
+    stops = np.flatnonzero(finite & ends) + 1
+    return starts, stops
+
+
+def savgol_segments(
+    values: ArrayLike,
+    starts: ArrayLike,
+    stops: ArrayLike,
+    windows: ArrayLike,
+    polyorder: int = 3,
+) -> np.ndarray:
+    """
+    Apply a Savitzky-Golay filter to each segment values[start:stop] on its
+    own, with the edges handled like savgol_filter's "interp" mode
+
+    All the segments that share a window length are filtered together, so
+    the work is vectorized over segments and only loops over the distinct
+    window lengths: the interior points are either convolved in one pass
+    or, when they are sparse, gathered window by window. Segments with fewer
+    than polyorder + 2 points, which a polynomial of the filter's order fits
+    exactly, and values outside of the segments are returned unchanged.
+
+    Parameters:
+        values: the signal to filter
+        starts, stops: the bounds of the segments
+        windows: the (odd) window length of each segment, at most its length
+        polyorder: the order of the fitted polynomials
+
+    Returns:
+        the filtered signal
+    """
+    values = np.asarray(values, dtype=np.float64)
+    starts = np.asarray(starts, dtype=np.int64)
+    stops = np.asarray(stops, dtype=np.int64)
+    windows = np.asarray(windows, dtype=np.int64)
+    filtered = values.copy()
+
+    long_enough = stops - starts >= polyorder + 2
+    for window in np.unique(windows[long_enough]).tolist():
+        selected = long_enough & (windows == window)
+        seg_starts, seg_stops = starts[selected], stops[selected]
+        half = window // 2
+        views = sliding_window_view(values, window)
+        center, head, tail = _savgol_coefficients(window, polyorder)
+
+        # points at least half a window from both segment edges
+        counts = seg_stops - seg_starts - 2 * half
+        first = np.repeat(seg_starts, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        interior = first + offsets + half
+        span_start, span_stop = seg_starts.min(), seg_stops.max()
+        if len(interior) * window > 16 * (span_stop - span_start):
+            # most of the span is interior: convolve it in one pass, the
+            # nan outside of the segments never reaches an interior point
+            from scipy import signal
+
+            span = values[span_start:span_stop]
+            smoothed = signal.convolve(np.where(np.isfinite(span), span, 0), center[::-1], "valid")
+            filtered[interior] = smoothed[interior - half - span_start]
+        else:
+            # bound the memory of the gathered windows
+            step = max(1, 2**22 // window)
+            for i in range(0, len(interior), step):
+                points = interior[i : i + step]
+                filtered[points] = views[points - half] @ center
+
+        # evaluate the polynomial fitted to the first and last window
+        ramp = np.arange(half)
+        filtered[seg_starts[:, None] + ramp] = views[seg_starts] @ head.T
+        filtered[(seg_stops - half)[:, None] + ramp] = views[seg_stops - window] @ tail.T
+
+    return filtered
+
+
+@lru_cache(maxsize=None)
+def _savgol_coefficients(window: int, polyorder: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    from scipy import signal
+
+    half = window // 2
+    center = signal.savgol_coeffs(window, polyorder, use="dot")
+    head = np.stack(
+        [signal.savgol_coeffs(window, polyorder, pos=pos, use="dot") for pos in range(half)]
+    )
+    tail = np.stack(
+        [
+            signal.savgol_coeffs(window, polyorder, pos=pos, use="dot")
+            for pos in range(window - half, window)
+        ]
+    )
+    return center, head, tail
+
+
+def segmented_elevation_filter(
+    elevation_profile: ArrayLike,
+    coordinates: TraceLike,
+    sg_window: int = 17,
+    distances: Optional[ArrayLike] = None,
+    timestamps: Optional[ArrayLike] = None,
+    max_gap_ft: Optional[float] = DEFAULT_MAX_GAP_FT,
+    max_gap_s: Optional[float] = DEFAULT_MAX_GAP_S,
+    trace_starts: Optional[ArrayLike] = None,
+) -> np.ndarray:
+    """
+    elevation_filter for traces with gaps: the trace is split at distance
+    and time gaps and at missing (nan) elevation, and every segment is
+    filtered on its own with the window check_sg picks for it, so gaps
+    neither smear nan nor bend the profile at their edges. Missing elevation
+    stays nan.
+
+    Several traces can be filtered in one call by concatenating them and
+    passing the positions where each one starts as trace_starts.
+
+    Parameters:
+        elevation_profile: a list of elevation values
+        coordinates: a Trace or a list of Coordinate objects
+        sg_window: the Savitzky-Golay filter window size, 0 for the default
+            window of each segment
+        distances: the distances between each coordinate pair, if already
+            computed with get_distances
+        timestamps: the time (in seconds) of each point, if known
+        max_gap_ft, max_gap_s: split the trace where consecutive points are
+            further apart than this, see SegmentParams
+        trace_starts: the positions where a new trace starts
+
+    Returns:
+        an array of filtered elevation values
+    """
+    if distances is None:
+        distances = get_distances(coordinates)
+    distances = np.asarray(distances, dtype=np.float64)
+
+    starts, stops = find_segments(
+        elevation_profile, distances, timestamps, max_gap_ft, max_gap_s, trace_starts
+    )
+    cuml_dist = np.append(0, np.cumsum(np.where(np.isfinite(distances), distances, 0)))
+    windows = check_sg_segments(sg_window, cuml_dist[stops - 1] - cuml_dist[starts], stops - starts)
+
+    return savgol_segments(elevation_profile, starts, stops, windows)
@@ -0,0 +1,303 @@
+import hashlib
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from threading import get_ident
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from gradeit.elevation.raster_cache import import_rasterio
+from gradeit.elevation.usgs_local import build_grid_keys, grid_ref_from_key
+
+log = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".gradeit_manifest.json"
+MANIFEST_VERSION = 1
+TILE_SUFFIXES = (".tif", ".tiff")
+
+
+@dataclass
+class TileInfo:
+    """
+    The metadata of one raster tile in a manifest. The path is relative to
+    the root of the raster database and the transform is the affine
+    (a, b, c, d, e, f) geotransform of the tile.
+    """
+
+    path: str
+    width: int
+    height: int
+    dtype: str
+    transform: List[float]
+    block_shape: List[int]
+    nodata: Optional[float] = None
+    crs: Optional[str] = None
+    size: int = 0
+    mtime_ns: int = 0
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        """
+        Return the (west, south, east, north) bounds of the tile
+        """
+        a, _, c, _, e, f = self.transform[:6]
+        west, east = sorted((c, c + a * self.width))
+        south, north = sorted((f, f + e * self.height))
+        return west, south, east, north
+
+
+@dataclass
+class Coverage:
+    """
+    The result of a pre-flight coverage check
+
+    Attributes:
+        tiles: the tiles that the points fall in
+        uncovered: the positions of the points that no tile covers
+        missing_grid_refs: the n##w### grid references of the USGS tiles
+            that would cover the uncovered points
+    """
+
+    tiles: List[TileInfo] = field(default_factory=list)
+    uncovered: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+    missing_grid_refs: List[str] = field(default_factory=list)
+
+    @property
+    def complete(self) -> bool:
+        return len(self.uncovered) == 0
+
+
+class TileManifest:
+    """
+    An index of the raster tiles under a raster database directory.
+
+    The manifest records the bounds, transform, dtype and block layout of
+    every GeoTIFF under the root, whatever its name or extent, and locates
+    the tile of many points at once through an index of the integer degree
+    cells each tile overlaps. Use TileManifest.load to build it once and
+    keep it next to the tiles.
+    """
+
+    def __init__(self, root: Union[str, Path], tiles: List[TileInfo]):
+        self.root = Path(root)
+        self.tiles = tiles
+        self._build_index()
+
+    @classmethod
+    def build(cls, root: Union[str, Path]) -> "TileManifest":
+        """
+        Build a manifest by reading the header of every tile under root
+        """
+        return cls(root, [_read_tile_info(Path(root), path) for path in _find_tiles(Path(root))])
+
+    @classmethod
+    def load(
+        cls, root: Union[str, Path], manifest_path: Optional[Union[str, Path]] = None
+    ) -> "TileManifest":
+        """
+        Load the manifest cached at manifest_path (by default a hidden file
+        in root), re-reading only the tiles that were added or changed since
+        it was written, and save it back if anything changed.
+        """
+        root = Path(root)
+        manifest_path = Path(manifest_path) if manifest_path is not None else root / MANIFEST_NAME
+
+        cached: Dict[str, TileInfo] = {}
+        if manifest_path.exists():
+            try:
+                with manifest_path.open("r") as f:
+                    contents = json.load(f)
+                if contents.get("version") == MANIFEST_VERSION:
+                    cached = {tile["path"]: TileInfo(**tile) for tile in contents["tiles"]}
+            except (ValueError, KeyError, TypeError):
+                log.warning(f"ignoring unreadable tile manifest {manifest_path}")
+
+        tiles = []
+        changed = False
+        for path in _find_tiles(root):
+            rel_path = path.relative_to(root).as_posix()
+            stat = path.stat()
+            tile = cached.pop(rel_path, None)
+            if tile is None or tile.size != stat.st_size or tile.mtime_ns != stat.st_mtime_ns:
+                tile = _read_tile_info(root, path)
+                changed = True
+            tiles.append(tile)
+        changed = changed or len(cached) > 0
+
+        manifest = cls(root, tiles)
+        if changed or not manifest_path.exists():
+            manifest.save(manifest_path)
+        return manifest
+
+    def save(self, manifest_path: Optional[Union[str, Path]] = None):
+        """
+        Write the manifest as JSON, by default to a hidden file in the root.
+        The file is replaced in one step, so concurrent loads never read a
+        partly written manifest.
+        """
+        manifest_path = (
+            Path(manifest_path) if manifest_path is not None else self.root / MANIFEST_NAME
+        )
+        tmp_path = manifest_path.with_name(f".{manifest_path.name}.{os.getpid()}.{get_ident()}.tmp")
+        try:
+            with tmp_path.open("w") as f:
+                json.dump(
+                    {"version": MANIFEST_VERSION, "tiles": [asdict(t) for t in self.tiles]}, f
+                )
+            os.replace(tmp_path, manifest_path)
+        except OSError as e:
+            log.warning(f"unable to save the tile manifest to {manifest_path}: {e}")
+            tmp_path.unlink(missing_ok=True)
+
+    @property
+    def version(self) -> str:
+        """
+        A digest of the path, size and modification time of every tile,
+        which changes whenever a tile is added, removed or replaced
+        """
+        return _files_digest((tile.path, tile.size, tile.mtime_ns) for tile in self.tiles)
+
+    def tile_path(self, tile: TileInfo) -> Path:
+        return self.root / tile.path
+
+    def locate(self, lats, lons) -> np.ndarray:
+        """
+        Find the tile of each point
+
+        Returns:
+            a numpy int64 array of positions in self.tiles, -1 for points
+            that no tile covers
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        found = np.full(len(lats), -1, dtype=np.int64)
+        if len(self._cells) == 0 or len(lats) == 0:
+            return found
+
+        finite = np.isfinite(lats) & np.isfinite(lons)
+        keys = np.where(finite, _cell_keys(np.nan_to_num(lats), np.nan_to_num(lons)), -1)
+        pos = np.minimum(np.searchsorted(self._cells, keys), len(self._cells) - 1)
+        in_index = finite & (self._cells[pos] == keys)
+
+        # try the candidates of each cell in order until one contains the point
+        for k in range(self._candidates.shape[1]):
+            todo = np.flatnonzero(in_index & (found < 0))
+            if len(todo) == 0:
+                break
+            tile = self._candidates[pos[todo], k]
+            bounds = self._bounds[np.maximum(tile, 0)]
+            inside = (
+                (tile >= 0)
+                & (lons[todo] >= bounds[:, 0])
+                & (lats[todo] >= bounds[:, 1])
+                & (lons[todo] < bounds[:, 2])
+                & (lats[todo] < bounds[:, 3])
+            )
+            found[todo[inside]] = tile[inside]
+
+        return found
+
+    def group(self, lats, lons) -> Iterator[Tuple[Optional[TileInfo], np.ndarray]]:
+        """
+        Group points by tile, yielding (tile, positions) pairs in query
+        order; points that no tile covers are yielded with a tile of None
+        """
+        found = self.locate(lats, lons)
+        unique_tiles, inverse = np.unique(found, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.cumsum(np.bincount(inverse, minlength=len(unique_tiles)))
+        for tile, idx in zip(unique_tiles, np.split(order, bounds[:-1])):
+            yield (self.tiles[tile] if tile >= 0 else None), idx
+
+    def coverage(self, lats, lons) -> Coverage:
+        """
+        Check which tiles a set of points needs before reading any of them
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        found = self.locate(lats, lons)
+
+        uncovered = np.flatnonzero(found < 0)
+        located = uncovered[np.isfinite(lats[uncovered]) & np.isfinite(lons[uncovered])]
+        missing_keys = np.unique(build_grid_keys(lats[located], lons[located]))
+        return Coverage(
+            tiles=[self.tiles[i] for i in np.unique(found[found >= 0])],
+            uncovered=uncovered,
+            missing_grid_refs=[grid_ref_from_key(key) for key in missing_keys if key >= 0],
+        )
+
+    def _build_index(self) -> None:
+        self._bounds = np.array([t.bounds for t in self.tiles], dtype=np.float64).reshape(-1, 4)
+
+        # register each tile with every integer degree cell it overlaps,
+        # ordered so that the tile covering most of the cell is tried first
+        cells: Dict[int, List[Tuple[float, int]]] = {}
+        for i, (west, south, east, north) in enumerate(self._bounds):
+            for lat in range(int(np.floor(south)), int(np.ceil(north))):
+                for lon in range(int(np.floor(west)), int(np.ceil(east))):
+                    overlap = (min(east, lon + 1) - max(west, lon)) * (
+                        min(north, lat + 1) - max(south, lat)
+                    )
+                    if overlap > 0:
+                        key = int(_cell_keys(lat, lon))
+                        cells.setdefault(key, []).append((-overlap, i))
+
+        self._cells = np.array(sorted(cells), dtype=np.int64)
+        width = max((len(c) for c in cells.values()), default=0)
+        self._candidates = np.full((len(self._cells), width), -1, dtype=np.int64)
+        for row, key in enumerate(self._cells):
+            ranked = [i for _, i in sorted(cells[int(key)])]
+            self._candidates[row, : len(ranked)] = ranked
+
+
+def _cell_keys(lats, lons):
+    # a unique non-negative key for each integer degree cell on the globe
+    return (np.floor(lats).astype(np.int64) + 90) * 360 + (np.floor(lons).astype(np.int64) + 180)
+
+
+def files_version(root: Union[str, Path], suffixes: Sequence[str]) -> str:
+    """
+    A digest of the relative path, size and modification time of every file
+    under root with one of the (lower case) suffixes, like
+    TileManifest.version but without reading any file
+    """
+    root = Path(root)
+    entries = []
+    for path in root.rglob("*"):
+        if path.suffix.lower() in suffixes:
+            stat = path.stat()
+            entries.append((path.relative_to(root).as_posix(), stat.st_size, stat.st_mtime_ns))
+    return _files_digest(entries)
+
+
+def _files_digest(entries: Iterable[Tuple[str, int, int]]) -> str:
+    digest = hashlib.sha256()
+    for path, size, mtime_ns in sorted(entries):
+        digest.update(f"{path}\0{size}\0{mtime_ns}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+def _find_tiles(root: Path) -> List[Path]:
+    return sorted(p for p in root.rglob("*") if p.suffix.lower() in TILE_SUFFIXES)
+
+
+def _read_tile_info(root: Path, path: Path) -> TileInfo:
+    rio = import_rasterio()
+
+    stat = path.stat()
+    with rio.open(path) as src:
+        return TileInfo(
+            path=path.relative_to(root).as_posix(),
+            width=src.width,
+            height=src.height,
+            dtype=src.dtypes[0],
+            transform=list(src.transform)[:6],
+            block_shape=list(src.block_shapes[0]),
+            nodata=src.nodata,
+            crs=src.crs.to_string() if src.crs is not None else None,
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+        )
@@ -0,0 +1,238 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Future
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock, RLock
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import rasterio as rio
+
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_DATASETS = 32
+
+
+def import_rasterio() -> Any:
+    """
+    Import rasterio, which reads the local USGS raster tiles. It brings in
+    GDAL, so it is only installed with the local extra.
+    """
+    try:
+        import rasterio
+        import rasterio.windows  # noqa: F401
+    except ModuleNotFoundError as e:
+        if e.name != "rasterio":
+            raise
+        raise ImportError(
+            "reading local USGS raster tiles requires rasterio, "
+            "install it with: pip install 'gradeit[local]'"
+        ) from e
+    return rasterio
+
+
+@dataclass
+class CacheStats:
+    """
+    Counters describing how well a RasterCache is being reused
+    """
+
+    dataset_hits: int = 0
+    dataset_misses: int = 0
+    dataset_evictions: int = 0
+    block_hits: int = 0
+    block_misses: int = 0
+    block_evictions: int = 0
+    block_coalesced: int = 0
+    bytes_read: int = 0
+
+
+@dataclass
+class _DatasetEntry:
+    dataset: "rio.DatasetReader"
+    # held while reading from the dataset
+    lock: Lock
+    # the number of leases, the dataset is closed once it is evicted and unused
+    users: int = 0
+    evicted: bool = False
+
+
+def _close(entry: _DatasetEntry):
+    with entry.lock:
+        entry.dataset.close()
+
+
+class RasterCache:
+    """
+    A least-recently-used cache of open raster datasets and decoded raster
+    blocks. Decoded blocks are held up to a memory budget (in bytes) and
+    open datasets up to a maximum handle count; the least recently used
+    entries are evicted first.
+
+    The cache is safe to share between threads. Datasets are leased with
+    dataset() so that an eviction never closes a dataset that is still being
+    read. Threads that miss on a block while another thread is decoding it
+    wait for that decode instead of reading the block again.
+    """
+
+    def __init__(
+        self, max_bytes: int = DEFAULT_CACHE_BYTES, max_datasets: int = DEFAULT_MAX_DATASETS
+    ):
+        if max_bytes < 0:
+            raise ValueError("max_bytes must be non-negative")
+        if max_datasets < 1:
+            raise ValueError("max_datasets must be at least 1")
+
+        self.max_bytes = max_bytes
+        self.max_datasets = max_datasets
+        self.stats = CacheStats()
+
+        self._lock = RLock()
+        self._datasets: "OrderedDict[Path, _DatasetEntry]" = OrderedDict()
+        self._blocks: "OrderedDict[Hashable, np.ndarray]" = OrderedDict()
+        self._loading: "Dict[Hashable, Future[np.ndarray]]" = {}
+        self._nbytes = 0
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Return the number of bytes held by cached blocks
+        """
+        return self._nbytes
+
+    @contextmanager
+    def dataset(self, raster_path: Path) -> Iterator[Tuple["rio.DatasetReader", Lock]]:
+        """
+        Lease an open dataset for the raster path along with a lock that
+        must be held while reading from it. A dataset that is evicted while
+        leased is only closed once its last lease ends.
+        """
+        entry = self._acquire(Path(raster_path))
+        try:
+            yield entry.dataset, entry.lock
+        finally:
+            with self._lock:
+                entry.users -= 1
+                close = entry.evicted and entry.users == 0
+            if close:
+                _close(entry)
+
+    def _acquire(self, raster_path: Path) -> _DatasetEntry:
+        with self._lock:
+            entry = self._datasets.get(raster_path)
+            if entry is not None:
+                self._datasets.move_to_end(raster_path)
+                self.stats.dataset_hits += 1
+                entry.users += 1
+                return entry
+            self.stats.dataset_misses += 1
+
+        # open the file without blocking the other threads; if another thread
+        # opened the same raster in the meantime, its dataset is used instead
+        opened = _DatasetEntry(import_rasterio().open(raster_path), Lock())
+        with self._lock:
+            entry = self._datasets.get(raster_path)
+            if entry is None:
+                entry = self._datasets[raster_path] = opened
+                unused = self._evict_datasets()
+            else:
+                self._datasets.move_to_end(raster_path)
+                unused = [opened]
+            entry.users += 1
+
+        for old in unused:
+            _close(old)
+        return entry
+
+    def block(self, key: Hashable, loader: Callable[[], np.ndarray]) -> np.ndarray:
+        """
+        Return the decoded block stored under key, calling loader to decode
+        it on a miss
+        """
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is not None:
+                self._blocks.move_to_end(key)
+                self.stats.block_hits += 1
+                return block
+            pending = self._loading.get(key)
+            if pending is None:
+                pending = self._loading[key] = Future()
+                self.stats.block_misses += 1
+                loading = True
+            else:
+                self.stats.block_coalesced += 1
+                loading = False
+
+        if not loading:
+            return pending.result()
+
+        try:
+            block = loader()
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            pending.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._loading[key]
+            self.stats.bytes_read += block.nbytes
+            # never cache a block that could not fit in the budget
+            if block.nbytes <= self.max_bytes and key not in self._blocks:
+                self._blocks[key] = block
+                self._nbytes += block.nbytes
+                self._evict_blocks()
+        pending.set_result(block)
+
+        return block
+
+    def clear(self):
+        """
+        Drop all cached blocks and close all cached datasets that are not
+        leased, the others are closed once their last lease ends
+        """
+        with self._lock:
+            for entry in self._datasets.values():
+                entry.evicted = True
+            unused = [entry for entry in self._datasets.values() if entry.users == 0]
+            self._datasets.clear()
+            self._blocks.clear()
+            self._nbytes = 0
+        for entry in unused:
+            _close(entry)
+
+    def _evict_datasets(self) -> List[_DatasetEntry]:
+        # returns the evicted datasets that can be closed right away
+        unused = []
+        while len(self._datasets) > self.max_datasets:
+            _, old = self._datasets.popitem(last=False)
+            old.evicted = True
+            if old.users == 0:
+                unused.append(old)
+            self.stats.dataset_evictions += 1
+        return unused
+
+    def _evict_blocks(self):
+        while self._nbytes > self.max_bytes and self._blocks:
+            _, old = self._blocks.popitem(last=False)
+            self._nbytes -= old.nbytes
+            self.stats.block_evictions += 1
+
+
+_default_cache: Optional[RasterCache] = None
+_default_cache_lock = Lock()
+
+
+def default_raster_cache() -> RasterCache:
+    """
+    Return the process-wide RasterCache shared by USGSLocal instances that
+    are not given a cache of their own
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = RasterCache()
+        return _default_cache
@@ -0,0 +1,190 @@
+import hashlib
+import sys
+from contextlib import contextmanager
+from multiprocessing import Manager
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+DEFAULT_SHARED_BYTES = 4 * 1024 * 1024 * 1024
+
+
+def _open_segment(name: str, create: bool = False, size: int = 0) -> SharedMemory:
+    """
+    Open a shared memory segment that is not unlinked when the process that
+    opened it exits; the lifetime of segments is managed by the registry
+    """
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, create=create, size=size, track=False)
+
+    from multiprocessing import resource_tracker
+
+    segment = SharedMemory(name=name, create=create, size=size)
+    resource_tracker.unregister(segment._name, "shared_memory")  # type: ignore[attr-defined]
+    return segment
+
+
+def segment_name(raster_path: Union[str, Path]) -> str:
+    """
+    Return the shared memory segment name used for a raster tile
+    """
+    digest = hashlib.sha1(str(Path(raster_path).resolve()).encode()).hexdigest()
+    return f"gradeit_{digest[:20]}"
+
+
+class SharedTileRegistry:
+    """
+    Coordinates decoded raster tiles published in shared memory so that
+    worker processes on the same host share a single copy of each tile.
+
+    The first process to need a tile decodes it into a new shared memory
+    segment; sibling processes attach to the existing segment. The registry
+    counts the processes using each segment and, once the total size of
+    the published tiles exceeds max_bytes, unlinks the least recently used
+    segments that are not in use.
+
+    Create the registry in the parent process and pass it to the workers
+    (it can be pickled); call close() in the parent when done to unlink all
+    segments. A tile is decoded outside of the registry lock, under the one
+    of the load_locks load locks that the tile's name hashes to. Two workers
+    therefore never decode the same tile, and workers that attach to
+    published tiles never wait for a decode. Workers decoding different
+    tiles only wait for each other if the tiles share a load lock.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_SHARED_BYTES, load_locks: int = 64):
+        self.max_bytes = max_bytes
+        self._manager: Any = Manager()
+        self._entries = self._manager.dict()
+        self._stats = self._manager.dict(loads=0, attaches=0, evictions=0)
+        self._lock = self._manager.Lock()
+        # workers cannot create manager objects, so the load locks are made up front
+        self._load_locks = [self._manager.Lock() for _ in range(load_locks)]
+        self._clock = self._manager.Value("i", 0)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_manager"] = None
+        return state
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Return the number of tiles loaded, attached to and evicted
+        """
+        return dict(self._stats)
+
+    @contextmanager
+    def tile(
+        self, raster_path: Union[str, Path], loader: Callable[[], np.ndarray]
+    ) -> Iterator[np.ndarray]:
+        """
+        Yield the decoded tile for the raster path, calling loader to decode
+        it if no process has published it yet. The array must not be used
+        after the context exits.
+        """
+        name = segment_name(raster_path)
+        segment, entry = self._attach(name)
+        if entry is None:
+            load_lock = self._load_locks[int(name.rsplit("_", 1)[1], 16) % len(self._load_locks)]
+            with load_lock:
+                # another worker may have published the tile while this one waited
+                segment, entry = self._attach(name)
+                if entry is None:
+                    data = loader()
+                    segment, entry = self._publish(name, data)
+
+        if segment is None or entry is None:
+            # the tile does not fit in the budget, so keep a private copy
+            yield data
+            return
+
+        array = np.ndarray(entry["shape"], dtype=np.dtype(entry["dtype"]), buffer=segment.buf)
+        try:
+            yield array
+        finally:
+            # the segment can only be closed once no array refers to its buffer
+            del array
+            segment.close()
+            with self._lock:
+                entry = self._entries[name]
+                entry["refs"] -= 1
+                self._entries[name] = entry
+
+    def _attach(self, name: str) -> Tuple[Optional[SharedMemory], Optional[Dict[str, Any]]]:
+        # open the published segment of a tile and count this process as a user
+        with self._lock:
+            entry: Optional[Dict[str, Any]] = self._entries.get(name)
+            if entry is None:
+                return None, None
+            segment = _open_segment(name)
+            self._stats["attaches"] += 1
+            self._clock.value += 1
+            entry["refs"] += 1
+            entry["last_used"] = self._clock.value
+            self._entries[name] = entry
+        return segment, entry
+
+    def _publish(
+        self, name: str, data: np.ndarray
+    ) -> Tuple[Optional[SharedMemory], Optional[Dict[str, Any]]]:
+        # copy a decoded tile into a new segment, if it fits in the budget
+        with self._lock:
+            self._stats["loads"] += 1
+            if not self._make_room(data.nbytes):
+                return None, None
+            segment = _open_segment(name, create=True, size=max(data.nbytes, 1))
+            shared = np.ndarray(data.shape, dtype=data.dtype, buffer=segment.buf)
+            shared[...] = data
+            del shared
+            self._clock.value += 1
+            entry = {
+                "shape": data.shape,
+                "dtype": data.dtype.str,
+                "nbytes": data.nbytes,
+                "refs": 1,
+                "last_used": self._clock.value,
+            }
+            self._entries[name] = entry
+        return segment, entry
+
+    def close(self):
+        """
+        Unlink every published segment and stop the coordinator. Only the
+        process that created the registry can close it.
+        """
+        if self._manager is None:
+            return
+        with self._lock:
+            for name in list(self._entries.keys()):
+                self._unlink(name)
+        self._manager.shutdown()
+        self._manager = None
+
+    def _make_room(self, nbytes: int) -> bool:
+        # must be called while holding the lock
+        used = sum(entry["nbytes"] for entry in self._entries.values())
+        idle = sorted(
+            (entry["last_used"], name)
+            for name, entry in self._entries.items()
+            if entry["refs"] == 0
+        )
+        for _, name in idle:
+            if used + nbytes <= self.max_bytes:
+                break
+            used -= self._entries[name]["nbytes"]
+            self._unlink(name)
+            self._stats["evictions"] += 1
+        return used + nbytes <= self.max_bytes
+
+    def _unlink(self, name: str):
+        try:
+            # a tracked handle, since unlinking stops the tracking
+            segment = SharedMemory(name=name)
+            segment.close()
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+        del self._entries[name]
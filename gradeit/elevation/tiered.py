@@ -0,0 +1,123 @@
+import time
+from dataclasses import dataclass
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from gradeit.coordinate import Coordinate
+from gradeit.elevation.elevation_cache import (
+    PIXELS_PER_DEGREE,
+    ElevationCache,
+    MemoryElevationCache,
+    quantize,
+)
+from gradeit.elevation.elevation_model import ElevationModel
+from gradeit.instrumentation import Metrics
+from gradeit.trace import as_trace
+
+Tier = Union[ElevationModel, ElevationCache, MemoryElevationCache]
+
+
+@dataclass
+class TierStats:
+    """
+    Counters for one tier of a TieredElevationModel; points are counted
+    once per distinct DEM pixel
+    """
+
+    hits: int = 0
+    misses: int = 0
+    seconds: float = 0.0
+
+
+class TieredElevationModel(ElevationModel):
+    """
+    An elevation model that sends each point to the cheapest tier that can
+    answer it, e.g. an in-memory cache, the local raster tiles, a persistent
+    cache and finally the USGS API.
+
+    Tiers are tried in order. The points a tier leaves as nan are passed to
+    the next tier in one batch, and answers are written back to every cache
+    tier (anything with get_many/put_many) above the tier that answered.
+    Model tiers should return nan for points they do not cover, e.g.
+    USGSLocal with a TileManifest. Points that share a DEM pixel are looked
+    up once.
+
+    Per-tier counters are kept in the stats attribute and reported to
+    metrics as tier.<name> timings and tier.<name>.hits/misses counters.
+    """
+
+    def __init__(self, tiers: Sequence[Tuple[str, Tier]], metrics: Optional[Metrics] = None):
+        if len(tiers) == 0:
+            raise ValueError("a tiered elevation model needs at least one tier")
+        self.tiers = list(tiers)
+        self.stats: Dict[str, TierStats] = {name: TierStats() for name, _ in self.tiers}
+        self._lock = Lock()
+        if metrics is not None:
+            self.metrics = metrics
+
+    @property
+    def source_id(self) -> Optional[str]:
+        # cache tiers only hold answers of the model tiers
+        ids = [tier.source_id for _, tier in self.tiers if isinstance(tier, ElevationModel)]
+        if any(source_id is None for source_id in ids):
+            return None
+        return f"tiered({','.join(str(source_id) for source_id in ids)})"
+
+    def get_elevation(self, trace: List[Coordinate]) -> List[float]:
+        points = as_trace(trace)
+        return self.get_elevation_array(points.latitude, points.longitude).tolist()
+
+    def get_elevation_array(self, latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        if len(latitude) == 0:
+            return np.empty(0, dtype=np.float64)
+
+        # look up one representative point per DEM pixel
+        lat_q, lon_q = quantize(latitude, longitude, PIXELS_PER_DEGREE)
+        keys = np.stack([lat_q, lon_q], axis=1)
+        _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        lats, lons = latitude[first], longitude[first]
+
+        elevation = np.full(len(first), np.nan, dtype=np.float64)
+        pending = np.arange(len(first))
+        # the tier that answered each pixel, len(self.tiers) if none did
+        answered_by = np.full(len(first), len(self.tiers), dtype=np.int64)
+
+        for level, (name, tier) in enumerate(self.tiers):
+            if len(pending) == 0:
+                break
+            start = time.perf_counter()
+            if isinstance(tier, ElevationModel):
+                found = tier.get_elevation_array(lats[pending], lons[pending])
+            else:
+                found = tier.get_many(lats[pending], lons[pending])
+            found = np.asarray(found, dtype=np.float64)
+            hit = np.isfinite(found)
+
+            elevation[pending[hit]] = found[hit]
+            answered_by[pending[hit]] = level
+            seconds = time.perf_counter() - start
+            n_hits = int(hit.sum())
+            with self._lock:
+                stats = self.stats[name]
+                stats.hits += n_hits
+                stats.misses += len(hit) - n_hits
+                stats.seconds += seconds
+            if self.metrics.enabled:
+                self.metrics.timing(f"tier.{name}", seconds)
+                self.metrics.count(f"tier.{name}.hits", n_hits)
+                self.metrics.count(f"tier.{name}.misses", len(hit) - n_hits)
+            pending = pending[~hit]
+
+        for level, (_, tier) in enumerate(self.tiers):
+            if isinstance(tier, ElevationModel):
+                continue
+            fill = np.flatnonzero(answered_by > level)
+            fill = fill[np.isfinite(elevation[fill])]
+            if len(fill):
+                tier.put_many(lats[fill], lons[fill], elevation[fill])
+
+        return elevation[inverse.reshape(-1)]
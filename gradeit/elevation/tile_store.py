@@ -0,0 +1,209 @@
+import json
+import logging
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from gradeit.coordinate import Coordinate
+from gradeit.elevation.elevation_model import ElevationModel
+from gradeit.elevation.manifest import files_version
+from gradeit.elevation.raster_cache import import_rasterio
+from gradeit.elevation.usgs_local import get_pixel_offsets, group_by_grid_ref
+from gradeit.instrumentation import Metrics
+from gradeit.trace import as_trace
+
+log = logging.getLogger(__name__)
+
+INT16_NODATA = -32768
+INT16_MAX = 32767
+# rows decoded at a time while compiling a tile
+STRIP_ROWS = 512
+
+
+@dataclass
+class TileHeader:
+    """
+    The sidecar header of a compiled tile. Raw values are converted to
+    meters with value * scale + offset; raw values equal to nodata are
+    missing.
+    """
+
+    width: int
+    height: int
+    dtype: str
+    transform: List[float]
+    scale: float = 1.0
+    offset: float = 0.0
+    nodata: Optional[float] = None
+
+    @classmethod
+    def read(cls, path: Path) -> "TileHeader":
+        with Path(path).open("r") as f:
+            return TileHeader(**json.load(f))
+
+    def write(self, path: Path):
+        with Path(path).open("w") as f:
+            json.dump(asdict(self), f, indent=2)
+
+
+def compiled_tile_paths(store_path: Union[str, Path], grid_ref: str) -> Tuple[Path, Path]:
+    """
+    Return the (data, header) paths of a compiled tile in the store, which
+    uses the same <ref>/USGS_13_<ref> layout as the GeoTIFF database
+    """
+    base = Path(store_path) / grid_ref / f"USGS_13_{grid_ref}"
+    return base.with_suffix(".bin"), base.with_suffix(".json")
+
+
+def compile_tile(
+    tif_path: Union[str, Path], store_path: Union[str, Path], quantize: bool = False
+) -> Path:
+    """
+    Convert a USGS_13_<ref>.tif GeoTIFF into a raw, uncompressed array file
+    plus a JSON sidecar header that can be memory-mapped by USGSCompiled.
+
+    Parameters:
+        tif_path: the path to the GeoTIFF tile
+        store_path: the root of the compiled tile store
+        quantize: store int16 decimeters relative to the tile minimum
+            instead of float32 meters; tiles whose elevation range does not
+            fit in int16 decimeters are stored as float32
+    Returns:
+        the path to the compiled data file
+    """
+    rio = import_rasterio()
+    Window = rio.windows.Window
+
+    tif_path = Path(tif_path)
+    grid_ref = tif_path.stem.replace("USGS_13_", "")
+    data_path, header_path = compiled_tile_paths(store_path, grid_ref)
+    data_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with rio.open(tif_path) as src:
+        nodata = src.nodata
+
+        def strips():
+            for row in range(0, src.height, STRIP_ROWS):
+                height = min(STRIP_ROWS, src.height - row)
+                strip = src.read(1, window=Window(0, row, src.width, height))
+                strip = strip.astype(np.float32)
+                if nodata is not None:
+                    strip[strip == nodata] = np.nan
+                yield row, strip
+
+        dtype = "float32"
+        scale, offset = 1.0, 0.0
+        if quantize:
+            low, high = np.inf, -np.inf
+            for _, strip in strips():
+                if np.isfinite(strip).any():
+                    low = min(low, float(np.nanmin(strip)))
+                    high = max(high, float(np.nanmax(strip)))
+            offset = float(np.floor(low)) if np.isfinite(low) else 0.0
+            if not np.isfinite(high) or (high - offset) * 10 <= INT16_MAX:
+                dtype, scale = "int16", 0.1
+            else:
+                log.warning(f"elevation range of {tif_path} does not fit in int16, using float32")
+
+        out = np.memmap(data_path, dtype=dtype, mode="w+", shape=(src.height, src.width))
+        for row, strip in strips():
+            if dtype == "int16":
+                raw = np.round((strip - offset) / scale)
+                out[row : row + len(strip)] = np.where(np.isnan(raw), INT16_NODATA, raw)
+            else:
+                out[row : row + len(strip)] = strip
+        out.flush()
+        del out
+
+        header = TileHeader(
+            width=src.width,
+            height=src.height,
+            dtype=dtype,
+            transform=list(src.transform)[:6],
+            scale=scale,
+            offset=offset,
+            nodata=INT16_NODATA if dtype == "int16" else None,
+        )
+    header.write(header_path)
+
+    return data_path
+
+
+class USGSCompiled(ElevationModel):
+    """
+    An elevation model to look up elevation by latitude, longitude
+    coordinates from a store of tiles compiled with compile_tile.
+
+    Tiles are memory-mapped, so lookups are plain array indexing and the
+    operating system's page cache is shared by every process on the host.
+    """
+
+    store_path: Path
+
+    def __init__(self, store_path: Union[str, Path], metrics: Optional[Metrics] = None):
+        self.store_path = Path(store_path)
+        self._tiles: Dict[str, Tuple[np.ndarray, TileHeader]] = {}
+        self._source_id: Optional[str] = None
+        if metrics is not None:
+            self.metrics = metrics
+
+    @property
+    def source_id(self) -> Optional[str]:
+        if self._source_id is None:
+            self.refresh()
+        return self._source_id
+
+    def refresh(self):
+        """
+        Rescan the compiled tiles for source_id, which is otherwise computed
+        once per instance; call it after tiles were added or recompiled
+        """
+        # recompiling a tile changes its size or modification time, and so the id
+        version = files_version(self.store_path, (".bin", ".json"))
+        self._source_id = f"usgs-compiled:{self.store_path.resolve()}:{version}"
+
+    def get_elevation(self, trace: List[Coordinate]) -> List[float]:
+        points = as_trace(trace)
+        return self.get_elevation_array(points.latitude, points.longitude).tolist()
+
+    def get_elevation_array(self, latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        elevation = np.empty(len(latitude), dtype=np.float64)
+
+        with self.metrics.timer("elevation.compiled"):
+            for grid_ref, idx in group_by_grid_ref(latitude, longitude):
+                elevation[idx] = self._sample(grid_ref, latitude[idx], longitude[idx])
+        self.metrics.count("elevation.compiled.points", len(elevation))
+
+        return elevation
+
+    def _tile(self, grid_ref: str) -> Tuple[np.ndarray, TileHeader]:
+        if grid_ref not in self._tiles:
+            data_path, header_path = compiled_tile_paths(self.store_path, grid_ref)
+            if not data_path.exists():
+                raise FileNotFoundError(f"The compiled tile {data_path} does not exist.")
+            header = TileHeader.read(header_path)
+            data = np.memmap(
+                data_path, dtype=header.dtype, mode="r", shape=(header.height, header.width)
+            )
+            self._tiles[grid_ref] = (data, header)
+            self.metrics.count("compiled.tiles_opened")
+        return self._tiles[grid_ref]
+
+    def _sample(self, grid_ref: str, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        data, header = self._tile(grid_ref)
+        pixel_width, _, x_origin, _, pixel_height, y_origin = header.transform
+        rows, cols = get_pixel_offsets(lats, lons, x_origin, y_origin, pixel_width, pixel_height)
+
+        values = np.full(len(lats), np.nan, dtype=np.float64)
+        valid = (rows >= 0) & (rows < header.height) & (cols >= 0) & (cols < header.width)
+        raw = data[rows[valid], cols[valid]]
+        meters = raw * header.scale + header.offset
+        if header.nodata is not None:
+            meters = np.where(raw == header.nodata, np.nan, meters)
+        values[valid] = meters
+
+        return values * 3.28084
@@ -1,36 +1,88 @@
-from typing import List
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import TYPE_CHECKING, List, Optional
 
-import requests
-from requests import JSONDecodeError
+import numpy as np
 
 from gradeit.coordinate import Coordinate
 from gradeit.elevation.elevation_model import ElevationModel
+from gradeit.instrumentation import Metrics
+from gradeit.trace import as_trace
 
+if TYPE_CHECKING:
+    import requests
 
 URL = "https://epqs.nationalmap.gov/v1/"
 UNITS = "feet"
 OUTPUT = "json"
 
 
-def usgs_query_call(coord: Coordinate) -> float:
+class RetryableQueryError(Exception):
+    """
+    Raised for USGS API failures that are worth retrying, such as server
+    errors or a malformed response body
+    """
+
+
+def usgs_query_call(
+    coord: Coordinate,
+    session: Optional["requests.Session"] = None,
+    timeout: Optional[float] = None,
+    url: str = URL,
+) -> float:
     """
     Build and run the query to the USGS API endpoint
     """
+    return usgs_query(coord.latitude, coord.longitude, session=session, timeout=timeout, url=url)
 
-    lat = str(coord.latitude)
-    lon = str(coord.longitude)
 
-    query = f"{URL}{OUTPUT}?x={lon}&y={lat}&units={UNITS}&wkid=4326&includeDate=False"
-    response = requests.get(query)
+def usgs_query(
+    latitude: float,
+    longitude: float,
+    session: Optional["requests.Session"] = None,
+    timeout: Optional[float] = None,
+    url: str = URL,
+) -> float:
+    """
+    Build and run the query to the USGS API endpoint for a single point,
+    optionally reusing the connections of a requests Session
+    """
+    import requests
+
+    query = build_query_url(latitude, longitude, url)
+    getter = session if session is not None else requests
+    response = getter.get(query, timeout=timeout)
+    if response.status_code >= 500:
+        raise RetryableQueryError(
+            f"Error when querying USGS API: server returned {response.status_code}"
+        )
     try:
         result = response.json()
-    except JSONDecodeError:
-        raise Exception(f"Error when querying USGS API: {response.text}")
+    except requests.JSONDecodeError as e:
+        raise RetryableQueryError(f"Error when querying USGS API: {response.text}") from e
+
+    return parse_elevation(result)
+
 
+def build_query_url(latitude: float, longitude: float, url: str = URL) -> str:
+    """
+    Build the USGS API query for a single point
+    """
+    lat = str(latitude)
+    lon = str(longitude)
+
+    return f"{url}{OUTPUT}?x={lon}&y={lat}&units={UNITS}&wkid=4326&includeDate=False"
+
+
+def parse_elevation(result: dict) -> float:
+    """
+    Extract the elevation from a decoded USGS API response
+    """
     try:
         raw_elevation = result["value"]
-    except KeyError:
-        raise Exception("Error when querying USGS API: elevation not present in result")
+    except KeyError as e:
+        raise Exception("Error when querying USGS API: elevation not present in result") from e
     try:
         elev = float(raw_elevation)
     except ValueError as e:
@@ -41,15 +93,133 @@ def usgs_query_call(coord: Coordinate) -> float:
     return elev
 
 
+class TokenBucket:
+    """
+    A thread-safe token bucket rate limiter. Tokens are added at `rate` per
+    second up to `capacity`, and each call to acquire() blocks until a
+    token is available.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = Lock()
+
+    def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return
+            time.sleep(wait)
+
+    def try_acquire(self) -> float:
+        """
+        Take a token if one is available and return 0, otherwise return the
+        number of seconds to wait before trying again
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+
+def build_session(max_connections: int) -> "requests.Session":
+    """
+    Build a requests Session whose connection pool can hold
+    max_connections open connections to the USGS API
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 class USGSApi(ElevationModel):
     """
     An elevation model to look up elevation by latitude, longitude
     coordinates. The source for the data is the public USGS API, which compiles
     and serves data from the 1/3 arc-second Digital Elevation Model.
 
+    Queries are sent over a pooled HTTP session from a bounded thread pool,
+    optionally rate limited, and retried with exponential backoff on server
+    errors, malformed responses and connection failures. Results are
+    returned in the order of the input points.
+
     More information is available at https://nationalmap.gov/epqs/
     """
 
+    def __init__(
+        self,
+        max_in_flight: int = 8,
+        requests_per_second: Optional[float] = None,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        timeout: Optional[float] = 30.0,
+        url: str = URL,
+        metrics: Optional[Metrics] = None,
+    ):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.url = url
+        self.rate_limiter = (
+            TokenBucket(requests_per_second) if requests_per_second is not None else None
+        )
+        self.session = build_session(max_in_flight)
+        if metrics is not None:
+            self.metrics = metrics
+
+    @property
+    def source_id(self) -> Optional[str]:
+        return f"usgs-api:{self.url}"
+
     def get_elevation(self, trace: List[Coordinate]) -> List[float]:
-        elevations = list(map(usgs_query_call, trace))
-        return elevations
+        points = as_trace(trace)
+        return self.get_elevation_array(points.latitude, points.longitude).tolist()
+
+    def get_elevation_array(self, latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+        points = list(zip(np.asarray(latitude).tolist(), np.asarray(longitude).tolist()))
+        with self.metrics.timer("elevation.api"):
+            if len(points) <= 1 or self.max_in_flight == 1:
+                elevations = [self._query(lat, lon) for lat, lon in points]
+            else:
+                with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+                    elevations = list(pool.map(lambda p: self._query(*p), points))
+        self.metrics.count("elevation.api.points", len(points))
+        return np.array(elevations, dtype=np.float64)
+
+    def _query(self, latitude: float, longitude: float) -> float:
+        import requests
+
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            self.metrics.count("api.requests")
+            try:
+                return usgs_query(
+                    latitude, longitude, session=self.session, timeout=self.timeout, url=self.url
+                )
+            except (RetryableQueryError, requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    self.metrics.count("api.errors")
+                    raise
+            self.metrics.count("api.retries")
+            time.sleep(self.backoff * 2**attempt)
+            attempt += 1
@@ -1,11 +1,21 @@
+from contextlib import contextmanager, nullcontext
+from dataclasses import replace
+from functools import partial
 from pathlib import Path
-from typing import List, Union
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
-import rasterio as rio
 
 from gradeit.coordinate import Coordinate
 from gradeit.elevation.elevation_model import ElevationModel
+from gradeit.elevation.raster_cache import RasterCache, default_raster_cache, import_rasterio
+from gradeit.instrumentation import Metrics
+from gradeit.trace import Trace, TraceLike, as_trace
+
+if TYPE_CHECKING:
+    from gradeit.elevation.manifest import TileManifest
+    from gradeit.elevation.shared_tiles import SharedTileRegistry
 
 
 class USGSLocal(ElevationModel):
@@ -13,52 +23,166 @@ class USGSLocal(ElevationModel):
     An elevation model to look up elevation by latitude, longitude
     coordinates. The source data is a locally downloaded raster database
     containing the USGS 1/3 arc-second Digital Elevation Model.
+
+    Open datasets and decoded raster blocks are kept in a RasterCache so
+    that repeated lookups against the same tiles skip the open and decode.
+    By default all instances share one process-wide cache.
+
+    If a SharedTileRegistry is given, whole tiles are decoded into shared
+    memory instead, so that worker processes on the same host share one
+    copy of each tile.
+
+    If a TileManifest is given, tiles are located through the manifest
+    instead of the n##w### naming, so any tile layout can be used, and
+    points that no tile covers get an elevation of nan instead of raising.
+
+    With metrics, the raster counters are the change in the cache stats over
+    each lookup, so they include concurrent lookups that share the cache.
     """
 
     usgs_db_path: Path
-
-    def __init__(self, usgs_db_path: Union[Path, str]):
+    cache: RasterCache
+    shared_tiles: Optional["SharedTileRegistry"]
+    manifest: Optional["TileManifest"]
+
+    def __init__(
+        self,
+        usgs_db_path: Union[Path, str],
+        cache: Optional[RasterCache] = None,
+        shared_tiles: Optional["SharedTileRegistry"] = None,
+        manifest: Optional["TileManifest"] = None,
+        metrics: Optional[Metrics] = None,
+    ):
         self.usgs_db_path = Path(usgs_db_path)
+        self.cache = cache if cache is not None else default_raster_cache()
+        self.shared_tiles = shared_tiles
+        self.manifest = manifest
+        self._source_id: Optional[str] = None
+        if metrics is not None:
+            self.metrics = metrics
+
+    @property
+    def source_id(self) -> Optional[str]:
+        if self.manifest is not None:
+            return f"usgs-local:{self.manifest.version}"
+        if self._source_id is None:
+            self.refresh()
+        return self._source_id
+
+    def refresh(self):
+        """
+        Without a manifest, rescan the tiles for source_id, which is otherwise
+        computed once per instance; call it after tiles were added or replaced.
+        With a manifest, load a new TileManifest instead.
+        """
+        from gradeit.elevation.manifest import TILE_SUFFIXES, files_version
+
+        # replacing a tile changes its size or modification time, and so the id
+        version = files_version(self.usgs_db_path, TILE_SUFFIXES)
+        self._source_id = f"usgs-local:{self.usgs_db_path.resolve()}:{version}"
 
     def get_elevation(self, trace: List[Coordinate]) -> List[float]:
-        elevation = get_raster_elev_profile(trace, self.usgs_db_path)
+        points = as_trace(trace)
+        return self.get_elevation_array(points.latitude, points.longitude).tolist()
+
+    def get_elevation_array(self, latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+        if not self.metrics.enabled:
+            return self._lookup(latitude, longitude)
+
+        before = replace(self.cache.stats)
+        with self.metrics.timer("elevation.local"):
+            elevation = self._lookup(latitude, longitude)
+        after = self.cache.stats
+        self.metrics.count("elevation.local.points", len(elevation))
+        self.metrics.count("raster.tiles_opened", after.dataset_misses - before.dataset_misses)
+        self.metrics.count("raster.block_hits", after.block_hits - before.block_hits)
+        self.metrics.count("raster.block_misses", after.block_misses - before.block_misses)
+        self.metrics.count("raster.bytes_read", after.bytes_read - before.bytes_read)
+        return elevation
 
+    def prefetch(self, latitude: np.ndarray, longitude: np.ndarray) -> int:
+        """
+        Open the tiles that the points fall in and decode the raster blocks
+        that contain them into the cache ahead of the lookups, up to the
+        memory budget of the cache. Tiles that do not exist are skipped.
+
+        Returns:
+            the number of blocks decoded
+        """
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        if self.manifest is not None:
+            tiles = [
+                (self.manifest.tile_path(tile), idx, False)
+                for tile, idx in self.manifest.group(latitude, longitude)
+                if tile is not None
+            ]
+        else:
+            tiles = [
+                (self.usgs_db_path / grid_ref / f"USGS_13_{grid_ref}.tif", idx, True)
+                for grid_ref, idx in group_by_grid_ref(latitude, longitude)
+            ]
+
+        n_loaded = 0
+        for raster_path, idx, check_hemisphere in tiles:
+            if raster_path.exists():
+                n_loaded += prefetch_raster_blocks(
+                    raster_path, latitude[idx], longitude[idx], self.cache, check_hemisphere
+                )
+        return n_loaded
+
+    def _lookup(self, latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+        if self.manifest is None:
+            trace = Trace.from_lat_lon(latitude, longitude)
+            return get_raster_elev_profile(
+                trace, self.usgs_db_path, cache=self.cache, shared_tiles=self.shared_tiles
+            )
+
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        elevation = np.full(len(latitude), np.nan, dtype=np.float64)
+        for tile, idx in self.manifest.group(latitude, longitude):
+            if tile is not None:
+                elevation[idx] = sample_raster(
+                    self.manifest.tile_path(tile),
+                    latitude[idx],
+                    longitude[idx],
+                    self.cache,
+                    self.shared_tiles,
+                    check_hemisphere=False,
+                )
         return elevation
 
 
-def get_raster_elev_profile(coordinates: List[Coordinate], usgs_db_path):
+def get_raster_elev_profile(
+    coordinates: TraceLike,
+    usgs_db_path,
+    cache: Optional[RasterCache] = None,
+    shared_tiles: Optional["SharedTileRegistry"] = None,
+) -> np.ndarray:
     """
     This function takes latitude and longitude values, of coordinate pairs
     and returns an elevation profile from the raster database on the
     arnaud server.
 
     Parameters:
-        an iterable of iterables (list of lists, tuple of tuples, etc.)
-        ex:    [[lat1, lon1], [lat2, lon2]]
+        a Trace or a list of Coordinate objects
+        an optional RasterCache to reuse open datasets and decoded blocks
+        an optional SharedTileRegistry to share decoded tiles between processes
     Return value:
-        A list of elevation float values from the raster database.
-    """
-    lats = [coord.latitude for coord in coordinates]
-    lons = [coord.longitude for coord in coordinates]
-    elevation_full = []
-    ts_full = []  # track query order
-    grid_refs = build_grid_refs(lats, lons)
-    unique_grid_refs = list(set(grid_refs))
-    row_col = range(0, len(lons))
-
-    # for each unique grid reference, find associated order, lat, lon, and elevation
-    for uniq_ref in unique_grid_refs:
-        ts = [row_col[i] for i in range(len(grid_refs)) if grid_refs[i] == uniq_ref]
-        grid_lats = [lats[i] for i in range(len(grid_refs)) if grid_refs[i] == uniq_ref]
-        grid_lons = [lons[i] for i in range(len(grid_refs)) if grid_refs[i] == uniq_ref]
-        elevation = get_raster_elev_data(uniq_ref, grid_lats, grid_lons, usgs_db_path)
-        elevation_full += elevation
-        ts_full += ts
-
-    # reorder the elevation values to match the order of the query coordinates
-    ts_full, elevation_full = [
-        list(x) for x in zip(*sorted(zip(ts_full, elevation_full), key=lambda pair: pair[0]))
-    ]
+        A numpy array of elevation float values from the raster database.
+    """
+    trace = as_trace(coordinates)
+    lats = trace.latitude
+    lons = trace.longitude
+    elevation_full = np.empty(len(lats), dtype=np.float64)
+
+    # scatter each grid reference's elevation values back into their
+    # original positions
+    for grid_ref, ts in group_by_grid_ref(lats, lons):
+        elevation_full[ts] = get_raster_elev_data(
+            grid_ref, lats[ts], lons[ts], usgs_db_path, cache, shared_tiles
+        )
 
     return elevation_full
 
@@ -76,8 +200,15 @@ def get_raster_metadata_and_data(raster_path):
         a tuple containing the following metadata and data
         (Origin, yOrigin, pixelWidth, pixelHeight, bands, rows, cols, data)
     """
-    data_reader = rio.open(raster_path)
+    data_reader = import_rasterio().open(raster_path)
+    return (*get_raster_metadata(data_reader), data_reader)
 
+
+def get_raster_metadata(data_reader):
+    """
+    Return the (xOrigin, yOrigin, pixelWidth, pixelHeight, bands) of an
+    open raster dataset
+    """
     geotransform = data_reader.transform
     xOrigin = geotransform[2]
     yOrigin = geotransform[5]
@@ -85,24 +216,52 @@ def get_raster_metadata_and_data(raster_path):
     pixelHeight = geotransform[4]
     bands = data_reader.indexes
 
-    return xOrigin, yOrigin, pixelWidth, pixelHeight, bands, data_reader
+    return xOrigin, yOrigin, pixelWidth, pixelHeight, bands
 
 
-def get_raster_elev_data(grid_ref, lats, lons, usgs_db_path):
+@contextmanager
+def open_raster(raster_path, cache: Optional[RasterCache] = None) -> Iterator[Tuple[Any, Lock]]:
+    """
+    Open the raster at raster_path, leasing it from the cache if one is
+    given, and yield it along with the lock to hold while reading from it
+    """
+    if cache is not None:
+        with cache.dataset(raster_path) as leased:
+            yield leased
+    else:
+        with import_rasterio().open(raster_path) as data_reader:
+            yield data_reader, Lock()
+
+
+def get_raster_elev_data(
+    grid_ref,
+    lats,
+    lons,
+    usgs_db_path,
+    cache: Optional[RasterCache] = None,
+    shared_tiles: Optional["SharedTileRegistry"] = None,
+):
     """
     A function that specifies the path to the raster database, calls
     get_raster_metadata_and_data(raster_path), processes the results
     from raster data into geo-referenced, human-readable, elevation data.
 
+    Only the internal raster blocks that contain a query point are read
+    and decoded, so the cost scales with the number of points rather than
+    the size of the tile. If a RasterCache is given, the dataset is kept
+    open and decoded blocks are reused across calls. If a SharedTileRegistry
+    is given, the whole tile is decoded once into shared memory and sampled
+    from there.
+
     Parameters:
         a grid reference ID string, an iterable of longitude float values,
         and an iterable of latitude float values
         float value that mark the position of the elevation query
+        an optional RasterCache
+        an optional SharedTileRegistry
     Returns:
-        a list of floats containing elevation values
+        a numpy array of floats containing elevation values
     """
-    elevation = []
-
     db_path = Path(usgs_db_path)
 
     raster_path = db_path / f"{grid_ref}" / f"USGS_13_{grid_ref}.tif"
@@ -112,32 +271,203 @@ def get_raster_elev_data(grid_ref, lats, lons, usgs_db_path):
         error_msg = f"The raster path {raster_path} does not exist."
         raise Exception(error_msg)
 
-    (
-        xOrigin,
-        yOrigin,
-        pixelWidth,
-        pixelHeight,
-        bands,
-        data,
-    ) = get_raster_metadata_and_data(raster_path)
-    xOffset = [int((v - xOrigin) / pixelWidth) if v < 0.0 else "nan" for v in np.float64(lons)]
-    yOffset = [int((v - yOrigin) / pixelHeight) if v > 0.0 else "nan" for v in np.float64(lats)]
-    band_data = [data.read(b) for b in bands]
-
-    for val in range(len(lons)):
-        if xOffset[val] == "nan":
-            elevation += [np.nan]
+    return sample_raster(raster_path, lats, lons, cache, shared_tiles)
+
+
+def sample_raster(
+    raster_path,
+    lats,
+    lons,
+    cache: Optional[RasterCache] = None,
+    shared_tiles: Optional["SharedTileRegistry"] = None,
+    check_hemisphere: bool = True,
+) -> np.ndarray:
+    """
+    Sample the elevation (in feet) of the raster at raster_path at each
+    point, nan for points outside of the raster or on a nodata pixel. See
+    get_raster_elev_data.
+
+    Tiles found by the n##w### naming only cover the western/northern
+    hemisphere, so other points are dropped unless check_hemisphere is
+    False, e.g. for tiles that a TileManifest located by their bounds.
+    """
+    with open_raster(raster_path, cache) as (data, lock):
+        xOrigin, yOrigin, pixelWidth, pixelHeight, bands = get_raster_metadata(data)
+        nodata = data.nodata
+        if nodata is not None:
+            # compare in the raster's dtype, e.g. a float32 -3.4e38
+            nodata = float(np.asarray(nodata, dtype=data.dtypes[bands[0] - 1]))
+
+        rows, cols = get_pixel_offsets(
+            lats, lons, xOrigin, yOrigin, pixelWidth, pixelHeight, check_hemisphere
+        )
+        if shared_tiles is not None:
+            loader = partial(_read_band, data, bands[0], lock)
+            with shared_tiles.tile(raster_path, loader) as tile:
+                elevation = sample_tile(tile, rows, cols)
         else:
-            for band in band_data:
-                try:
-                    raster_data = band[yOffset[val], xOffset[val]]
-                except IndexError:
-                    elevation.append(np.nan)
+            elevation = sample_raster_blocks(data, bands[0], rows, cols, cache, lock)
+
+    if nodata is not None:
+        elevation[elevation == nodata] = np.nan
+    return elevation * 3.28084
+
+
+def get_pixel_offsets(
+    lats, lons, xOrigin, yOrigin, pixelWidth, pixelHeight, check_hemisphere: bool = True
+):
+    """
+    Convert latitude and longitude values into raster row and column
+    offsets. With check_hemisphere, points that are not in the
+    western/northern hemisphere get an offset of -1 so that they are treated
+    as out of bounds; otherwise only the raster bounds limit the offsets.
+
+    Returns:
+        a tuple of integer numpy arrays (rows, cols)
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    valid = np.isfinite(lats) & np.isfinite(lons)
+    if check_hemisphere:
+        valid &= (lats > 0.0) & (lons < 0.0)
+    rows = np.where(valid, np.floor((lats - yOrigin) / pixelHeight), -1).astype(np.int64)
+    cols = np.where(valid, np.floor((lons - xOrigin) / pixelWidth), -1).astype(np.int64)
+
+    return rows, cols
+
+
+def sample_raster_blocks(
+    data, band, rows, cols, cache: Optional[RasterCache] = None, lock: Optional[Lock] = None
+):
+    """
+    Sample raster values at the given pixel offsets by reading only the
+    internal blocks of the raster that contain at least one point.
+
+    Parameters:
+        an open rasterio dataset, the band index to sample, integer
+        numpy arrays of row and column offsets, an optional RasterCache
+        to look up and store decoded blocks in, and the lock to hold while
+        reading from the dataset, e.g. from open_raster
+    Returns:
+        a numpy float64 array of raw raster values, nan for points that
+        fall outside of the raster
+    """
+    values = np.full(len(rows), np.nan, dtype=np.float64)
+
+    point_idx, block_ids = block_ids_of(data, band, rows, cols)
+    if len(point_idx) == 0:
+        return values
+
+    # group the points by block so that each block is decoded once
+    order = np.argsort(block_ids, kind="stable")
+    unique_blocks, starts = np.unique(block_ids[order], return_index=True)
+    ends = np.append(starts[1:], len(order))
+
+    for block_id, start, end in zip(unique_blocks, starts, ends):
+        window = block_window(data, band, int(block_id))
+        row_off, col_off = window.row_off, window.col_off
+        loader = partial(_read_window, data, band, window, lock)
+        if cache is not None:
+            block = cache.block((data.name, band, int(block_id)), loader)
+        else:
+            block = loader()
+
+        idx = point_idx[order[start:end]]
+        values[idx] = block[rows[idx] - row_off, cols[idx] - col_off]
+
+    return values
+
+
+def block_ids_of(data, band, rows, cols) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the internal raster block of each pixel offset
 
-                elev_ft = float(raster_data) * 3.28084
-                elevation.append(elev_ft)
+    Returns:
+        the positions of the offsets that fall inside the raster and the
+        ids of their blocks (numbered row by row)
+    """
+    in_bounds = (rows >= 0) & (rows < data.height) & (cols >= 0) & (cols < data.width)
+    point_idx = np.flatnonzero(in_bounds)
+    block_height, block_width = data.block_shapes[band - 1]
+    blocks_per_row = -(-data.width // block_width)
+    block_ids = (rows[point_idx] // block_height) * blocks_per_row + cols[point_idx] // block_width
+    return point_idx, block_ids
+
+
+def block_window(data, band, block_id: int):
+    """
+    Return the rasterio Window of an internal raster block
+    """
+    Window = import_rasterio().windows.Window
+
+    block_height, block_width = data.block_shapes[band - 1]
+    blocks_per_row = -(-data.width // block_width)
+    row_off = (block_id // blocks_per_row) * block_height
+    col_off = (block_id % blocks_per_row) * block_width
+    return Window(
+        col_off,
+        row_off,
+        min(block_width, data.width - col_off),
+        min(block_height, data.height - row_off),
+    )
+
+
+def prefetch_raster_blocks(
+    raster_path, lats, lons, cache: RasterCache, check_hemisphere: bool = True
+) -> int:
+    """
+    Open the raster at raster_path and decode the blocks that contain the
+    points into the cache, stopping before the cache would have to evict
+    a block
+
+    Returns:
+        the number of blocks decoded
+    """
+    with cache.dataset(raster_path) as (data, lock):
+        xOrigin, yOrigin, pixelWidth, pixelHeight, bands = get_raster_metadata(data)
+        band = bands[0]
+        rows, cols = get_pixel_offsets(
+            lats, lons, xOrigin, yOrigin, pixelWidth, pixelHeight, check_hemisphere
+        )
+        itemsize = np.dtype(data.dtypes[band - 1]).itemsize
+
+        n_loaded = 0
+        _, block_ids = block_ids_of(data, band, rows, cols)
+        for block_id in np.unique(block_ids).tolist():
+            key = (data.name, band, block_id)
+            window = block_window(data, band, block_id)
+            if cache.nbytes + window.width * window.height * itemsize > cache.max_bytes:
+                break
+            misses = cache.stats.block_misses
+            cache.block(key, partial(_read_window, data, band, window, lock))
+            n_loaded += cache.stats.block_misses - misses
+    return n_loaded
+
+
+def sample_tile(tile: np.ndarray, rows, cols) -> np.ndarray:
+    """
+    Sample a fully decoded raster band at the given pixel offsets
 
-    return elevation
+    Returns:
+        a numpy float64 array of raw raster values, nan for points that
+        fall outside of the raster
+    """
+    values = np.full(len(rows), np.nan, dtype=np.float64)
+    height, width = tile.shape
+    in_bounds = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+    values[in_bounds] = tile[rows[in_bounds], cols[in_bounds]]
+    return values
+
+
+def _read_band(data, band, lock: Lock) -> np.ndarray:
+    with lock:
+        return data.read(band)
+
+
+def _read_window(data, band, window, lock: Optional[Lock]) -> np.ndarray:
+    with lock if lock is not None else nullcontext():
+        return data.read(band, window=window)
 
 
 def build_grid_refs(lats, lons):
@@ -149,15 +479,59 @@ def build_grid_refs(lats, lons):
         Two iterables containing float values. The first containing
         latitudes, and the second containing longitudes.
     Return value:
-        A numpy array of grid reference ID strings.
-    """
-    grid_refs = []
-    for i in range(len(lons)):
-        if lats[i] > 0.0 and lons[i] < 0.0:
-            val = str(int(abs(lons[i])) + 1)
-            if len(val) < 3:
-                val = "0" + val
-            grid_refs += ["n" + str(int(abs(lats[i])) + 1) + "w" + val]
-        else:
-            grid_refs += ["0"]
-    return grid_refs
+        A list of grid reference ID strings.
+    """
+    unique_keys, inverse = np.unique(build_grid_keys(lats, lons), return_inverse=True)
+    unique_refs = [grid_ref_from_key(key) for key in unique_keys]
+    return [unique_refs[i] for i in inverse]
+
+
+def group_by_grid_ref(lats, lons) -> Iterator[Tuple[str, np.ndarray]]:
+    """
+    Group points by the grid reference of the raster tile they fall in
+
+    Parameters:
+        Two iterables containing float values. The first containing
+        latitudes, and the second containing longitudes.
+    Return value:
+        An iterator of (grid reference ID, positions of the points in the
+        tile) pairs, with positions in query order.
+    """
+    unique_keys, inverse = np.unique(build_grid_keys(lats, lons), return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.cumsum(np.bincount(inverse, minlength=len(unique_keys)))
+    for key, idx in zip(unique_keys, np.split(order, bounds[:-1])):
+        yield grid_ref_from_key(key), idx
+
+
+def build_grid_keys(lats, lons):
+    """
+    Compute integer grid keys for all points at once. The key of a point in
+    tile n<lat>w<lon> is lat * 1000 + lon; points outside of the
+    western/northern hemisphere get a key of -1.
+
+    Parameters:
+        Two iterables containing float values. The first containing
+        latitudes, and the second containing longitudes.
+    Return value:
+        A numpy int64 array of grid keys.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    valid = (lats > 0.0) & (lons < 0.0)
+    north = np.trunc(np.abs(lats)).astype(np.int64) + 1
+    west = np.trunc(np.abs(lons)).astype(np.int64) + 1
+
+    return np.where(valid, north * 1000 + west, -1)
+
+
+def grid_ref_from_key(key: int) -> str:
+    """
+    Convert an integer grid key from build_grid_keys to its grid reference
+    ID string, e.g. 40106 -> "n40w106"
+    """
+    if key < 0:
+        return "0"
+    north, west = divmod(int(key), 1000)
+    return f"n{north}w{west:03d}"
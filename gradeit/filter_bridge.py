@@ -1,112 +1,133 @@
+import logging
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, List, Sequence, Union
+
 import numpy as np
+from numpy.typing import ArrayLike
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+log = logging.getLogger(__name__)
+
+FT_PER_MILE = 5280
+
+
+@dataclass
+class BridgeParams:
+    """
+    Parameters of the bridge filter
+
+    Attributes:
+        extension_mi: how far (in miles) past each end of a flat section to
+            look for the bridge edges; the grade is zeroed over this extent
+        min_length_ft: the minimum length (in feet) of a flat section for
+            it to be considered a bridge
+        apply_to_filtered: whether to correct the filtered grade (True) or
+            the unfiltered grade (False)
+        flat_grade: grades with a smaller magnitude count as flat
+        edge_grade: a bridge is only corrected if the grade around it
+            reaches this magnitude, i.e. the DEM dips into a valley
+    """
 
+    extension_mi: float = 0.8
+    min_length_ft: float = 120.0
+    apply_to_filtered: bool = True
+    flat_grade: float = 0.0001
+    edge_grade: float = 0.05
 
-def data_preproc(data):
-    data_idx = data[0:-1]["grade_dec_unfiltered"].index
-    id = []
-    for i in data_idx:
-        id.append(i)
-    id.append(len(data))
-    data["id"] = id
-    # filtering 0 grade elements
-    bridge_raw = data.loc[np.absolute(data["grade_dec_unfiltered"]) < 0.0001]
-    # bridge_raw = data.loc[np.absolute(data['elevation'])<0.00001]
-    return bridge_raw
-
-
-def bridge_segmentation(bridge_raw):
-    # synthesize bridge data out of raw '0' grade values: distance <120
-    idx = [[]]
-    counter = 0
-    c = 0
-    for i in range(len(bridge_raw) - 1):
-        if (
-            bridge_raw["id"].iloc[i + 1] - bridge_raw["id"].iloc[i] == 1
-        ):  # we have consecutive points
-            if counter == 0:
-                idx.append([])
-                # print('row appended')
-                c += 1
-            idx[c].append(i)
-            counter = 1
-        else:
-            counter = 0
-    idx.pop(0)  # removing initial null element
-    # extracting distance range from above data
-    bridge = []
-    for i in range(len(idx)):
-        val = bridge_raw["cumulative_original_distance_ft"][idx[i][0] : idx[i][-1]]
-        if len(val):
-            bridge.append(val)
-    return bridge
-
-
-def bridge_filter_1(bridge, min_bridge_len):
-    # removing short sections / artificial bridge
-    pop_idx = []
-    for i in range(len(bridge)):
-        len_bridge = bridge[i].iloc[-1] - bridge[i].iloc[0]
-        # print("bridge" + str(i) + ": " + str(len_bridge))
-        if len_bridge < min_bridge_len:
-            pop_idx.append(i)
-    for i in reversed(pop_idx):
-        bridge.pop(i)
-    return bridge
-
-
-def bridge_extention(bridge, data, des_dist):
-    # identifying boundaries of the bridge
-    milesToft = 5280
-    # des_dist = .8  # [in miles]
-    des_dist *= milesToft  # [in feets]
-    bridge_ext = []
-    start_dist = []
-    end_dist = []
-    for i in range(len(bridge)):
-        start_dist.append(bridge[i].iloc[0] - des_dist)
-        end_dist.append(bridge[i].iloc[-1] + des_dist)
-    for i in range(len(start_dist)):
-        bridge_ext.append(
-            data.loc[
-                (
-                    (data["cumulative_original_distance_ft"] > start_dist[i])
-                    & (data["cumulative_original_distance_ft"] < end_dist[i])
-                )
-            ]
+    @classmethod
+    def from_list(cls, bridge_param: Sequence) -> "BridgeParams":
+        """
+        Create BridgeParams from the positional
+        [extension_mi, min_length_ft, apply_to_filtered] list
+        """
+        return BridgeParams(
+            extension_mi=bridge_param[0],
+            min_length_ft=bridge_param[1],
+            apply_to_filtered=bool(bridge_param[2]),
         )
-    return bridge_ext
-
-
-def bridge_filter_2(bridge_ext):
-    # final filter based on bridge edges
-    grade_max = 0.05  # max value of grade on the edge of bridge
-    pop_idx_2 = []
-    for i in range(len(bridge_ext)):
-        if np.max(np.abs(bridge_ext[i]["grade_dec_unfiltered"]) < grade_max):
-            pop_idx_2.append(i)
-    for i in reversed(pop_idx_2):
-        bridge_ext.pop(i)
-    return bridge_ext
-
-
-def edge_trim(bridge_ext, data, general_filter):
-    # Triming the grade of extended bridge
-    final_idx = []
-    for i in range(len(bridge_ext)):
-        final_idx.append(bridge_ext[i].index)
-        if general_filter:
-            data.loc[final_idx[i][0] : final_idx[i][-1], "grade_dec_filtered"] = 0
-        else:
-            data.loc[final_idx[i][0] : final_idx[i][-1], "grade_dec_unfiltered"] = 0
-    return data
-
-
-def gradeCorrection_bridge(df, bridge_param):
-    df_raw = data_preproc(df)
-    df_bridge = bridge_segmentation(df_raw)
-    df_bridge = bridge_filter_1(df_bridge, bridge_param[1])
-    df_ext = bridge_extention(df_bridge, df, bridge_param[0])
-    df_ext = bridge_filter_2(df_ext)
-    df_final = edge_trim(df_ext, df, bridge_param[2])
-    print("Bridge filter has been applied.")
-    return df_final
+
+
+def find_bridges(
+    grade: ArrayLike, cumulative_distance_ft: ArrayLike, params: BridgeParams
+) -> np.ndarray:
+    """
+    Find the sections of a trace that look like bridges: runs of flat
+    (unfiltered) grade, where the bare earth DEM has been flattened by a
+    bridge deck or body of water, that are at least min_length_ft long and
+    have steep grade within extension_mi of them.
+
+    Parameters:
+        grade: the unfiltered grade of each point
+        cumulative_distance_ft: the non-decreasing cumulative distance of
+            each point
+        params: the bridge filter parameters
+
+    Returns:
+        an (m, 2) array of [start, stop) positions of the extended bridges
+    """
+    grade = np.abs(np.asarray(grade, dtype=np.float64))
+    cum_dist = np.asarray(cumulative_distance_ft, dtype=np.float64)
+
+    # find every run of consecutive flat points
+    flat = np.concatenate(([False], grade < params.flat_grade, [False]))
+    edges = np.flatnonzero(np.diff(flat.astype(np.int8)))
+    first, last = edges[0::2], edges[1::2] - 1
+
+    # remove short sections / artificial bridges
+    long_enough = (last > first) & (cum_dist[last] - cum_dist[first] >= params.min_length_ft)
+    first, last = first[long_enough], last[long_enough]
+
+    # extend each bridge to its boundaries
+    extension_ft = params.extension_mi * FT_PER_MILE
+    start = np.searchsorted(cum_dist, cum_dist[first] - extension_ft, side="right")
+    stop = np.searchsorted(cum_dist, cum_dist[last] + extension_ft, side="left")
+
+    # only keep bridges with steep grade on the edges
+    steep = np.concatenate(([0], np.cumsum(grade >= params.edge_grade)))
+    has_edges = steep[stop] - steep[start] > 0
+
+    return np.stack([start[has_edges], stop[has_edges]], axis=1)
+
+
+def bridge_mask(n: int, bridges: np.ndarray) -> np.ndarray:
+    """
+    Convert [start, stop) bridge positions into a boolean mask of length n
+    """
+    marks = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(marks, bridges[:, 0], 1)
+    np.add.at(marks, bridges[:, 1], -1)
+    return np.cumsum(marks[:-1]) > 0
+
+
+def gradeCorrection_bridge(
+    df: "pd.DataFrame", bridge_param: Union[BridgeParams, List]
+) -> "pd.DataFrame":
+    """
+    Zero the grade of the sections of a graded dataframe that look like
+    bridges (see find_bridges)
+
+    Parameters:
+        df: a dataframe with grade_dec_unfiltered and either
+            cumulative_original_distance_ft or distances_ft columns
+        bridge_param: BridgeParams, or the positional
+            [extension_mi, min_length_ft, apply_to_filtered] list
+
+    Returns:
+        the dataframe with corrected grade
+    """
+    if not isinstance(bridge_param, BridgeParams):
+        bridge_param = BridgeParams.from_list(bridge_param)
+
+    if "cumulative_original_distance_ft" in df:
+        cum_dist = df["cumulative_original_distance_ft"].values
+    else:
+        cum_dist = np.cumsum(df["distances_ft"].values)
+
+    bridges = find_bridges(df["grade_dec_unfiltered"].values, cum_dist, bridge_param)
+    column = "grade_dec_filtered" if bridge_param.apply_to_filtered else "grade_dec_unfiltered"
+    df.loc[bridge_mask(len(df), bridges), column] = 0
+
+    log.info(f"Bridge filter has been applied to {len(bridges)} sections.")
+    return df
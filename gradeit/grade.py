@@ -1,46 +1,74 @@
-from math import asin, cos, radians, sin, sqrt
-from typing import List
+from math import asin, atan2, cos, degrees, radians, sin, sqrt
+from typing import Literal, Tuple, Union, overload
 
 import numpy as np
+from numpy.typing import ArrayLike, DTypeLike
 
 from gradeit.coordinate import Coordinate
+from gradeit.trace import TraceLike, as_trace
 
+FT_PER_KM = 3280.84
+EARTH_RADIUS_KM = 6371
+
+
+def get_grade(
+    elevation_profile: ArrayLike,
+    distances: ArrayLike,
+    dtype: DTypeLike = np.float64,
+    initial_grade: float = 0.0,
+) -> np.ndarray:
+    """
+    Compute the grade between each coordinate pair, rounded to 4 decimals.
+    The first point has a grade of `initial_grade` and points with an
+    undefined grade (e.g. zero distance from the previous point) carry the
+    previous grade.
+
+    Parameters:
+        elevation_profile: n elevation values
+        distances: n - 1 distances between each coordinate pair
+        dtype: the dtype of the returned array, e.g. np.float32 to halve
+            the memory of the result
+        initial_grade: the grade of the first point, e.g. the last grade of
+            the previous piece of a trace that is graded piecewise
+
+    Returns:
+        an array of n grade values
+    """
+    elevation_profile = np.asarray(elevation_profile, dtype=np.float64)
 
-def get_grade(elevation_profile: List[float], distances: List[float]) -> List[float]:
     # check that n > 1
     if len(elevation_profile) < 2:
         raise ValueError(
             "Determining grade requires at least 2 coordinates\n\t\ti.e. Input size of n > 1"
         )
 
-    d_elev = np.diff(elevation_profile)
-    grade = d_elev / distances
-    grade = np.insert(grade, 0, 0)
+    grade = np.empty(len(elevation_profile), dtype=np.float64)
+    grade[0] = initial_grade
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.divide(np.diff(elevation_profile), distances, out=grade[1:])
     grade = np.round(grade, decimals=4)
-    for a in range(len(grade) - 1):
-        if np.isinf(grade[a + 1]) or np.isnan(grade[a + 1]):
-            grade[a + 1] = grade[a]
 
-    return list(grade)
+    # forward fill inf/nan values with the index of the last finite grade
+    fill_idx = np.where(np.isfinite(grade), np.arange(len(grade)), 0)
+    np.maximum.accumulate(fill_idx, out=fill_idx)
+    grade = grade[fill_idx]
 
+    return grade.astype(dtype, copy=False)
 
-def get_distances(coordinates: List[Coordinate]) -> List[float]:
+
+def get_distances(coordinates: TraceLike) -> np.ndarray:
     """
     Compute the distance between each coordinate pair
     """
-    FT_PER_KM = 3280.84
-    # place a zero up front
-    distances = []
-    i = 1
-    while i < len(coordinates):
-        dist_ft = haversine(coordinates[i - 1], coordinates[i]) * FT_PER_KM
-        distances += [dist_ft]
-        i += 1
+    trace = as_trace(coordinates)
+    distances = haversine_array(trace.latitude, trace.longitude) * FT_PER_KM
 
     return distances
 
 
-def haversine(coord1: Coordinate, coord2: Coordinate, get_bearing: bool = False) -> float:
+def haversine(
+    coord1: Coordinate, coord2: Coordinate, get_bearing: bool = False
+) -> Union[float, Tuple[float, float]]:
     """
     Calculates the great circle distance and bearing (if requested)
     between two points on the earth's surface
@@ -48,10 +76,12 @@ def haversine(coord1: Coordinate, coord2: Coordinate, get_bearing: bool = False)
     Parameters:
         coord1: a Coordinate object
         coord2: a Coordinate object
+        get_bearing: whether to also return the initial bearing
 
     Returns:
         distance: the great circle distance in km
-
+        bearing: the initial bearing from coord1 to coord2 in degrees,
+            only if get_bearing is True
     """
     # convert decimal to radians
     lat1 = radians(coord1.latitude)
@@ -64,9 +94,82 @@ def haversine(coord1: Coordinate, coord2: Coordinate, get_bearing: bool = False)
     dlon = lon2 - lon1
     a = sin(dlat / 2) ** 2 + cos(lat1) * sin(dlon / 2) ** 2
     c = 2 * asin(sqrt(a))
-    R = 6371  # radius of earth in km
-    distance = c * R
+    distance = c * EARTH_RADIUS_KM
     # round to centimeter precision
     distance = round(distance, 5)
 
+    if get_bearing:
+        y = sin(dlon) * cos(lat2)
+        x = cos(lat1) * sin(lat2) - sin(lat1) * cos(lat2) * cos(dlon)
+        bearing = (degrees(atan2(y, x)) + 360) % 360
+        return distance, bearing
+
+    return distance
+
+
+@overload
+def haversine_array(
+    latitude: ArrayLike, longitude: ArrayLike, get_bearing: Literal[False] = ...
+) -> np.ndarray: ...
+
+
+@overload
+def haversine_array(
+    latitude: ArrayLike, longitude: ArrayLike, get_bearing: Literal[True]
+) -> Tuple[np.ndarray, np.ndarray]: ...
+
+
+def haversine_array(
+    latitude: ArrayLike, longitude: ArrayLike, get_bearing: bool = False
+) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Vectorized version of haversine that calculates the great circle
+    distance (and bearing, if requested) between each consecutive pair of
+    points in arrays of latitudes and longitudes. Distances are rounded to
+    centimeter precision exactly like haversine.
+
+    Parameters:
+        latitude: an array of n latitudes in degrees
+        longitude: an array of n longitudes in degrees
+        get_bearing: whether to also return the initial bearings
+
+    Returns:
+        distance: an array of n - 1 great circle distances in km
+        bearing: an array of n - 1 initial bearings in degrees,
+            only if get_bearing is True
+    """
+    lat = np.radians(np.asarray(latitude, dtype=np.float64))
+    lon = np.radians(np.asarray(longitude, dtype=np.float64))
+    lat1, lat2 = lat[:-1], lat[1:]
+
+    dlat = np.diff(lat)
+    dlon = np.diff(lon)
+    cos_lat1 = np.cos(lat1)
+    cos_lat2 = np.cos(lat2)
+    a = np.sin(dlat / 2) ** 2 + cos_lat1 * np.sin(dlon / 2) ** 2
+    distance = 2 * np.arcsin(np.sqrt(a)) * EARTH_RADIUS_KM
+    distance = _round_like_python(distance, 5)
+
+    if get_bearing:
+        y = np.sin(dlon) * cos_lat2
+        x = cos_lat1 * np.sin(lat2) - np.sin(lat1) * cos_lat2 * np.cos(dlon)
+        bearing = (np.degrees(np.arctan2(y, x)) + 360) % 360
+        return distance, bearing
+
     return distance
+
+
+def _round_like_python(values: np.ndarray, decimals: int) -> np.ndarray:
+    """
+    Round an array the way the builtin round() rounds a float.
+
+    np.round scales by a power of ten before rounding, which can land on the
+    other side of a tie than round() does; the few values that are within
+    floating point error of a tie are rounded with round() instead.
+    """
+    scaled = values * 10.0**decimals
+    rounded = np.round(scaled) / 10.0**decimals
+    near_tie = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_tie):
+        rounded[i] = round(float(values[i]), decimals)
+    return rounded
@@ -1,13 +1,36 @@
+from __future__ import annotations
+
+from dataclasses import asdict
 from pathlib import Path
-from typing import Optional, Union
-import pandas as pd
+from threading import Lock
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+import numpy as np
+from gradeit.elevation.elevation_cache import (
+    ElevationCache,
+    MemoryElevationCache,
+    default_cache_path,
+)
 from gradeit.elevation.elevation_model import ElevationModel
 
-from gradeit.elevation.filtering import elevation_filter
+from gradeit.elevation.filtering import (
+    SegmentParams,
+    elevation_filter,
+    segmented_elevation_filter,
+)
+from gradeit.elevation.manifest import TileManifest
+from gradeit.elevation.tiered import Tier, TieredElevationModel
 from gradeit.elevation.usgs_local import USGSLocal
+from gradeit.elevation.tile_store import USGSCompiled
 from gradeit.elevation.usgs_api import USGSApi
-from gradeit.coordinate import Coordinate
+from gradeit.filter_bridge import BridgeParams, bridge_mask, find_bridges
 from gradeit.grade import get_distances, get_grade
+from gradeit.instrumentation import NULL_METRICS, Metrics
+from gradeit.result_cache import ResultCache
+from gradeit.simplify import get_simplified_elevation
+from gradeit.trace import Trace
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 def gradeit(
@@ -18,6 +41,12 @@ def gradeit(
     source: str = "usgs-api",
     usgs_db_path: Optional[Union[str, Path]] = None,
     des_sg: int = 17,
+    elevation_model: Optional[ElevationModel] = None,
+    bridge_params: Optional[BridgeParams] = None,
+    simplify: Union[bool, float] = False,
+    metrics: Optional[Metrics] = None,
+    segment_params: Optional[SegmentParams] = None,
+    result_cache: Optional[ResultCache] = None,
 ) -> pd.DataFrame:
     """
     Add grade to an input dataframe with latitude and longitude columns
@@ -38,50 +67,303 @@ def gradeit(
         path to local USGS raster tiles, by default None
     des_sg : int, optional
         Savitzky-Golay filter window size, by default 17
+    elevation_model : Optional[ElevationModel], optional
+        an elevation model to use instead of one built from `source`, e.g.
+        a CachedElevationModel or a model shared between calls, by default None
+    bridge_params : Optional[BridgeParams], optional
+        if given, zero the grade of sections that look like bridges; the
+        filtered grade is corrected when filtering, otherwise the
+        unfiltered grade, by default None
+    simplify : Union[bool, float], optional
+        thin the trace before looking up elevation: True looks up one point
+        per DEM pixel and copies its elevation to the rest of the points in
+        the pixel, a number looks up one point per that many feet and
+        interpolates the rest, by default False
+    metrics : Optional[Metrics], optional
+        receives the wall time of each stage and counters, see
+        gradeit.instrumentation; it is also given to the elevation model
+        built from `source`, by default None
+    segment_params : Optional[SegmentParams], optional
+        if given, split the trace at distance and time gaps and at missing
+        elevation and filter each segment on its own with its own window,
+        see segmented_elevation_filter, by default None
+    result_cache : Optional[ResultCache], optional
+        if given, return the stored columns of a trace that was graded
+        before with the same points, elevation data and options instead of
+        grading it, and store the columns of new traces; the elevation model
+        must have a source_id, by default None
+
+    With source="usgs-tiered", looked up elevation is also stored in a
+    persistent SQLite cache at default_cache_path(), i.e.
+    $XDG_CACHE_HOME/gradeit/elevation.sqlite (~/.cache by default), which
+    is created on first use. The caches and the tile manifest of that
+    source are kept for the life of the process and shared by all calls
+    with the same usgs_db_path.
 
     Returns
     -------
     pd.DataFrame
         dataframe with grade columns appended
     """
-    lats = df[lat_col].values
-    lons = df[lon_col].values
+    metrics = metrics if metrics is not None else NULL_METRICS
+
+    with metrics.timer("gradeit.trace"):
+        lats = df[lat_col].values
+        lons = df[lon_col].values
+
+        trace = Trace.from_lat_lon(lats, lons)
+    metrics.count("gradeit.points", len(trace))
+
+    emodel = elevation_model or build_elevation_model(source, usgs_db_path, metrics=metrics)
+
+    if result_cache is not None:
+        with metrics.timer("gradeit.result_cache"):
+            key = result_key(
+                df, trace, emodel, filtering, des_sg, bridge_params, simplify, segment_params
+            )
+            columns = result_cache.get(key)
+        if columns is not None:
+            metrics.count("result_cache.hits")
+            for name, values in columns.items():
+                df[name] = values
+            return df
+        metrics.count("result_cache.misses")
+
+    with metrics.timer("gradeit.distance"):
+        distances_ft = get_distances(trace)
+
+    with metrics.timer("gradeit.elevation"):
+        if simplify is False:
+            elevation_ft = emodel.get_elevation_array(trace.latitude, trace.longitude)
+        else:
+            spacing_ft = None if simplify is True else float(simplify)
+            elevation_ft = get_simplified_elevation(emodel, trace, spacing_ft, distances_ft)
+    df = append_grade(
+        df,
+        trace,
+        distances_ft,
+        elevation_ft,
+        filtering,
+        des_sg,
+        bridge_params,
+        metrics,
+        segment_params,
+    )
+
+    if result_cache is not None:
+        with metrics.timer("gradeit.result_cache"):
+            result_cache.put(key, {name: df[name].to_numpy() for name in result_columns(filtering)})
+    return df
+
+
+def result_columns(filtering: bool) -> List[str]:
+    """
+    The columns that gradeit() appends
+    """
+    columns = ["elevation_ft", "distances_ft", "grade_dec_unfiltered"]
+    if filtering:
+        columns += ["elevation_ft_filtered", "grade_dec_filtered"]
+    return columns
+
+
+def result_key(
+    df: pd.DataFrame,
+    trace: Trace,
+    elevation_model: ElevationModel,
+    filtering: bool,
+    des_sg: int,
+    bridge_params: Optional[BridgeParams],
+    simplify: Union[bool, float],
+    segment_params: Optional[SegmentParams],
+) -> str:
+    """
+    The ResultCache key of grading a trace with the given options
+    """
+    source_id = elevation_model.source_id
+    if source_id is None:
+        raise ValueError(
+            f"{type(elevation_model).__name__} has no source_id, so its results cannot be cached"
+        )
+    arrays = [trace.latitude, trace.longitude]
+    params: Dict[str, object] = {
+        "source": source_id,
+        "filtering": filtering,
+        "bridge": asdict(bridge_params) if bridge_params is not None else None,
+        "simplify": simplify,
+    }
+    if filtering:
+        params["des_sg"] = des_sg
+        params["segment"] = asdict(segment_params) if segment_params is not None else None
+        if segment_params is not None and segment_params.time_col is not None:
+            arrays.append(to_seconds(df[segment_params.time_col]))
+    return ResultCache.key(arrays, params)
+
+
+def append_grade(
+    df: pd.DataFrame,
+    trace: Trace,
+    distances_ft: np.ndarray,
+    elevation_ft: np.ndarray,
+    filtering: bool = False,
+    des_sg: int = 17,
+    bridge_params: Optional[BridgeParams] = None,
+    metrics: Metrics = NULL_METRICS,
+    segment_params: Optional[SegmentParams] = None,
+) -> pd.DataFrame:
+    """
+    Append the elevation, distance and grade columns to the dataframe of a
+    trace whose distances and elevation have been looked up; the stages of
+    gradeit() that follow the elevation lookup
+    """
+    df["elevation_ft"] = elevation_ft
+
+    df["distances_ft"] = np.append(0, distances_ft)
+
+    with metrics.timer("gradeit.grade"):
+        grade_dec_unfiltered = get_grade(elevation_ft, distances=distances_ft)
+    df["grade_dec_unfiltered"] = grade_dec_unfiltered
+
+    if filtering:
+        elevation_ft_filtered: Union[List[float], np.ndarray]
+        with metrics.timer("gradeit.filter"):
+            if segment_params is None:
+                elevation_ft_filtered = elevation_filter(
+                    elevation_profile=elevation_ft,
+                    coordinates=trace,
+                    sg_window=des_sg,
+                    distances=distances_ft,
+                )
+            else:
+                timestamps = (
+                    to_seconds(df[segment_params.time_col])
+                    if segment_params.time_col is not None
+                    else None
+                )
+                elevation_ft_filtered = segmented_elevation_filter(
+                    elevation_profile=elevation_ft,
+                    coordinates=trace,
+                    sg_window=des_sg,
+                    distances=distances_ft,
+                    timestamps=timestamps,
+                    max_gap_ft=segment_params.max_gap_ft,
+                    max_gap_s=segment_params.max_gap_s,
+                )
+            grade_dec_filtered = get_grade(elevation_ft_filtered, distances=distances_ft)
+        df["elevation_ft_filtered"] = elevation_ft_filtered
+        df["grade_dec_filtered"] = grade_dec_filtered
+
+    if bridge_params is not None:
+        with metrics.timer("gradeit.bridge"):
+            bridges = find_bridges(
+                grade_dec_unfiltered, np.cumsum(df["distances_ft"].values), bridge_params
+            )
+            column = (
+                "grade_dec_filtered"
+                if filtering and bridge_params.apply_to_filtered
+                else "grade_dec_unfiltered"
+            )
+            df.loc[bridge_mask(len(df), bridges), column] = 0
+        metrics.count("gradeit.bridges", len(bridges))
+
+    return df
+
+
+def to_seconds(times: pd.Series) -> np.ndarray:
+    """
+    Convert a column of datetimes or of numbers to seconds
+    """
+    import pandas as pd
+
+    if pd.api.types.is_datetime64_any_dtype(times):
+        return (times - times.iloc[0]).dt.total_seconds().to_numpy()
+    return np.asarray(times, dtype=np.float64)
+
 
-    coordinates = [Coordinate.from_lat_lon(lat, lon) for lat, lon in zip(lats, lons)]
+def build_elevation_model(
+    source: str = "usgs-api",
+    usgs_db_path: Optional[Union[str, Path]] = None,
+    metrics: Optional[Metrics] = None,
+) -> ElevationModel:
+    """
+    Build the elevation model for the user's desired data source
+
+    Parameters
+    ----------
+    source : str, optional
+        data source for elevation data, by default "usgs-api"
+    usgs_db_path : Optional[Union[str, Path]], optional
+        path to local USGS raster tiles (or compiled tiles for
+        "usgs-compiled"), by default None
 
-    emodel: ElevationModel
+        "usgs-tiered" looks points up in memory, then in the local tiles (if
+        usgs_db_path is given), then in the persistent cache at
+        default_cache_path() and finally with the USGS API, see
+        TieredElevationModel. The caches and the tile manifest are shared
+        by all the models built for the same usgs_db_path in the process.
+    metrics : Optional[Metrics], optional
+        metrics to report the model's timings and counters to, by default
+        None
 
-    # Run the appropriate elevation function based on user's desired data source
+    Returns
+    -------
+    ElevationModel
+        the elevation model for the data source
+    """
     if source == "usgs-api":
-        emodel = USGSApi()
+        return USGSApi(metrics=metrics)
     elif source == "usgs-local":
         if usgs_db_path is None:
             raise Exception(
                 "You must provide a path to the local USGS raster tiles if you want"
                 "to use the 'usgs-local' option"
             )
-        usgs_db_path = Path(usgs_db_path)
-        emodel = USGSLocal(usgs_db_path)
+        return USGSLocal(Path(usgs_db_path), metrics=metrics)
+    elif source == "usgs-compiled":
+        if usgs_db_path is None:
+            raise Exception(
+                "You must provide a path to the compiled USGS tiles if you want"
+                "to use the 'usgs-compiled' option"
+            )
+        return USGSCompiled(Path(usgs_db_path), metrics=metrics)
+    elif source == "usgs-tiered":
+        db_path = Path(usgs_db_path).resolve() if usgs_db_path is not None else None
+        memory, manifest, disk = tiered_stores(db_path)
+        tiers: List[Tuple[str, Tier]] = [("memory", memory)]
+        if db_path is not None:
+            tiers.append(("local", USGSLocal(db_path, manifest=manifest, metrics=metrics)))
+        tiers.append(("disk", disk))
+        tiers.append(("api", USGSApi(metrics=metrics)))
+        return TieredElevationModel(tiers, metrics=metrics)
     else:
         raise Exception(
-            "Invalid elevation data source. Provide one of these options: ['usgs-api','usgs-local']"
+            "Invalid elevation data source. Provide one of these options: "
+            "['usgs-api','usgs-local','usgs-compiled','usgs-tiered']"
         )
 
-    elevation_ft = emodel.get_elevation(coordinates)
-    df["elevation_ft"] = elevation_ft
 
-    distances_ft = get_distances(coordinates)
-    df["distances_ft"] = [0] + distances_ft
+# the caches and tile manifest of the "usgs-tiered" models, by tile path and
+# persistent cache path, so that building a model per gradeit() call does not
+# start over each time
+_tiered_stores: Dict[
+    Tuple[Optional[Path], Path],
+    Tuple[MemoryElevationCache, Optional[TileManifest], ElevationCache],
+] = {}
+_tiered_stores_lock = Lock()
 
-    grade_dec_unfiltered = get_grade(elevation_ft, distances=distances_ft)
-    df["grade_dec_unfiltered"] = grade_dec_unfiltered
 
-    if filtering:
-        elevation_ft_filtered = elevation_filter(
-            elevation_profile=elevation_ft, coordinates=coordinates, sg_window=des_sg
-        )
-        df["elevation_ft_filtered"] = elevation_ft_filtered
-        grade_dec_filtered = get_grade(elevation_ft_filtered, distances=distances_ft)
-        df["grade_dec_filtered"] = grade_dec_filtered
-
-    return df
+def tiered_stores(
+    usgs_db_path: Optional[Path],
+) -> Tuple[MemoryElevationCache, Optional[TileManifest], ElevationCache]:
+    """
+    Return the in-memory cache, the tile manifest (None without local
+    tiles) and the persistent cache at default_cache_path() that the
+    "usgs-tiered" models for usgs_db_path share, creating them on first use
+    """
+    key = (usgs_db_path, default_cache_path())
+    with _tiered_stores_lock:
+        stores = _tiered_stores.get(key)
+        if stores is None:
+            manifest = TileManifest.load(usgs_db_path) if usgs_db_path is not None else None
+            stores = (MemoryElevationCache(), manifest, ElevationCache(key[1]))
+            _tiered_stores[key] = stores
+        return stores
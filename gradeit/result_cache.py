@@ -0,0 +1,198 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Iterable, Optional, Union
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# bump when a change to gradeit() changes its results for the same inputs
+RESULT_CACHE_VERSION = 1
+
+DEFAULT_MAX_BYTES = 10 * 1024**3
+DEFAULT_MAX_AGE_S = 90 * 24 * 3600.0
+
+
+@dataclass
+class ResultCacheStats:
+    """
+    Counters describing how well a ResultCache is being reused
+    """
+
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+
+
+def default_result_cache_path() -> Path:
+    """
+    Return the default location of the result cache,
+    $XDG_CACHE_HOME/gradeit/results (~/.cache by default)
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "gradeit" / "results"
+
+
+class ResultCache:
+    """
+    A content-addressed cache of gradeit() results on local disk.
+
+    Each entry holds the columns that gradeit() appends to one trace as an
+    uncompressed .npz file named by the sha256 of everything the result
+    depends on: the latitude and longitude arrays, the identity of the
+    elevation data (the source_id of the model) and the grading options. A
+    changed input therefore gets a new key instead of a stale result, and
+    a hit is a single file read.
+
+    Entries older than max_age_s (since they were written) are dropped, and
+    once the cache grows past max_bytes the least recently read entries are
+    evicted. Several processes can share one cache directory; entries are
+    written to a temporary file and renamed into place.
+
+    Parameters:
+        path: the cache directory, by default default_result_cache_path()
+        max_bytes: the size budget of the cache, None for no limit
+        max_age_s: the lifetime of an entry in seconds, None for no limit
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        max_bytes: Optional[int] = DEFAULT_MAX_BYTES,
+        max_age_s: Optional[float] = DEFAULT_MAX_AGE_S,
+    ):
+        self.path = Path(path) if path is not None else default_result_cache_path()
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.stats = ResultCacheStats()
+
+        self._lock = Lock()
+        # the size of the entries, measured on the first write
+        self._nbytes: Optional[int] = None
+
+    @staticmethod
+    def key(arrays: Iterable[np.ndarray], params: Dict[str, Any]) -> str:
+        """
+        Return the key of a result computed from the given arrays and
+        JSON-serializable parameters
+        """
+        digest = hashlib.sha256()
+        digest.update(
+            json.dumps({"version": RESULT_CACHE_VERSION, **params}, sort_keys=True).encode()
+        )
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            digest.update(f"{array.dtype.str}{array.shape}".encode())
+            digest.update(array.tobytes())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Return the columns stored under key, or None
+        """
+        path = self._entry_path(key)
+        try:
+            stat = path.stat()
+            if self.max_age_s is not None and time.time() - stat.st_mtime > self.max_age_s:
+                self._remove(path)
+                columns = None
+            else:
+                with np.load(path, allow_pickle=False) as entry:
+                    columns = {name: entry[name] for name in entry.files}
+                # record the read for eviction, keeping the write time
+                os.utime(path, (time.time(), stat.st_mtime))
+        except FileNotFoundError:
+            columns = None
+        except (OSError, ValueError) as e:
+            log.warning(f"ignoring unreadable result cache entry {path}: {e}")
+            columns = None
+
+        with self._lock:
+            if columns is None:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+        return columns
+
+    def put(self, key: str, columns: Dict[str, np.ndarray]):
+        """
+        Store columns under key, evicting entries if the cache is over its
+        budget
+        """
+        path = self._entry_path(key)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            arrays: Dict[str, Any] = {name: np.asarray(values) for name, values in columns.items()}
+            with tmp_path.open("wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, path)
+            size = path.stat().st_size
+        except OSError as e:
+            log.warning(f"unable to write the result cache entry {path}: {e}")
+            return
+
+        with self._lock:
+            self.stats.writes += 1
+            if self._nbytes is not None:
+                self._nbytes += size
+            over_budget = self.max_bytes is not None and (
+                self._nbytes is None or self._nbytes > self.max_bytes
+            )
+        if over_budget:
+            self.prune()
+
+    def prune(self):
+        """
+        Remove the expired entries, then the least recently read entries
+        until the cache fits in 90% of its budget
+        """
+        now = time.time()
+        entries = []
+        for path in self.path.glob("*/*.npz"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if self.max_age_s is not None and now - stat.st_mtime > self.max_age_s:
+                self._remove(path)
+            else:
+                entries.append((stat.st_atime, stat.st_size, path))
+
+        nbytes = sum(size for _, size, _ in entries)
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            for _, size, path in sorted(entries):
+                if nbytes <= 0.9 * self.max_bytes:
+                    break
+                self._remove(path)
+                nbytes -= size
+
+        with self._lock:
+            self._nbytes = nbytes
+
+    def clear(self):
+        """
+        Remove all entries
+        """
+        for path in self.path.glob("*/*.npz"):
+            self._remove(path)
+        with self._lock:
+            self._nbytes = 0
+
+    def _entry_path(self, key: str) -> Path:
+        return self.path / key[:2] / f"{key}.npz"
+
+    def _remove(self, path: Path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self.stats.evictions += 1
@@ -0,0 +1,434 @@
+"""
+A long-running grade server that keeps an elevation model and its caches
+warm for the short-lived jobs on a node
+
+    gradeit-server --source usgs-local --usgs-db-path tiles/ --unix-socket /tmp/gradeit.sock
+
+Clients POST batches of traces to /grade as JSON:
+
+    {"traces": [{"latitude": [...], "longitude": [...]}, ...],
+     "filtering": true, "des_sg": 17, "bridge": false, "simplify": false}
+
+and receive the columns that gradeit() appends for each trace, in order:
+
+    {"traces": [{"elevation_ft": [...], "distances_ft": [...], ...}, ...]}
+
+Missing elevation is encoded as NaN, which Python's json module reads back.
+GET /stats returns the server's counters. GradeClient speaks this protocol
+over TCP or a Unix socket.
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+import threading
+import time
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Sequence, Tuple, cast
+
+import numpy as np
+import pandas as pd
+
+from gradeit.elevation.coalescing import CoalescingElevationModel
+from gradeit.elevation.elevation_model import ElevationModel
+from gradeit.elevation.manifest import TileManifest
+from gradeit.elevation.usgs_local import USGSLocal
+from gradeit.filter_bridge import BridgeParams
+from gradeit.gradeit import build_elevation_model, gradeit
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8750
+
+
+@dataclass
+class ServerStats:
+    """
+    Counters of the requests a GradeServer has answered
+    """
+
+    requests: int = 0
+    errors: int = 0
+    traces: int = 0
+    points: int = 0
+    seconds: float = 0.0
+
+
+class GradeServer:
+    """
+    Serves gradeit() over HTTP on a TCP port or a Unix socket, grading the
+    traces of every request with one shared elevation model.
+
+    Each request is handled on its own thread. Unless coalesce is False the
+    model is wrapped in a CoalescingElevationModel, so the lookups of
+    concurrent requests are merged into batches and traces that share tiles
+    or blocks share the reads.
+
+    Use it as a context manager to serve from a background thread, or call
+    serve_forever().
+
+    Parameters:
+        model: the elevation model to grade with
+        host: the address to listen on, by default localhost
+        port: the TCP port to listen on, 0 picks a free port
+        unix_socket: listen on this Unix socket path instead of TCP
+        coalesce: merge the lookups of concurrent requests, by default True
+    """
+
+    def __init__(
+        self,
+        model: ElevationModel,
+        host: str = "127.0.0.1",
+        port: int = DEFAULT_PORT,
+        unix_socket: Optional[str] = None,
+        coalesce: bool = True,
+    ):
+        self.model: ElevationModel = CoalescingElevationModel(model) if coalesce else model
+        self.unix_socket = unix_socket
+        self.stats = ServerStats()
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+        self._serving = threading.Event()
+        self._released = False
+
+        server: socketserver.BaseServer
+        if unix_socket is not None:
+            _remove_stale_socket(unix_socket)
+            server = _UnixHTTPServer(unix_socket, self._handler())
+        else:
+            server = ThreadingHTTPServer((host, port), self._handler())
+            server.daemon_threads = True
+        self._server = server
+
+    @property
+    def url(self) -> str:
+        """
+        The http:// URL of a TCP server, or the unix:// path of a Unix socket
+        server
+        """
+        if self.unix_socket is not None:
+            return f"unix://{self.unix_socket}"
+        host, port = cast(Tuple[str, int], self._server.server_address)[:2]
+        return f"http://{host}:{port}"
+
+    def serve_forever(self):
+        log.info(f"serving grade on {self.url}")
+        self._serving.set()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._serving.clear()
+            self._release()
+
+    def close(self):
+        """
+        Stop serving and release the socket and the model's worker threads
+        """
+        if self._serving.is_set():
+            self._server.shutdown()
+        self._release()
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        self._serving.wait()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._server.server_close()
+        if isinstance(self.model, CoalescingElevationModel):
+            self.model.close()
+        if self.unix_socket is not None and os.path.exists(self.unix_socket):
+            os.unlink(self.unix_socket)
+
+    def grade(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Grade the traces of a decoded /grade request
+        """
+        traces = request.get("traces")
+        if not isinstance(traces, list):
+            raise ValueError("the request must have a list of traces")
+        bridge_params = BridgeParams() if request.get("bridge", False) else None
+
+        results = []
+        n_points = 0
+        for trace in traces:
+            df = pd.DataFrame(
+                {
+                    "latitude": np.asarray(trace["latitude"], dtype=np.float64),
+                    "longitude": np.asarray(trace["longitude"], dtype=np.float64),
+                }
+            )
+            graded = gradeit(
+                df,
+                filtering=bool(request.get("filtering", False)),
+                des_sg=int(request.get("des_sg", 17)),
+                elevation_model=self.model,
+                bridge_params=bridge_params,
+                simplify=request.get("simplify", False),
+            )
+            graded = graded.drop(columns=["latitude", "longitude"])
+            results.append({column: graded[column].tolist() for column in graded.columns})
+            n_points += len(df)
+
+        with self._lock:
+            self.stats.traces += len(traces)
+            self.stats.points += n_points
+        return {"traces": results}
+
+    def stats_summary(self) -> Dict[str, Any]:
+        """
+        Return the server's counters, and those of the coalescing model
+        """
+        with self._lock:
+            summary: Dict[str, Any] = asdict(self.stats)
+        summary["uptime"] = time.monotonic() - self._started
+        if isinstance(self.model, CoalescingElevationModel):
+            summary["coalescing"] = asdict(self.model.stats)
+        return summary
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # send the headers and the body in one write
+            wbufsize = 64 * 1024
+
+            def do_GET(self):
+                if self.path == "/stats":
+                    self._send(200, server.stats_summary())
+                else:
+                    self._send(404, {"error": f"not found: {self.path}"})
+
+            def do_POST(self):
+                if self.path != "/grade":
+                    self._send(404, {"error": f"not found: {self.path}"})
+                    return
+                start = time.perf_counter()
+                status = 200
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    request = json.loads(self.rfile.read(length))
+                    body = server.grade(request)
+                except (ValueError, KeyError, TypeError) as e:
+                    status, body = 400, {"error": f"bad request: {e!r}"}
+                except Exception as e:
+                    log.exception("failed to grade a request")
+                    status, body = 500, {"error": repr(e)}
+                with server._lock:
+                    server.stats.requests += 1
+                    server.stats.errors += status != 200
+                    server.stats.seconds += time.perf_counter() - start
+                self._send(status, body)
+
+            def _send(self, status: int, body: Dict[str, Any]):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                log.debug(format % args)
+
+        return Handler
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class GradeClient:
+    """
+    A client for a GradeServer that keeps one connection open. A client is
+    not safe to share between threads; give each thread its own.
+
+    Parameters:
+        url: the server's url, http://host:port or unix:///path/to/socket
+        timeout: seconds to wait for a response
+    """
+
+    def __init__(self, url: str = f"http://127.0.0.1:{DEFAULT_PORT}", timeout: float = 300.0):
+        self.url = url
+        self.timeout = timeout
+        self._connection: Optional[http.client.HTTPConnection] = None
+
+    def grade(
+        self,
+        traces: Sequence[Tuple[Sequence[float], Sequence[float]]],
+        filtering: bool = False,
+        des_sg: int = 17,
+        bridge: bool = False,
+        simplify: bool = False,
+    ) -> List[pd.DataFrame]:
+        """
+        Grade (latitudes, longitudes) traces on the server
+
+        Returns:
+            one dataframe per trace with the columns that gradeit() appends
+        """
+        request = {
+            "traces": [
+                {"latitude": np.asarray(lats).tolist(), "longitude": np.asarray(lons).tolist()}
+                for lats, lons in traces
+            ],
+            "filtering": filtering,
+            "des_sg": des_sg,
+            "bridge": bridge,
+            "simplify": simplify,
+        }
+        response = self._request("POST", "/grade", json.dumps(request).encode())
+        return [pd.DataFrame(columns) for columns in response["traces"]]
+
+    def stats(self) -> Dict[str, Any]:
+        return self._request("GET", "/stats")
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self._connection is None:
+            if self.url.startswith("unix://"):
+                self._connection = _UnixHTTPConnection(self.url[len("unix://") :], self.timeout)
+            else:
+                host = self.url.split("://", 1)[-1].rstrip("/")
+                self._connection = http.client.HTTPConnection(host, timeout=self.timeout)
+        return self._connection
+
+    def _request(self, method: str, path: str, body: Optional[bytes] = None) -> Dict[str, Any]:
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        try:
+            response, payload = self._send(method, path, body, headers)
+        except (ConnectionError, http.client.RemoteDisconnected):
+            # the server closed an idle connection, reconnect once
+            self.close()
+            response, payload = self._send(method, path, body, headers)
+        if response.status != 200:
+            raise RuntimeError(f"grade server returned {response.status}: {payload['error']}")
+        return payload
+
+    def _send(
+        self, method: str, path: str, body: Optional[bytes], headers: Dict[str, str]
+    ) -> Tuple[http.client.HTTPResponse, Dict[str, Any]]:
+        connection = self._connect()
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        return response, json.loads(response.read())
+
+
+def _remove_stale_socket(path: str):
+    """
+    Remove a Unix socket left behind by a server that is no longer running.
+    A socket that a server still accepts connections on is left alone, so
+    binding to it fails, and a path that is not a socket is refused.
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} exists and is not a Unix socket")
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            pass
+        else:
+            return
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+parser = argparse.ArgumentParser(
+    prog="gradeit-server", description="Serve gradeit from a warm elevation model"
+)
+parser.add_argument(
+    "--source",
+    default="usgs-local",
+    choices=["usgs-api", "usgs-local", "usgs-compiled", "usgs-tiered"],
+    help="Elevation data source",
+)
+parser.add_argument("--usgs-db-path", default=None, help="Path to the local USGS raster tiles")
+parser.add_argument(
+    "--manifest",
+    action="store_true",
+    help="Locate tiles through the tile manifest (usgs-local only)",
+)
+parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port to listen on")
+parser.add_argument("--unix-socket", default=None, help="Listen on this Unix socket instead")
+parser.add_argument(
+    "--no-coalesce",
+    action="store_true",
+    help="Look up the traces of each request separately",
+)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parser.parse_args(argv)
+    if args.manifest and (args.source != "usgs-local" or args.usgs_db_path is None):
+        parser.error("--manifest requires --source usgs-local and --usgs-db-path")
+    logging.basicConfig(level=logging.INFO)
+
+    model: ElevationModel
+    if args.manifest:
+        model = USGSLocal(args.usgs_db_path, manifest=TileManifest.load(args.usgs_db_path))
+    else:
+        model = build_elevation_model(args.source, args.usgs_db_path)
+
+    server = GradeServer(
+        model,
+        host=args.host,
+        port=args.port,
+        unix_socket=args.unix_socket,
+        coalesce=not args.no_coalesce,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,95 @@
+from typing import Optional
+
+import numpy as np
+from numpy.typing import ArrayLike
+
+from gradeit.elevation.elevation_cache import PIXELS_PER_DEGREE, quantize
+from gradeit.elevation.elevation_model import ElevationModel
+from gradeit.grade import get_distances
+from gradeit.trace import Trace
+
+
+def thin_by_pixel(
+    latitude: ArrayLike, longitude: ArrayLike, pixels_per_degree: int = PIXELS_PER_DEGREE
+) -> np.ndarray:
+    """
+    Find the points where a trace enters a new DEM pixel. Every other point
+    lies in the same pixel as the kept point before it, so stationary
+    duplicates and dense samples within a pixel are dropped.
+
+    Returns:
+        the sorted positions of the kept points
+    """
+    lat_q, lon_q = quantize(latitude, longitude, pixels_per_degree)
+    if len(lat_q) == 0:
+        return np.empty(0, dtype=np.int64)
+    changed = (np.diff(lat_q) != 0) | (np.diff(lon_q) != 0)
+    return np.flatnonzero(np.concatenate(([True], changed)))
+
+
+def thin_by_distance(cumulative_distance_ft: ArrayLike, spacing_ft: float) -> np.ndarray:
+    """
+    Keep the first point of every spacing_ft along the cumulative distance
+    of a trace, plus the last point. Points with the same cumulative
+    distance as the point before them (e.g. while stationary) are dropped.
+
+    Returns:
+        the sorted positions of the kept points
+    """
+    if spacing_ft <= 0:
+        raise ValueError("spacing_ft must be positive")
+    cum_dist = np.asarray(cumulative_distance_ft, dtype=np.float64)
+    if len(cum_dist) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    bucket = np.floor(cum_dist / spacing_ft)
+    keep = np.flatnonzero(np.concatenate(([True], np.diff(bucket) != 0)))
+    last = len(cum_dist) - 1
+    if keep[-1] != last and cum_dist[last] > cum_dist[keep[-1]]:
+        keep = np.append(keep, last)
+    return keep
+
+
+def get_simplified_elevation(
+    model: ElevationModel,
+    trace: Trace,
+    spacing_ft: Optional[float] = None,
+    distances_ft: Optional[ArrayLike] = None,
+) -> np.ndarray:
+    """
+    Look up the elevation of a trace with as few queries as possible
+
+    With no spacing, one point per run of points in the same DEM pixel is
+    looked up and its elevation is copied to the rest of the run, which
+    gives the same result as looking up every point. With a spacing (in
+    feet), one point per spacing_ft of cumulative distance is looked up and
+    the elevation of the other points is linearly interpolated along the
+    cumulative distance.
+
+    Parameters:
+        model: the elevation model to query
+        trace: the trace to look up
+        spacing_ft: the distance between queried points, by default one
+            query per DEM pixel
+        distances_ft: the n - 1 distances between the points of the trace,
+            computed if not given
+
+    Returns:
+        an array of n elevation values (in feet)
+    """
+    if len(trace) == 0:
+        return np.empty(0, dtype=np.float64)
+
+    if spacing_ft is None:
+        keep = thin_by_pixel(trace.latitude, trace.longitude)
+        fetched = model.get_elevation_array(trace.latitude[keep], trace.longitude[keep])
+        starts = np.zeros(len(trace), dtype=np.int64)
+        starts[keep] = 1
+        return np.asarray(fetched, dtype=np.float64)[np.cumsum(starts) - 1]
+
+    if distances_ft is None:
+        distances_ft = get_distances(trace)
+    cum_dist = np.append(0, np.cumsum(distances_ft))
+    keep = thin_by_distance(cum_dist, spacing_ft)
+    fetched = model.get_elevation_array(trace.latitude[keep], trace.longitude[keep])
+    return np.interp(cum_dist, cum_dist[keep], np.asarray(fetched, dtype=np.float64))
@@ -0,0 +1,373 @@
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from gradeit.elevation.elevation_model import ElevationModel
+from gradeit.elevation.filtering import check_sg
+from gradeit.grade import get_distances, get_grade
+from gradeit.gradeit import build_elevation_model
+from gradeit.trace import Trace
+
+GRADE_COLUMNS = ["grade_dec_unfiltered", "elevation_ft_filtered", "grade_dec_filtered"]
+# the order of the polynomial elevation_filter fits
+SG_POLYORDER = 3
+
+
+def read_trace_chunks(
+    path: Union[str, Path], chunksize: int = 100_000, columns: Optional[List[str]] = None
+) -> Iterator[pd.DataFrame]:
+    """
+    Read a CSV or Parquet trace file in chunks of at most `chunksize` rows
+
+    Parameters
+    ----------
+    path : Union[str, Path]
+        path to a .csv or .parquet file
+    chunksize : int, optional
+        number of rows per chunk, by default 100_000
+    columns : Optional[List[str]], optional
+        subset of columns to read, by default all columns
+
+    Returns
+    -------
+    Iterator[pd.DataFrame]
+        the chunks of the trace, in order
+    """
+    path = Path(path)
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, usecols=columns)
+
+
+def gradeit_chunks(
+    chunks: Iterable[pd.DataFrame],
+    lat_col: str = "latitude",
+    lon_col: str = "longitude",
+    filtering: bool = False,
+    source: str = "usgs-api",
+    usgs_db_path: Optional[Union[str, Path]] = None,
+    des_sg: int = 17,
+    elevation_model: Optional[ElevationModel] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Add grade to a trace that arrives as a sequence of dataframe chunks,
+    yielding graded chunks with the same columns that gradeit() appends.
+
+    Only the chunk being graded plus a window's worth of overlap is held in
+    memory. Each chunk is filtered together with the rows around it, and
+    rows are only yielded once half a Savitzky-Golay window of following
+    rows is known, so the output is identical to grading the whole trace at
+    once, as long as the filter window does not depend on the whole trace.
+
+    That is the case without filtering and for a des_sg that check_sg
+    accepts: rows are held back until there are enough of them for the
+    requested window. The default window (des_sg=0, or a des_sg of 3 or
+    less, which check_sg replaces with the default) depends on the average
+    spacing of all points, so it is instead resolved once from the first
+    chunk, or the first polyorder + 2 rows if the chunk is shorter, and can
+    differ from the window gradeit() picks for the whole trace. A window of
+    3 or less leaves the elevation unfiltered, like elevation_filter.
+
+    Parameters
+    ----------
+    chunks : Iterable[pd.DataFrame]
+        consecutive pieces of one trace, e.g. from read_trace_chunks
+    lat_col : str, optional
+        name of the latitude column, by default "latitude"
+    lon_col : str, optional
+        name of the longitude column, by default "longitude"
+    filtering : bool, optional
+        whether to filter the elevation data, by default False
+    source : str, optional
+        data source for elevation data, by default "usgs-api"
+    usgs_db_path : Optional[Union[str, Path]], optional
+        path to local USGS raster tiles, by default None
+    des_sg : int, optional
+        Savitzky-Golay filter window size, by default 17
+    elevation_model : Optional[ElevationModel], optional
+        an elevation model to use instead of one built from `source`
+
+    Returns
+    -------
+    Iterator[pd.DataFrame]
+        graded chunks; their boundaries need not match the input chunks
+    """
+    emodel = elevation_model or build_elevation_model(source, usgs_db_path)
+
+    # rows from earlier rounds that are kept only as context
+    buffer: Optional[pd.DataFrame] = None
+    n_context = 0
+    # the position of the first buffer row in the whole trace
+    offset = 0
+    sg_window: Optional[int] = None
+    # check_sg rounds an even window up, and replaces one that is too narrow
+    # for the polynomial with the default window
+    requested = des_sg + (des_sg % 2 == 0)
+    default_window = requested <= SG_POLYORDER
+
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        chunk = chunk.copy()
+        chunk["elevation_ft"] = emodel.get_elevation_array(
+            np.asarray(chunk[lat_col].values, dtype=np.float64),
+            np.asarray(chunk[lon_col].values, dtype=np.float64),
+        )
+        buffer = chunk if buffer is None else pd.concat([buffer, chunk], ignore_index=True)
+
+        if filtering and sg_window is None:
+            # wait until check_sg can accept the requested window, or until
+            # there are enough rows to pick a default one from
+            if len(buffer) < (SG_POLYORDER + 2 if default_window else requested):
+                continue
+            distances = get_distances(Trace.from_lat_lon(buffer[lat_col], buffer[lon_col]))
+            sg_window = check_sg(des_sg, list(np.append(0, np.cumsum(distances))))
+
+        # the context kept in front of the pending rows and the number of
+        # trailing rows that must wait for more data
+        context = sg_window if sg_window is not None else 1
+        hold_back = sg_window // 2 if sg_window is not None else 0
+
+        emit_end = len(buffer) - hold_back
+        # get_grade needs at least two points
+        if len(buffer) < max(context, 2) or emit_end <= n_context:
+            continue
+
+        yield _grade_buffer(buffer, n_context, emit_end, offset, lat_col, lon_col, sg_window)
+        keep_from = max(emit_end - context, 0)
+        buffer = buffer.iloc[keep_from:].reset_index(drop=True)
+        n_context = emit_end - keep_from
+        offset += keep_from
+
+    if buffer is not None and n_context < len(buffer):
+        if filtering and n_context == 0:
+            # the whole trace fits in the buffer, so resolve the window for it
+            distances = get_distances(Trace.from_lat_lon(buffer[lat_col], buffer[lon_col]))
+            sg_window = check_sg(des_sg, list(np.append(0, np.cumsum(distances))))
+        yield _grade_buffer(buffer, n_context, len(buffer), offset, lat_col, lon_col, sg_window)
+
+
+def _grade_buffer(
+    buffer: pd.DataFrame,
+    n_context: int,
+    emit_end: int,
+    offset: int,
+    lat_col: str,
+    lon_col: str,
+    sg_window: Optional[int],
+) -> pd.DataFrame:
+    """
+    Grade rows [n_context, emit_end) of the buffer in place and return them.
+    Rows before n_context were already graded and are used as context.
+    """
+    trace = Trace.from_lat_lon(buffer[lat_col].values, buffer[lon_col].values)
+    distances_ft = get_distances(trace)
+    elevation_ft = buffer["elevation_ft"].values
+
+    # start grading from the last context row so grade carries over
+    start = max(n_context - 1, 0)
+    initial = buffer["grade_dec_unfiltered"].iat[start] if n_context else 0.0
+    grade = get_grade(elevation_ft[start:], distances_ft[start:], initial_grade=initial)
+
+    out = buffer.iloc[n_context:emit_end].drop(columns=GRADE_COLUMNS, errors="ignore")
+    out.index = pd.RangeIndex(offset + n_context, offset + emit_end)
+    out["distances_ft"] = np.append(0, distances_ft)[n_context:emit_end]
+    out["grade_dec_unfiltered"] = grade[n_context - start : emit_end - start]
+
+    if sg_window is not None:
+        if sg_window <= SG_POLYORDER:
+            # too few points to fit the polynomial
+            elevation_ft_filtered = np.asarray(elevation_ft, dtype=np.float64).copy()
+        else:
+            from scipy import signal
+
+            elevation_ft_filtered = signal.savgol_filter(
+                elevation_ft, window_length=sg_window, polyorder=SG_POLYORDER
+            )
+        if n_context:
+            # context rows keep the values they were emitted with
+            elevation_ft_filtered[:n_context] = buffer["elevation_ft_filtered"].values[:n_context]
+        initial = buffer["grade_dec_filtered"].iat[start] if n_context else 0.0
+        grade_filtered = get_grade(
+            elevation_ft_filtered[start:], distances_ft[start:], initial_grade=initial
+        )
+        out["elevation_ft_filtered"] = elevation_ft_filtered[n_context:emit_end]
+        out["grade_dec_filtered"] = grade_filtered[n_context - start : emit_end - start]
+
+    # remember the emitted values that later rounds use as context
+    for col in GRADE_COLUMNS:
+        if col in out:
+            if col not in buffer:
+                buffer[col] = np.nan
+            buffer.iloc[n_context:emit_end, buffer.columns.get_loc(col)] = out[col].values
+    return out
+
+
+class GradeStream:
+    """
+    Grade a live trace one point (or a few points) at a time.
+
+    Elevation is looked up for each new batch of points as it arrives, and
+    points are emitted with a fixed lag: a point is graded once `lag` later
+    points are known, by a Savitzky-Golay filter over the `sg_window` points
+    ending `lag` points after it. lag=0 gives a causal filter with no
+    latency; the default of sg_window // 2 gives a centered filter that
+    matches gradeit(filtering=True, des_sg=sg_window). Only the last
+    sg_window points are kept, so use one GradeStream per vehicle and share
+    a warm elevation model between them.
+
+    No points are emitted until sg_window points are known. The points
+    before the first full window and the last `lag` points (emitted by
+    flush) are filtered with a polynomial fit to the first or last window,
+    like savgol_filter's "interp" mode.
+    """
+
+    def __init__(
+        self,
+        elevation_model: ElevationModel,
+        sg_window: int = 17,
+        lag: Optional[int] = None,
+        polyorder: int = 3,
+    ):
+        if sg_window <= polyorder or sg_window % 2 == 0:
+            raise ValueError("sg_window must be odd and greater than polyorder")
+        lag = sg_window // 2 if lag is None else lag
+        if not 0 <= lag < sg_window:
+            raise ValueError("lag must be between 0 and sg_window - 1")
+
+        self.elevation_model = elevation_model
+        self.sg_window = sg_window
+        self.lag = lag
+        self.polyorder = polyorder
+
+        # the most recent points; _start is the position of the first one
+        self._lat = np.empty(0, dtype=np.float64)
+        self._lon = np.empty(0, dtype=np.float64)
+        self._elev = np.empty(0, dtype=np.float64)
+        self._start = 0
+        self._n_seen = 0
+        self._n_emitted = 0
+        # the last emitted point, the context for its successor's grade
+        self._last: Optional[Dict[str, float]] = None
+        self._coeffs: Dict[int, np.ndarray] = {}
+
+    def push(self, latitude, longitude) -> pd.DataFrame:
+        """
+        Add one or more points and return the points that can now be graded,
+        with the same columns that gradeit(filtering=True) appends
+        """
+        latitude = np.atleast_1d(np.asarray(latitude, dtype=np.float64))
+        longitude = np.atleast_1d(np.asarray(longitude, dtype=np.float64))
+        elevation = self.elevation_model.get_elevation_array(latitude, longitude)
+
+        self._lat = np.append(self._lat, latitude)
+        self._lon = np.append(self._lon, longitude)
+        self._elev = np.append(self._elev, np.asarray(elevation, dtype=np.float64))
+        self._n_seen += len(latitude)
+
+        if self._n_seen < self.sg_window:
+            return self._emit(self._n_emitted, np.empty(0, dtype=np.float64))
+        stop = self._n_seen - self.lag
+        return self._emit(stop, self._filter(self._n_emitted, stop))
+
+    def flush(self) -> pd.DataFrame:
+        """
+        Grade the points that are still waiting for later points, e.g. at the
+        end of a trip
+        """
+        start, stop = self._n_emitted, self._n_seen
+        if self._n_seen >= self.sg_window:
+            filtered = self._filter(start, stop)
+        else:
+            # too few points for a full window, so fit all of them at once
+            x = np.arange(self._n_seen)
+            if self._n_seen > self.polyorder:
+                coeffs = np.polyfit(x, self._elev, self.polyorder)
+                filtered = np.polyval(coeffs, x[start:stop])
+            else:
+                filtered = self._elev[start:stop].copy()
+        return self._emit(stop, filtered)
+
+    def _filter(self, start: int, stop: int) -> np.ndarray:
+        # filter points [start, stop) with the window of sg_window points
+        # that ends `lag` points after each one, clipped to the known points
+        window = self.sg_window
+        points = np.arange(start, stop)
+        first = np.clip(points + self.lag - window + 1, 0, self._n_seen - window)
+        pos = points - first
+
+        filtered = np.empty(len(points), dtype=np.float64)
+        for p in np.unique(pos):
+            group = np.flatnonzero(pos == p)
+            rows = first[group, None] - self._start + np.arange(window)
+            filtered[group] = self._elev[rows] @ self._coefficients(int(p))
+        return filtered
+
+    def _coefficients(self, pos: int) -> np.ndarray:
+        if pos not in self._coeffs:
+            from scipy import signal
+
+            self._coeffs[pos] = signal.savgol_coeffs(
+                self.sg_window, self.polyorder, pos=pos, use="dot"
+            )
+        return self._coeffs[pos]
+
+    def _emit(self, stop: int, filtered: np.ndarray) -> pd.DataFrame:
+        start = self._n_emitted
+        idx = slice(start - self._start, stop - self._start)
+        lat, lon, elev = self._lat[idx], self._lon[idx], self._elev[idx]
+
+        out = pd.DataFrame(
+            {"latitude": lat, "longitude": lon, "elevation_ft": elev},
+            index=pd.RangeIndex(start, stop),
+        )
+        if self._last is not None:
+            # the distance from the last emitted point to each point
+            distances_ft = get_distances(
+                Trace.from_lat_lon(
+                    np.append(self._last["latitude"], lat), np.append(self._last["longitude"], lon)
+                )
+            )
+            out["distances_ft"] = distances_ft
+        else:
+            distances_ft = get_distances(Trace.from_lat_lon(lat, lon))
+            out["distances_ft"] = np.append(0, distances_ft)[: len(out)]
+        out["grade_dec_unfiltered"] = self._grade(
+            elev, distances_ft, "elevation_ft", "grade_dec_unfiltered"
+        )
+        out["elevation_ft_filtered"] = filtered
+        out["grade_dec_filtered"] = self._grade(
+            filtered, distances_ft, "elevation_ft_filtered", "grade_dec_filtered"
+        )
+
+        if len(out):
+            self._last = {col: float(value) for col, value in out.iloc[-1].items()}
+        self._n_emitted = stop
+
+        # keep only the points that later windows still need
+        keep_from = max(stop + self.lag - self.sg_window + 1, 0)
+        keep_from = max(min(keep_from, self._n_seen - self.sg_window), self._start)
+        self._lat = self._lat[keep_from - self._start :]
+        self._lon = self._lon[keep_from - self._start :]
+        self._elev = self._elev[keep_from - self._start :]
+        self._start = keep_from
+        return out
+
+    def _grade(
+        self, elevation: np.ndarray, distances_ft: np.ndarray, elev_col: str, grade_col: str
+    ) -> np.ndarray:
+        if len(elevation) == 0:
+            return np.empty(0, dtype=np.float64)
+        if self._last is not None:
+            elevation = np.append(self._last[elev_col], elevation)
+            return get_grade(elevation, distances_ft, initial_grade=self._last[grade_col])[1:]
+        if len(elevation) == 1:
+            return np.zeros(1, dtype=np.float64)
+        return get_grade(elevation, distances_ft)
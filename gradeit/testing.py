@@ -0,0 +1,199 @@
+"""
+Helpers for exercising gradeit without downloaded USGS data or network access
+"""
+
+from pathlib import Path
+from typing import Any, Union
+
+import numpy as np
+
+# USGS 1/3 arc-second tiles carry a 6 pixel overlap on every side
+TILE_OVERLAP_PX = 6
+
+
+def synthetic_elevation_m(lats, lons):
+    """
+    The elevation surface (in meters) used for synthetic tiles: a smooth,
+    tilted plane with a gentle ripple so that every pixel is distinct.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    return 1500.0 + 400.0 * (lats - 39.0) - 250.0 * (lons + 105.0) + 5.0 * np.sin(lats * 50.0)
+
+
+def write_synthetic_tile(
+    usgs_db_path: Union[str, Path],
+    grid_ref: str,
+    pixels_per_degree: int = 1000,
+    blocksize: int = 256,
+) -> Path:
+    """
+    Write a synthetic elevation tile in the same layout as the USGS
+    1/3 arc-second product, i.e. <usgs_db_path>/<ref>/USGS_13_<ref>.tif
+
+    Parameters:
+        usgs_db_path: the root of the raster database
+        grid_ref: a grid reference ID such as "n40w106"
+        pixels_per_degree: the resolution of the tile (USGS uses 10800)
+        blocksize: the internal block size of the GeoTIFF
+    Returns:
+        the path to the written tile
+    """
+    import rasterio as rio
+    from rasterio.transform import from_origin
+
+    north = int(grid_ref[1:3])
+    west = int(grid_ref[4:7])
+
+    pixel = 1.0 / pixels_per_degree
+    size = pixels_per_degree + 2 * TILE_OVERLAP_PX
+    x_origin = -west - TILE_OVERLAP_PX * pixel
+    y_origin = north + TILE_OVERLAP_PX * pixel
+    transform = from_origin(x_origin, y_origin, pixel, pixel)
+
+    # sample the surface at the pixel centers
+    centers = (np.arange(size) + 0.5) * pixel
+    lats = y_origin - centers
+    lons = x_origin + centers
+    elevation = synthetic_elevation_m(lats[:, None], lons[None, :]).astype(np.float32)
+
+    raster_path = Path(usgs_db_path) / grid_ref / f"USGS_13_{grid_ref}.tif"
+    raster_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with rio.open(
+        raster_path,
+        "w",
+        driver="GTiff",
+        height=size,
+        width=size,
+        count=1,
+        dtype="float32",
+        crs="EPSG:4269",
+        transform=transform,
+        tiled=True,
+        blockxsize=blocksize,
+        blockysize=blocksize,
+        compress="deflate",
+    ) as dst:
+        dst.write(elevation, 1)
+
+    return raster_path
+
+
+def synthetic_pixel_elevation_ft(lats, lons, pixels_per_degree: int = 1000):
+    """
+    The elevation (in feet) that a synthetic tile returns for the given
+    points, i.e. the surface sampled at the center of the containing pixel.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    pixel = 1.0 / pixels_per_degree
+
+    y_origin = np.ceil(lats) + TILE_OVERLAP_PX * pixel
+    x_origin = np.floor(lons) - TILE_OVERLAP_PX * pixel
+    rows = np.floor((lats - y_origin) / -pixel)
+    cols = np.floor((lons - x_origin) / pixel)
+
+    center_lats = y_origin - (rows + 0.5) * pixel
+    center_lons = x_origin + (cols + 0.5) * pixel
+    elevation = synthetic_elevation_m(center_lats, center_lons).astype(np.float32)
+    return elevation.astype(np.float64) * 3.28084
+
+
+class FakeEPQSServer:
+    """
+    A local stand-in for the USGS Elevation Point Query Service that serves
+    the synthetic elevation surface from the /v1/json endpoint.
+
+    Use it as a context manager; the url attribute can be passed to USGSApi.
+
+    Parameters:
+        fail_first: respond with a 500 to the first n requests
+        malformed_first: respond with a non-JSON body to the first n
+            requests after the failures
+        delay: seconds to wait before answering each request
+    """
+
+    def __init__(self, fail_first: int = 0, malformed_first: int = 0, delay: float = 0.0):
+        self.fail_first = fail_first
+        self.malformed_first = malformed_first
+        self.delay = delay
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._server: Any = None
+        self._thread: Any = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/"
+
+    def __enter__(self):
+        import threading
+        from http.server import ThreadingHTTPServer
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def _handler(self):
+        import json
+        import threading
+        import time
+        from http.server import BaseHTTPRequestHandler
+        from urllib.parse import parse_qs, urlparse
+
+        fake = self
+        lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with lock:
+                    fake.requests += 1
+                    count = fake.requests
+                    fake.in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+                try:
+                    if fake.delay:
+                        time.sleep(fake.delay)
+                    self._respond(count)
+                finally:
+                    with lock:
+                        fake.in_flight -= 1
+
+            def _respond(self, count):
+                request = urlparse(self.path)
+                if request.path != "/v1/json":
+                    self._send(404, b"not found")
+                elif count <= fake.fail_first:
+                    self._send(500, b"internal server error")
+                elif count <= fake.fail_first + fake.malformed_first:
+                    self._send(200, b"<html>try again later</html>")
+                else:
+                    query = parse_qs(request.query)
+                    lat = float(query["y"][0])
+                    lon = float(query["x"][0])
+                    elevation_ft = float(synthetic_elevation_m(lat, lon)) * 3.28084
+                    body = {"location": {"x": lon, "y": lat}, "value": elevation_ft}
+                    self._send(200, json.dumps(body).encode())
+
+            def _send(self, status, body):
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterator, Sequence, Union, overload
+
+import numpy as np
+
+from gradeit.coordinate import Coordinate
+
+
+@dataclass
+class Trace:
+    """
+    A sequence of GPS points stored as contiguous latitude and longitude
+    float64 arrays. Indexing a Trace with an integer returns a Coordinate
+    so it can be used anywhere a list of Coordinates is expected.
+    """
+
+    latitude: np.ndarray
+    longitude: np.ndarray
+
+    def __post_init__(self):
+        self.latitude = np.ascontiguousarray(self.latitude, dtype=np.float64)
+        self.longitude = np.ascontiguousarray(self.longitude, dtype=np.float64)
+        if self.latitude.ndim != 1 or self.latitude.shape != self.longitude.shape:
+            raise ValueError("latitude and longitude must be 1-dimensional and of equal length")
+
+    @classmethod
+    def from_lat_lon(cls, latitude, longitude) -> Trace:
+        """
+        Create a Trace from iterables of latitudes and longitudes
+        """
+        return Trace(latitude=np.asarray(latitude), longitude=np.asarray(longitude))
+
+    @classmethod
+    def from_coordinates(cls, coordinates: Sequence[Coordinate]) -> Trace:
+        """
+        Create a Trace from a list of Coordinates
+        """
+        return Trace(
+            latitude=np.array([c.latitude for c in coordinates], dtype=np.float64),
+            longitude=np.array([c.longitude for c in coordinates], dtype=np.float64),
+        )
+
+    def to_coordinates(self) -> list[Coordinate]:
+        """
+        Return the Trace as a list of Coordinates
+        """
+        return list(self)
+
+    def __len__(self) -> int:
+        return len(self.latitude)
+
+    def __iter__(self) -> Iterator[Coordinate]:
+        for lat, lon in zip(self.latitude.tolist(), self.longitude.tolist()):
+            yield Coordinate.from_lat_lon(lat, lon)
+
+    @overload
+    def __getitem__(self, index: int) -> Coordinate: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> Trace: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Trace(latitude=self.latitude[index], longitude=self.longitude[index])
+        return Coordinate.from_lat_lon(float(self.latitude[index]), float(self.longitude[index]))
+
+
+TraceLike = Union[Trace, Sequence[Coordinate]]
+
+
+def as_trace(trace: TraceLike) -> Trace:
+    """
+    Return the input as a Trace, converting a list of Coordinates if needed
+    """
+    if isinstance(trace, Trace):
+        return trace
+    return Trace.from_coordinates(trace)
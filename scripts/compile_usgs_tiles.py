@@ -0,0 +1,63 @@
+from pathlib import Path
+from multiprocessing import Pool
+
+import argparse
+import logging
+
+from gradeit.elevation.tile_store import compile_tile
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+parser = argparse.ArgumentParser(
+    description="Compile USGS 1/3 arc-second DEM tiles into memory-mappable arrays"
+)
+
+parser.add_argument(
+    "--input-dir",
+    type=str,
+    default="usgs_tiles",
+    help="Directory with the downloaded tiles",
+)
+
+parser.add_argument(
+    "--output-dir",
+    type=str,
+    default="usgs_tiles_compiled",
+    help="Directory to save the compiled tiles",
+)
+
+parser.add_argument(
+    "--quantize",
+    action="store_true",
+    help="Store elevation as int16 decimeters instead of float32 meters",
+)
+
+parser.add_argument(
+    "--nprocs",
+    type=int,
+    default=4,
+    help="Number of processes to use for compiling",
+)
+
+
+def compile_file(tif_path: Path, output_dir: Path, quantize: bool):
+    destination = compile_tile(tif_path, output_dir, quantize=quantize)
+    log.info(f"compiled {str(tif_path)} to {str(destination)}")
+
+
+def run():
+    args = parser.parse_args()
+    input_dir = Path(args.input_dir)
+    output_dir = Path(args.output_dir)
+
+    tif_paths = sorted(input_dir.glob("*/USGS_13_*.tif"))
+
+    log.info(f"compiling {len(tif_paths)} tiles..")
+
+    with Pool(args.nprocs) as p:
+        p.starmap(compile_file, [(path, output_dir, args.quantize) for path in tif_paths])
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,125 @@
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from gradeit.server import DEFAULT_PORT, GradeClient
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+parser = argparse.ArgumentParser(description="Generate load against a running gradeit server")
+
+parser.add_argument(
+    "--url",
+    type=str,
+    default=f"http://127.0.0.1:{DEFAULT_PORT}",
+    help="Server url, http://host:port or unix:///path/to/socket",
+)
+
+parser.add_argument(
+    "--clients",
+    type=int,
+    default=16,
+    help="Number of concurrent clients",
+)
+
+parser.add_argument(
+    "--requests",
+    type=int,
+    default=50,
+    help="Number of requests each client sends",
+)
+
+parser.add_argument(
+    "--traces",
+    type=int,
+    default=4,
+    help="Number of traces in each request",
+)
+
+parser.add_argument(
+    "--points",
+    type=int,
+    default=1000,
+    help="Number of points in each trace",
+)
+
+parser.add_argument(
+    "--center",
+    type=str,
+    default="39.7,-105.2",
+    help="Latitude,longitude around which the traces are generated",
+)
+
+parser.add_argument(
+    "--spread",
+    type=float,
+    default=0.5,
+    help="Traces start within this many degrees of the center",
+)
+
+parser.add_argument(
+    "--filtering",
+    action="store_true",
+    help="Ask the server to filter the elevation data",
+)
+
+
+def random_trace(rng, center_lat, center_lon, spread, n_points):
+    """
+    A random walk of roughly 10 m steps, like a 10 Hz trace at highway speed
+    """
+    start_lat = center_lat + rng.uniform(-spread, spread)
+    start_lon = center_lon + rng.uniform(-spread, spread)
+    heading = rng.uniform(0, 2 * np.pi) + np.cumsum(rng.normal(0, 0.05, n_points))
+    step = 1e-4
+    lats = start_lat + np.cumsum(step * np.cos(heading))
+    lons = start_lon + np.cumsum(step * np.sin(heading))
+    return lats, lons
+
+
+def run_client(seed, args, center_lat, center_lon):
+    rng = np.random.default_rng(seed)
+    latencies = []
+    with GradeClient(args.url) as client:
+        for _ in range(args.requests):
+            traces = [
+                random_trace(rng, center_lat, center_lon, args.spread, args.points)
+                for _ in range(args.traces)
+            ]
+            start = time.perf_counter()
+            client.grade(traces, filtering=args.filtering)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    center_lat, center_lon = (float(v) for v in args.center.split(","))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        results = list(
+            pool.map(
+                lambda seed: run_client(seed, args, center_lat, center_lon), range(args.clients)
+            )
+        )
+    seconds = time.perf_counter() - start
+
+    latencies = np.concatenate(results) * 1000
+    n_requests = len(latencies)
+    n_points = n_requests * args.traces * args.points
+    log.info(
+        f"{n_requests} requests ({n_points} points) in {seconds:.1f}s: "
+        f"{n_requests / seconds:.1f} requests/s, {n_points / seconds:.0f} points/s"
+    )
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    log.info(
+        f"latency p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms, "
+        f"max {latencies.max():.1f} ms"
+    )
+    with GradeClient(args.url) as client:
+        log.info(f"server stats: {client.stats()}")
@@ -0,0 +1,145 @@
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from gradeit.aio import gradeit_async
+from gradeit.elevation.async_elevation_model import AsyncExecutorModel
+from gradeit.elevation.usgs_api import RetryableQueryError
+from gradeit.elevation.usgs_local import USGSLocal
+from gradeit.gradeit import gradeit
+from gradeit.instrumentation import RecordingMetrics
+from gradeit.testing import (
+    FakeEPQSServer,
+    synthetic_elevation_m,
+    synthetic_pixel_elevation_ft,
+    write_synthetic_tile,
+)
+
+LATS = np.linspace(39.702730, 39.695368, 10)
+LONS = np.linspace(-105.245678, -105.209049, 10)
+
+
+def route(offset: float = 0.0) -> pd.DataFrame:
+    return pd.DataFrame({"latitude": LATS + offset, "longitude": LONS})
+
+
+class AsyncApiTest(unittest.TestCase):
+    def setUp(self):
+        try:
+            import aiohttp  # noqa: F401
+        except ImportError:
+            self.skipTest("aiohttp is not installed")
+
+    def test_concurrent_requests_share_one_model(self):
+        """
+        Concurrent routes are answered in order through one connection pool
+        """
+        from gradeit.elevation.async_usgs_api import AsyncUSGSApi
+
+        offsets = [i * 0.001 for i in range(8)]
+
+        async def run(url):
+            async with AsyncUSGSApi(max_in_flight=4, url=url) as model:
+                return await asyncio.gather(
+                    *(gradeit_async(route(o), elevation_model=model) for o in offsets)
+                )
+
+        with FakeEPQSServer(delay=0.005) as server:
+            results = asyncio.run(run(server.url))
+
+        for offset, graded in zip(offsets, results):
+            np.testing.assert_allclose(
+                graded["elevation_ft"], synthetic_elevation_m(LATS + offset, LONS) * 3.28084
+            )
+        self.assertEqual(server.requests, len(offsets) * len(LATS))
+        self.assertGreater(server.max_in_flight, 1)
+        self.assertLessEqual(server.max_in_flight, 4)
+
+    def test_duplicate_points_are_queried_once(self):
+        from gradeit.elevation.async_usgs_api import AsyncUSGSApi
+
+        metrics = RecordingMetrics()
+
+        async def run(url):
+            async with AsyncUSGSApi(url=url, metrics=metrics) as model:
+                return await asyncio.gather(
+                    *(model.get_elevation_array(LATS, LONS) for _ in range(5))
+                )
+
+        with FakeEPQSServer(delay=0.01) as server:
+            results = asyncio.run(run(server.url))
+
+        for elevation_ft in results:
+            np.testing.assert_allclose(elevation_ft, synthetic_elevation_m(LATS, LONS) * 3.28084)
+        self.assertEqual(server.requests, len(LATS))
+        self.assertEqual(metrics.counters["api.coalesced"], 4 * len(LATS))
+
+    def test_retries_server_errors(self):
+        from gradeit.elevation.async_usgs_api import AsyncUSGSApi
+
+        async def run(url, max_retries):
+            async with AsyncUSGSApi(backoff=0.0, max_retries=max_retries, url=url) as model:
+                return await model.get_elevation_array(LATS[:1], LONS[:1])
+
+        with FakeEPQSServer(fail_first=2, malformed_first=1) as server:
+            elevation_ft = asyncio.run(run(server.url, 3))
+        np.testing.assert_allclose(
+            elevation_ft, synthetic_elevation_m(LATS[:1], LONS[:1]) * 3.28084
+        )
+        self.assertEqual(server.requests, 4)
+
+        with FakeEPQSServer(fail_first=10) as server:
+            with self.assertRaisesRegex(RetryableQueryError, "server returned 500"):
+                asyncio.run(run(server.url, 2))
+        self.assertEqual(server.requests, 3)
+
+
+class AsyncLocalTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmpdir.name)
+        write_synthetic_tile(self.db_path, "n40w106")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_executor_model_matches_gradeit(self):
+        """
+        Concurrent routes graded off the event loop through one shared
+        USGSLocal match the blocking gradeit()
+        """
+        local = USGSLocal(self.db_path)
+        offsets = [i * 0.001 for i in range(10)]
+
+        async def run():
+            async with AsyncExecutorModel(local, max_workers=4, chunk_size=3) as model:
+                return await asyncio.gather(
+                    *(
+                        gradeit_async(route(o), elevation_model=model, filtering=True, des_sg=5)
+                        for o in offsets
+                    )
+                )
+
+        results = asyncio.run(run())
+
+        for offset, graded in zip(offsets, results):
+            expected = gradeit(route(offset), elevation_model=local, filtering=True, des_sg=5)
+            pd.testing.assert_frame_equal(graded, expected)
+            np.testing.assert_allclose(
+                graded["elevation_ft"], synthetic_pixel_elevation_ft(LATS + offset, LONS)
+            )
+
+    def test_blocking_model_and_offloaded_grading(self):
+        local = USGSLocal(self.db_path)
+
+        graded = asyncio.run(gradeit_async(route(), elevation_model=local, offload_points=1))
+
+        pd.testing.assert_frame_equal(graded, gradeit(route(), elevation_model=local))
+
+
+if __name__ == "__main__":
+    unittest.main(warnings="ignore")
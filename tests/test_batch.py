@@ -0,0 +1,86 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from gradeit.batch import gradeit_batch, schedule_trips
+from gradeit.testing import synthetic_pixel_elevation_ft, write_synthetic_tile
+
+
+def make_trip(lat, lon, n=50):
+    return pd.DataFrame(
+        {
+            "latitude": np.linspace(lat, lat + 0.01, n),
+            "longitude": np.linspace(lon, lon + 0.01, n),
+        }
+    )
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmpdir.name)
+        write_synthetic_tile(self.db_path, "n40w106")
+        write_synthetic_tile(self.db_path, "n41w106")
+
+        trips = {
+            "a": make_trip(39.5, -105.5),
+            "b": make_trip(40.5, -105.5),
+            "missing": make_trip(35.5, -100.5),
+            "c": make_trip(39.6, -105.6),
+        }
+        self.long_df = pd.concat([df.assign(trip_id=trip_id) for trip_id, df in trips.items()])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def check_results(self, results):
+        self.assertEqual([r.trip_id for r in results], ["a", "b", "missing", "c"])
+        self.assertFalse(results[2].ok)
+        self.assertIn("does not exist", results[2].error)
+        for r in [results[0], results[1], results[3]]:
+            self.assertTrue(r.ok)
+            np.testing.assert_allclose(
+                r.result.elevation_ft,
+                synthetic_pixel_elevation_ft(r.result.latitude, r.result.longitude),
+            )
+
+    def test_batch_threads(self):
+        results = gradeit_batch(
+            self.long_df, source="usgs-local", usgs_db_path=self.db_path, executor="thread"
+        )
+        self.check_results(results)
+
+    def test_batch_processes(self):
+        results = gradeit_batch(
+            list(self.long_df.groupby("trip_id", sort=False)),
+            source="usgs-local",
+            usgs_db_path=self.db_path,
+            filtering=True,
+            n_workers=2,
+        )
+        self.check_results(results)
+        self.assertIn("grade_dec_filtered", results[0].result.columns)
+
+    def test_batch_shared_tiles(self):
+        results = gradeit_batch(
+            self.long_df,
+            source="usgs-local",
+            usgs_db_path=self.db_path,
+            n_workers=2,
+            shared_tile_bytes=64 * 1024 * 1024,
+        )
+        self.check_results(results)
+
+    def test_schedule_groups_by_tile(self):
+        trips = [make_trip(39.5, -105.5), make_trip(40.5, -105.5), make_trip(39.6, -105.6)]
+
+        groups = schedule_trips(trips, n_workers=1)
+
+        self.assertEqual(sorted(groups), [[0, 2], [1]])
+
+
+if __name__ == "__main__":
+    unittest.main(warnings="ignore")
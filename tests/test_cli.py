@@ -0,0 +1,129 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import pandas as pd
+
+from gradeit import repo_root
+from gradeit import cli
+from gradeit.cli import find_trip_files, main, output_path_for
+from gradeit.elevation.manifest import TileManifest
+from gradeit.elevation.raster_cache import RasterCache
+from gradeit.elevation.usgs_local import build_grid_refs
+from gradeit.testing import write_synthetic_tile
+
+
+class CliTest(unittest.TestCase):
+    def setUp(self):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        root = Path(self.tmpdir.name)
+        self.db_path = root / "tiles"
+        self.trip_dir = root / "trips"
+        self.output_dir = root / "graded"
+
+        df = pd.read_csv(repo_root() / "examples/data/sample_trip_1.csv")
+        for grid_ref in set(build_grid_refs(df.latitude.values, df.longitude.values)):
+            write_synthetic_tile(self.db_path, grid_ref)
+
+        self.trip_dir.mkdir()
+        df.iloc[:500].to_csv(self.trip_dir / "a.csv", index=False)
+        df.iloc[500:].reset_index(drop=True).to_parquet(self.trip_dir / "b.parquet")
+        # a trip file without coordinates
+        pd.DataFrame({"x": [1, 2]}).to_csv(self.trip_dir / "broken.csv", index=False)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_cli(self, *extra):
+        return main(
+            [
+                str(self.trip_dir / "*.*"),
+                "--output-dir",
+                str(self.output_dir),
+                "--source",
+                "usgs-local",
+                "--usgs-db-path",
+                str(self.db_path),
+                "--nprocs",
+                "2",
+                *extra,
+            ]
+        )
+
+    def test_find_trip_files(self):
+        self.assertEqual(
+            [p.name for p in find_trip_files([self.trip_dir])], ["a.csv", "b.parquet", "broken.csv"]
+        )
+
+    def test_grade_and_resume(self):
+        columns = "latitude,longitude,grade_dec_filtered"
+        self.assertEqual(self.run_cli("--filtering", "--manifest", "--columns", columns), 1)
+
+        graded = pd.read_parquet(self.output_dir / "a.parquet")
+        self.assertEqual(list(graded.columns), columns.split(","))
+        self.assertEqual(len(graded), 500)
+        self.assertTrue((self.output_dir / "b.parquet").exists())
+        self.assertFalse((self.output_dir / "broken.parquet").exists())
+        self.assertEqual(list(self.output_dir.glob(".*")), [])
+
+        # finished files are skipped on the next run
+        (self.trip_dir / "broken.csv").unlink()
+        mtime = (self.output_dir / "a.parquet").stat().st_mtime_ns
+        with self.assertLogs("gradeit.cli") as logs:
+            self.assertEqual(self.run_cli(), 0)
+        self.assertEqual((self.output_dir / "a.parquet").stat().st_mtime_ns, mtime)
+        self.assertIn("graded 0 files", logs.output[-1])
+        self.assertIn("2 already done", logs.output[-1])
+
+    def test_result_cache(self):
+        (self.trip_dir / "broken.csv").unlink()
+        cache_dir = Path(self.tmpdir.name) / "results"
+        self.assertEqual(self.run_cli("--filtering", "--result-cache", str(cache_dir)), 0)
+        first = pd.read_parquet(self.output_dir / "a.parquet")
+        self.assertEqual(len(list(cache_dir.glob("*/*.npz"))), 2)
+
+        # regrading reads the results back from the cache
+        self.assertEqual(
+            self.run_cli("--filtering", "--result-cache", str(cache_dir), "--overwrite"), 0
+        )
+        pd.testing.assert_frame_equal(pd.read_parquet(self.output_dir / "a.parquet"), first)
+        self.assertEqual(len(list(cache_dir.glob("*/*.npz"))), 2)
+
+    def test_manifest_warms_the_tile_cache(self):
+        manifest = TileManifest.load(self.db_path)
+        cache = RasterCache()
+        with patch("gradeit.elevation.usgs_local.default_raster_cache", return_value=cache):
+            cli._init_worker("usgs-local", self.db_path, manifest, None)
+        self.addCleanup(setattr, cli, "_model", None)
+        # nothing is read before the worker is given a file
+        self.assertEqual(cache.stats.dataset_misses, 0)
+
+        self.output_dir.mkdir()
+        options = dict(lat_col="latitude", lon_col="longitude", filtering=False)
+        path = self.trip_dir / "a.csv"
+        result = cli._grade_file(path, output_path_for(path, self.output_dir), None, options)
+        self.assertTrue(result.ok, result.error)
+
+        # only the tiles of the file are opened, and its blocks are decoded
+        # before the lookups, which then hit every block
+        df = pd.read_csv(path)
+        coverage = manifest.coverage(df.latitude, df.longitude)
+        self.assertEqual(cache.stats.dataset_misses, len(coverage.tiles))
+        self.assertGreater(cache.stats.block_misses, 0)
+        self.assertEqual(cache.stats.block_hits, cache.stats.block_misses)
+
+    def test_manifest_needs_local_tiles(self):
+        with patch("sys.stderr"), self.assertRaises(SystemExit) as raised:
+            main([str(self.trip_dir), "--output-dir", str(self.output_dir), "--manifest"])
+        self.assertEqual(raised.exception.code, 2)
+        self.assertFalse(self.output_dir.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,20 @@
+import tempfile
 import unittest
+from pathlib import Path
 
 import numpy as np
 from gradeit import repo_root
 
 from gradeit.coordinate import Coordinate
-from gradeit.elevation.usgs_api import USGSApi
-from gradeit.elevation.usgs_local import USGSLocal
+from gradeit.elevation.usgs_api import RetryableQueryError, USGSApi
+from gradeit.elevation.raster_cache import RasterCache
+from gradeit.elevation.usgs_local import USGSLocal, build_grid_keys, build_grid_refs
+from gradeit.testing import (
+    FakeEPQSServer,
+    synthetic_elevation_m,
+    synthetic_pixel_elevation_ft,
+    write_synthetic_tile,
+)
 
 LATS = np.linspace(39.702730, 39.695368, 10)
 LONS = np.linspace(-105.245678, -105.209049, 10)
@@ -25,6 +34,40 @@ class ElevTestApi(unittest.TestCase):
 
         self.assertEqual(len(elevation_ft), len(COORDS))
 
+    def test_api_concurrent_keeps_order(self):
+        """
+        Concurrent queries against a local EPQS stand-in come back in order
+        """
+        with FakeEPQSServer(delay=0.01) as server:
+            emodel = USGSApi(max_in_flight=4, url=server.url)
+            elevation_ft = emodel.get_elevation(COORDS)
+
+        np.testing.assert_allclose(elevation_ft, synthetic_elevation_m(LATS, LONS) * 3.28084)
+        self.assertEqual(server.requests, len(COORDS))
+        self.assertGreater(server.max_in_flight, 1)
+        self.assertLessEqual(server.max_in_flight, 4)
+
+    def test_api_retries_server_errors(self):
+        """
+        Server errors and malformed responses are retried with backoff
+        """
+        with FakeEPQSServer(fail_first=2, malformed_first=1) as server:
+            emodel = USGSApi(max_in_flight=1, backoff=0.0, max_retries=3, url=server.url)
+            elevation_ft = emodel.get_elevation(COORDS[:1])
+
+        np.testing.assert_allclose(
+            elevation_ft, synthetic_elevation_m(LATS[:1], LONS[:1]) * 3.28084
+        )
+        self.assertEqual(server.requests, 4)
+
+    def test_api_gives_up_after_retries(self):
+        with FakeEPQSServer(fail_first=10) as server:
+            emodel = USGSApi(max_in_flight=1, backoff=0.0, max_retries=2, url=server.url)
+            with self.assertRaisesRegex(RetryableQueryError, "server returned 500"):
+                emodel.get_elevation(COORDS[:1])
+
+        self.assertEqual(server.requests, 3)
+
 
 class ElevTestRasterDB(unittest.TestCase):
     @unittest.skip("To run this, you'll have to download the raster tiles for Colorado")
@@ -39,5 +82,133 @@ class ElevTestRasterDB(unittest.TestCase):
         self.assertEqual(len(elevation_ft), len(COORDS))
 
 
+class ElevTestSyntheticRaster(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmpdir.name)
+        write_synthetic_tile(self.db_path, "n40w106")
+        write_synthetic_tile(self.db_path, "n41w106")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_block_reads_match_pixels(self):
+        """
+        Sampling through windowed block reads returns the containing pixel
+        """
+        emodel = USGSLocal(self.db_path)
+
+        elevation_ft = emodel.get_elevation(COORDS)
+
+        np.testing.assert_allclose(elevation_ft, synthetic_pixel_elevation_ft(LATS, LONS))
+
+    def test_points_off_tile_are_nan(self):
+        """
+        Points that fall outside of the raster extent return nan
+        """
+        from gradeit.elevation.usgs_local import get_raster_elev_data
+
+        elevation_ft = get_raster_elev_data(
+            "n40w106", [39.5, 41.5, 39.5], [-105.5, -105.5, -107.5], self.db_path
+        )
+
+        self.assertFalse(np.isnan(elevation_ft[0]))
+        self.assertTrue(np.isnan(elevation_ft[1]))
+        self.assertTrue(np.isnan(elevation_ft[2]))
+
+    def test_cache_reuses_datasets_and_blocks(self):
+        """
+        A second lookup of the same trace is served from the cache
+        """
+        cache = RasterCache()
+        emodel = USGSLocal(self.db_path, cache=cache)
+
+        first = emodel.get_elevation(COORDS)
+        misses = cache.stats.block_misses
+        second = emodel.get_elevation(COORDS)
+
+        np.testing.assert_array_equal(first, second)
+        self.assertEqual(cache.stats.dataset_misses, 1)
+        self.assertEqual(cache.stats.block_misses, misses)
+        self.assertEqual(cache.stats.block_hits, misses)
+
+    def test_cache_respects_byte_budget(self):
+        """
+        Least recently used blocks are evicted to stay under the budget
+        """
+        block_bytes = 256 * 256 * 4
+        cache = RasterCache(max_bytes=block_bytes)
+        emodel = USGSLocal(self.db_path, cache=cache)
+
+        elevation_ft = emodel.get_elevation(COORDS)
+
+        np.testing.assert_allclose(elevation_ft, synthetic_pixel_elevation_ft(LATS, LONS))
+        self.assertLessEqual(cache.nbytes, block_bytes)
+        self.assertEqual(cache.stats.block_evictions, cache.stats.block_misses - 1)
+
+    def test_evicted_dataset_stays_open_while_leased(self):
+        """
+        A dataset evicted while another reader holds it is closed only once
+        that reader is done with it
+        """
+        cache = RasterCache(max_datasets=1)
+        first_tile = self.db_path / "n40w106/USGS_13_n40w106.tif"
+        second_tile = self.db_path / "n41w106/USGS_13_n41w106.tif"
+
+        with cache.dataset(first_tile) as (first, _):
+            with cache.dataset(second_tile):
+                pass
+            self.assertEqual(cache.stats.dataset_evictions, 1)
+            self.assertFalse(first.closed)
+            first.read(1, window=((0, 1), (0, 1)))
+        self.assertTrue(first.closed)
+
+    def test_concurrent_lookups_across_more_tiles_than_datasets(self):
+        """
+        Threads reading more tiles than the cache keeps open, so that
+        datasets are evicted mid-read, all get the right elevation
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        lats = np.tile([39.5, 40.5], 50) + np.linspace(0, 0.4, 100)
+        lons = np.full(100, -105.5)
+        cache = RasterCache(max_bytes=0, max_datasets=1)
+        emodel = USGSLocal(self.db_path, cache=cache)
+
+        with ThreadPoolExecutor(8) as pool:
+            results = list(
+                pool.map(
+                    lambda i: emodel.get_elevation_array(lats[i : i + 2], lons[i : i + 2]),
+                    range(0, 100, 2),
+                )
+            )
+
+        np.testing.assert_allclose(
+            np.concatenate(results), synthetic_pixel_elevation_ft(lats, lons)
+        )
+        self.assertGreater(cache.stats.dataset_evictions, 0)
+
+    def test_profile_across_tiles_keeps_order(self):
+        """
+        Points interleaved across tiles come back in query order
+        """
+        lats = np.array([39.5, 40.5, 39.6, 40.6, 39.7])
+        lons = np.array([-105.5, -105.5, -105.4, -105.4, -105.3])
+        coords = [Coordinate.from_lat_lon(lat, lon) for lat, lon in zip(lats, lons)]
+
+        elevation_ft = USGSLocal(self.db_path).get_elevation(coords)
+
+        np.testing.assert_allclose(elevation_ft, synthetic_pixel_elevation_ft(lats, lons))
+
+
+class GridRefTest(unittest.TestCase):
+    def test_build_grid_refs(self):
+        lats = [39.5, 40.2, -3.0, 39.1]
+        lons = [-105.2, -99.1, -100.0, -105.9]
+
+        self.assertEqual(build_grid_refs(lats, lons), ["n40w106", "n41w100", "0", "n40w106"])
+        np.testing.assert_array_equal(build_grid_keys(lats, lons), [40106, 41100, -1, 40106])
+
+
 if __name__ == "__main__":
     unittest.main(warnings="ignore")
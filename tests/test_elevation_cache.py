@@ -0,0 +1,93 @@
+import sqlite3
+import tempfile
+import unittest
+from contextlib import closing
+from pathlib import Path
+
+import numpy as np
+
+from gradeit.elevation.elevation_cache import CachedElevationModel, ElevationCache
+from gradeit.elevation.elevation_model import ElevationModel
+from gradeit.testing import synthetic_elevation_m
+
+LATS = np.linspace(39.702730, 39.695368, 10)
+LONS = np.linspace(-105.245678, -105.209049, 10)
+
+
+class CountingModel(ElevationModel):
+    def __init__(self):
+        self.queried = 0
+
+    def get_elevation(self, trace):
+        self.queried += len(trace)
+        return [float(synthetic_elevation_m(c.latitude, c.longitude)) for c in trace]
+
+
+class ElevationCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_path = Path(self.tmpdir.name) / "elevation.sqlite"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_get_put_roundtrip(self):
+        cache = ElevationCache(self.cache_path)
+        cache.put_many(LATS[:5], LONS[:5], np.arange(5.0))
+
+        elevation = cache.get_many(LATS, LONS)
+
+        np.testing.assert_array_equal(elevation[:5], np.arange(5.0))
+        self.assertTrue(np.isnan(elevation[5:]).all())
+        self.assertEqual(len(ElevationCache(self.cache_path)), 5)
+
+    def test_evicts_least_recently_used(self):
+        now = [1000.0]
+        cache = ElevationCache(
+            self.cache_path, max_entries=4, touch_interval_s=60.0, clock=lambda: now[0]
+        )
+        cache.put_many(LATS[:4], LONS[:4], np.arange(4.0))
+        now[0] += 100
+        cache.get_many(LATS[2:4], LONS[2:4])
+        now[0] += 100
+        cache.put_many(LATS[4:6], LONS[4:6], np.arange(4.0, 6.0))
+
+        elevation = cache.get_many(LATS[:6], LONS[:6])
+
+        self.assertEqual(len(cache), 4)
+        self.assertTrue(np.isnan(elevation[:2]).all())
+        np.testing.assert_array_equal(elevation[2:6], np.arange(2.0, 6.0))
+
+    def test_reads_only_touch_stale_entries(self):
+        now = [1000.0]
+        cache = ElevationCache(self.cache_path, touch_interval_s=60.0, clock=lambda: now[0])
+        cache.put_many(LATS[:2], LONS[:2], np.arange(2.0))
+
+        def accessed():
+            with closing(sqlite3.connect(str(self.cache_path))) as conn:
+                return [row[0] for row in conn.execute("SELECT accessed FROM elevation")]
+
+        # a recent entry is read without writing its access time
+        now[0] += 30
+        cache.get_many(LATS[:2], LONS[:2])
+        self.assertEqual(accessed(), [1000.0, 1000.0])
+
+        now[0] += 60
+        cache.get_many(LATS[:1], LONS[:1])
+        self.assertEqual(sorted(accessed()), [1000.0, 1090.0])
+
+    def test_wrapper_only_queries_misses(self):
+        model = CountingModel()
+        cached = CachedElevationModel(model, ElevationCache(self.cache_path))
+
+        first = cached.get_elevation_array(LATS[:6], LONS[:6])
+        second = cached.get_elevation_array(LATS, LONS)
+        repeated = cached.get_elevation_array(np.repeat(LATS, 3), np.repeat(LONS, 3))
+
+        self.assertEqual(model.queried, len(LATS))
+        np.testing.assert_array_equal(second[:6], first)
+        np.testing.assert_array_equal(repeated, np.repeat(second, 3))
+
+
+if __name__ == "__main__":
+    unittest.main(warnings="ignore")
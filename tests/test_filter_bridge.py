@@ -0,0 +1,85 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from gradeit.elevation.elevation_model import ElevationModel
+from gradeit.filter_bridge import BridgeParams, bridge_mask, find_bridges, gradeCorrection_bridge
+from gradeit.grade import get_distances
+from gradeit.gradeit import gradeit
+from gradeit.trace import Trace
+
+
+class ProfileModel(ElevationModel):
+    """
+    Returns an elevation profile that follows the given grade
+    """
+
+    def __init__(self, grade):
+        self.grade = grade
+
+    def get_elevation(self, trace):
+        distances = get_distances(Trace.from_coordinates(trace))
+        return list(1000 + np.append(0, np.cumsum(self.grade[1:] * distances)))
+
+
+class BridgeFilterTest(unittest.TestCase):
+    def setUp(self):
+        # a river crossing: steep descent, a flat DEM valley floor, steep ascent;
+        # later a long flat stretch with gentle approaches and a short flat blip
+        self.grade = np.concatenate(
+            [
+                np.full(50, 0.01),
+                np.full(30, -0.08),
+                np.zeros(40),
+                np.full(30, 0.08),
+                np.full(100, 0.01),
+                np.zeros(40),
+                np.full(100, 0.01),
+                np.zeros(2),
+                np.full(50, 0.01),
+            ]
+        )
+        self.distances_ft = np.append(0, np.full(len(self.grade) - 1, 10.0))
+        self.params = BridgeParams(extension_mi=0.05, min_length_ft=120, apply_to_filtered=False)
+
+    def test_find_bridges(self):
+        bridges = find_bridges(self.grade, np.cumsum(self.distances_ft), self.params)
+
+        # the valley floor spans positions 80-119, extended by 264 ft each way
+        np.testing.assert_array_equal(bridges, [[54, 146]])
+
+    def test_short_bridges_are_ignored(self):
+        params = BridgeParams(extension_mi=0.05, min_length_ft=400)
+
+        bridges = find_bridges(self.grade, np.cumsum(self.distances_ft), params)
+
+        self.assertEqual(len(bridges), 0)
+
+    def test_bridge_mask(self):
+        mask = bridge_mask(10, np.array([[1, 3], [2, 5], [8, 10]]))
+
+        np.testing.assert_array_equal(mask, [0, 1, 1, 1, 1, 0, 0, 0, 1, 1])
+
+    def test_grade_correction_bridge(self):
+        df = pd.DataFrame({"grade_dec_unfiltered": self.grade, "distances_ft": self.distances_ft})
+
+        corrected = gradeCorrection_bridge(df.copy(), [0.05, 120, False])
+
+        expected = self.grade.copy()
+        expected[54:146] = 0
+        np.testing.assert_array_equal(corrected.grade_dec_unfiltered, expected)
+
+    def test_gradeit_bridge_stage(self):
+        lats = 39.0 + np.arange(len(self.grade)) * 10 / 364000
+        df = pd.DataFrame({"latitude": lats, "longitude": np.full(len(lats), -105.0)})
+
+        graded = gradeit(df, elevation_model=ProfileModel(self.grade), bridge_params=self.params)
+
+        np.testing.assert_array_equal(graded.grade_dec_unfiltered.values[54:146], 0)
+        self.assertTrue((graded.grade_dec_unfiltered.values[1:50] > 0).all())
+        self.assertTrue((graded.grade_dec_unfiltered.values[146:] != 0).any())
+
+
+if __name__ == "__main__":
+    unittest.main(warnings="ignore")
@@ -0,0 +1,172 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+from scipy import signal
+
+from gradeit.elevation.elevation_model import ElevationModel
+from gradeit.elevation.filtering import (
+    SegmentParams,
+    check_sg,
+    check_sg_segments,
+    elevation_filter,
+    find_segments,
+    savgol_segments,
+    segmented_elevation_filter,
+)
+from gradeit.grade import get_distances
+from gradeit.gradeit import gradeit
+from gradeit.trace import Trace
+
+# a 1 Hz drive with a tunnel (a 3000 ft jump) in the middle
+N = 400
+LATS = 39.5 + np.concatenate([np.arange(200), np.arange(200, 400) + 10]) * 3e-4
+LONS = np.full(N, -105.5)
+
+
+class SurfaceModel(ElevationModel):
+    """
+    A rolling profile with a few points outside of the data (nan)
+    """
+
+    def get_elevation(self, trace):
+        lats = np.array([c.latitude for c in trace])
+        elevation = 5000 + 2000 * np.sin(lats * 30) + 10 * np.sin(lats * 3000)
+        elevation[(lats > 39.53) & (lats < 39.532)] = np.nan
+        return list(elevation)
+
+
+class SegmentedFilterTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.values = np.cumsum(rng.normal(size=N))
+        self.trace = Trace.from_lat_lon(LATS, LONS)
+        self.distances = get_distances(self.trace)
+
+    def test_check_sg_segments_matches_check_sg(self):
+        rng = np.random.default_rng(2)
+        for sg_window in [0, 2, 3, 17, 101]:
+            n_points = rng.integers(2, 300, 50)
+            lengths = rng.uniform(1, 50, 50) * n_points
+            expected = [
+                check_sg(sg_window, list(np.linspace(0, length, n)))
+                for length, n in zip(lengths, n_points)
+            ]
+            np.testing.assert_array_equal(check_sg_segments(sg_window, lengths, n_points), expected)
+
+    def test_windows_fit_their_segments(self):
+        # 14 points over 12500 ft: the default window rounds up to 15
+        np.testing.assert_array_equal(check_sg_segments(0, [12500, 13000], [14, 15]), [13, 15])
+        # polyorder 3 needs a window of at least 5
+        np.testing.assert_array_equal(check_sg_segments(3, [12500], [14]), [13])
+        np.testing.assert_array_equal(check_sg_segments(17, [12500, 100], [14, 4]), [13, 3])
+
+    def test_even_segment_at_the_end(self):
+        # 14 points ~960 ft apart, the last segment of the trace
+        lats = np.concatenate([LATS[:50], LATS[49] + 0.00264 * np.arange(1, 15)])
+        trace = Trace.from_lat_lon(lats, np.full(64, -105.5))
+        values = self.values[:64].copy()
+        values[49] = np.nan
+
+        filtered = segmented_elevation_filter(values, trace, 0, get_distances(trace))
+
+        np.testing.assert_allclose(
+            filtered[50:], signal.savgol_filter(values[50:], 13, 3), rtol=1e-9
+        )
+
+    def test_even_segment_in_the_middle(self):
+        lats = np.concatenate(
+            [LATS[:50], LATS[49] + 0.00264 * np.arange(1, 15), LATS[50:100] + 0.04]
+        )
+        trace = Trace.from_lat_lon(lats, np.full(114, -105.5))
+        distances = get_distances(trace)
+        values = self.values[:114].copy()
+        values[[49, 64]] = np.nan
+        other = values.copy()
+        other[65:] += 100.0
+
+        filtered = segmented_elevation_filter(values, trace, 0, distances)
+        filtered_other = segmented_elevation_filter(other, trace, 0, distances)
+
+        # the segment does not read its neighbour
+        np.testing.assert_array_equal(filtered[50:64], filtered_other[50:64])
+        np.testing.assert_allclose(
+            filtered[50:64], signal.savgol_filter(values[50:64], 13, 3), rtol=1e-9
+        )
+
+    def test_savgol_segments_matches_savgol_filter(self):
+        starts = np.array([0, 3, 60, 250])
+        stops = np.array([3, 60, 250, N])
+        windows = np.array([3, 17, 41, 17])
+
+        filtered = savgol_segments(self.values, starts, stops, windows)
+
+        # too short to filter
+        np.testing.assert_array_equal(filtered[:3], self.values[:3])
+        for start, stop, window in zip(starts[1:], stops[1:], windows[1:]):
+            np.testing.assert_allclose(
+                filtered[start:stop],
+                signal.savgol_filter(self.values[start:stop], window, 3),
+                rtol=1e-9,
+            )
+
+    def test_find_segments(self):
+        values = self.values.copy()
+        values[50:55] = np.nan
+        timestamps = np.arange(N, dtype=np.float64)
+        timestamps[300:] += 60
+
+        starts, stops = find_segments(values, self.distances, timestamps, trace_starts=[100])
+
+        np.testing.assert_array_equal(starts, [0, 55, 100, 200, 300])
+        np.testing.assert_array_equal(stops, [50, 100, 200, 300, N])
+
+    def test_gaps_are_filtered_separately(self):
+        values = self.values.copy()
+        values[50:55] = np.nan
+
+        filtered = segmented_elevation_filter(values, self.trace, 17, self.distances)
+
+        self.assertTrue(np.isnan(filtered[50:55]).all())
+        self.assertEqual(np.isnan(filtered).sum(), 5)
+        for start, stop in [(0, 50), (55, 200), (200, N)]:
+            np.testing.assert_allclose(
+                filtered[start:stop], signal.savgol_filter(values[start:stop], 17, 3), rtol=1e-9
+            )
+
+    def test_without_gaps_matches_elevation_filter(self):
+        trace = self.trace[:200]
+        distances = self.distances[:199]
+        for sg_window in [0, 17]:
+            np.testing.assert_allclose(
+                segmented_elevation_filter(self.values[:200], trace, sg_window, distances),
+                elevation_filter(self.values[:200], trace, sg_window, distances),
+                rtol=1e-9,
+            )
+
+    def test_gradeit_segment_params(self):
+        df = pd.DataFrame(
+            {
+                "latitude": LATS,
+                "longitude": LONS,
+                "time": pd.date_range("2024-01-01", periods=N, freq="1s", tz="UTC"),
+            }
+        )
+
+        graded = gradeit(
+            df,
+            filtering=True,
+            elevation_model=SurfaceModel(),
+            segment_params=SegmentParams(time_col="time"),
+        )
+
+        missing = np.isnan(graded["elevation_ft"].values)
+        self.assertTrue(missing.any())
+        np.testing.assert_array_equal(np.isnan(graded["elevation_ft_filtered"].values), missing)
+        # the filtered profile stays close to the data at the tunnel portals
+        error = np.abs(graded["elevation_ft_filtered"] - graded["elevation_ft"])
+        self.assertLess(error[195:205].max(), 20)
+
+
+if __name__ == "__main__":
+    unittest.main(warnings="ignore")
@@ -5,6 +5,7 @@ import pandas as pd
 
 from gradeit import grade
 from gradeit.coordinate import Coordinate
+from gradeit.trace import Trace
 
 
 class GradeTest(unittest.TestCase):
@@ -70,6 +71,24 @@ class GradeTest(unittest.TestCase):
 
         self.assertEqual(dist, self.expected_dist_km)
 
+    def test_haversine_bearing(self):
+        dist, bearing = grade.haversine(self.coord1, self.coord2, get_bearing=True)
+
+        self.assertEqual(dist, self.expected_dist_km)
+        self.assertAlmostEqual(bearing, self.expected_bearing_deg, places=2)
+
+    def test_haversine_array_matches_scalar(self):
+        lats = self.data.lat.values
+        lons = self.data.lon.values
+        dist, bearing = grade.haversine_array(lats, lons, get_bearing=True)
+
+        for i in range(len(lats) - 1):
+            coord1 = Coordinate.from_lat_lon(lats[i], lons[i])
+            coord2 = Coordinate.from_lat_lon(lats[i + 1], lons[i + 1])
+            expected_dist, expected_bearing = grade.haversine(coord1, coord2, get_bearing=True)
+            self.assertEqual(dist[i], expected_dist)
+            self.assertAlmostEqual(bearing[i], expected_bearing)
+
     def test_get_distances(self):
         coordinates = [
             Coordinate.from_lat_lon(lat, lon)
@@ -90,6 +109,37 @@ class GradeTest(unittest.TestCase):
         np.testing.assert_array_equal(dist_arr, self.data.dist_ft[1:])
         np.testing.assert_array_equal(grade_arr, self.data.grade_dec)
 
+    def test_get_grade_fills_undefined(self):
+        elevation = [100.0, 101.0, 101.0, 101.0, 103.0, np.nan, 104.0]
+        distances = [10.0, 0.0, 0.0, 20.0, 10.0, 10.0]
+
+        grade_arr = grade.get_grade(elevation, distances)
+
+        np.testing.assert_array_equal(grade_arr, [0.0, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1])
+
+    def test_get_grade_float32(self):
+        grade_arr = grade.get_grade(self.data.elev_ft, self.data.dist_ft[1:], dtype=np.float32)
+
+        self.assertEqual(grade_arr.dtype, np.float32)
+        np.testing.assert_allclose(grade_arr, self.data.grade_dec, rtol=1e-6)
+
+    def test_get_distances_from_trace(self):
+        trace = Trace.from_lat_lon(self.data.lat.values, self.data.lon.values)
+        dist_arr = grade.get_distances(trace)
+
+        np.testing.assert_array_equal(dist_arr, np.array(self.data.dist_ft[1:]))
+
+    def test_trace_coordinate_view(self):
+        trace = Trace.from_lat_lon(self.data.lat.values, self.data.lon.values)
+
+        self.assertEqual(len(trace), len(self.data))
+        self.assertEqual(trace[1].latitude, self.data.lat[1])
+        self.assertEqual(trace[1].longitude, self.data.lon[1])
+        self.assertEqual(len(trace[2:5]), 3)
+        roundtrip = Trace.from_coordinates(trace.to_coordinates())
+        np.testing.assert_array_equal(roundtrip.latitude, trace.latitude)
+        np.testing.assert_array_equal(roundtrip.longitude, trace.longitude)
+
 
 if __name__ == "__main__":
     unittest.main(warnings="ignore")
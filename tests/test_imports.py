@@ -0,0 +1,92 @@
+import json
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from gradeit import repo_root
+from gradeit.elevation.manifest import TileManifest
+from gradeit.elevation.raster_cache import RasterCache
+from gradeit.elevation.tile_store import compile_tile
+from gradeit.elevation.usgs_local import sample_raster
+from gradeit.testing import write_synthetic_tile
+
+# third-party packages that are slow to import and only needed by some
+# backends and stages
+HEAVY_MODULES = ["pandas", "scipy", "shapely", "rasterio", "requests", "aiohttp"]
+
+
+def imported_after(code: str):
+    """
+    Run code in a fresh interpreter and return the heavy modules it imported
+    """
+    script = (
+        f"import sys\n{code}\n"
+        "import json\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=repo_root(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+class LazyImportTest(unittest.TestCase):
+    def test_modules_import_no_heavy_dependencies(self):
+        for module in [
+            "gradeit.gradeit",
+            "gradeit.grade",
+            "gradeit.elevation.filtering",
+            "gradeit.elevation.usgs_api",
+            "gradeit.elevation.usgs_local",
+            "gradeit.elevation.tiered",
+            "gradeit.elevation.async_usgs_api",
+        ]:
+            with self.subTest(module=module):
+                self.assertEqual(imported_after(f"import {module}"), [])
+
+    def test_api_model_does_not_load_rasterio(self):
+        imported = imported_after(
+            "from gradeit.gradeit import build_elevation_model\n"
+            "build_elevation_model('usgs-api')"
+        )
+        self.assertEqual(imported, ["requests"])
+
+    def test_get_grade_loads_nothing(self):
+        imported = imported_after(
+            "from gradeit.grade import get_distances, get_grade\n"
+            "from gradeit.trace import Trace\n"
+            "trace = Trace.from_lat_lon([39.70, 39.71, 39.72], [-105.2, -105.2, -105.2])\n"
+            "get_grade([5000.0, 5010.0, 5030.0], get_distances(trace))"
+        )
+        self.assertEqual(imported, [])
+
+
+class MissingRasterioTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tile_path = write_synthetic_tile(self.tmpdir.name, "n40w106")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_local_lookups_ask_for_the_local_extra(self):
+        # None in sys.modules makes the import fail as if rasterio were not installed
+        with patch.dict(sys.modules, {"rasterio": None, "rasterio.windows": None}):
+            for name, use in [
+                ("lookup", lambda: sample_raster(self.tile_path, [39.5], [-105.5], RasterCache())),
+                ("manifest", lambda: TileManifest.build(self.tmpdir.name)),
+                ("compile", lambda: compile_tile(self.tile_path, self.tmpdir.name)),
+            ]:
+                with self.subTest(name), self.assertRaises(ImportError) as raised:
+                    use()
+                self.assertIn("pip install 'gradeit[local]'", str(raised.exception))
+
+
+if __name__ == "__main__":
+    unittest.main(warnings="ignore")
@@ -0,0 +1,70 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from gradeit.elevation.raster_cache import RasterCache
+from gradeit.elevation.usgs_api import USGSApi
+from gradeit.elevation.usgs_local import USGSLocal
+from gradeit.filter_bridge import BridgeParams
+from gradeit.gradeit import gradeit
+from gradeit.instrumentation import NULL_METRICS, CallbackMetrics, RecordingMetrics
+from gradeit.testing import FakeEPQSServer, write_synthetic_tile
+
+LATS = np.linspace(39.702730, 39.695368, 10)
+LONS = np.linspace(-105.245678, -105.209049, 10)
+
+
+class InstrumentationTest(unittest.TestCase):
+    def test_gradeit_stages_and_raster_counters(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            write_synthetic_tile(Path(tmpdir), "n40w106")
+            metrics = RecordingMetrics()
+            model = USGSLocal(tmpdir, cache=RasterCache(), metrics=metrics)
+            df = pd.DataFrame({"latitude": LATS, "longitude": LONS})
+
+            gradeit(
+                df,
+                filtering=True,
+                des_sg=5,
+                elevation_model=model,
+                bridge_params=BridgeParams(),
+                metrics=metrics,
+            )
+
+        for stage in ["trace", "elevation", "distance", "grade", "filter", "bridge"]:
+            self.assertEqual(metrics.calls[f"gradeit.{stage}"], 1)
+        self.assertEqual(metrics.calls["elevation.local"], 1)
+        self.assertEqual(metrics.counters["gradeit.points"], 10)
+        self.assertEqual(metrics.counters["elevation.local.points"], 10)
+        self.assertEqual(metrics.counters["raster.tiles_opened"], 1)
+        self.assertGreater(metrics.counters["raster.bytes_read"], 0)
+        self.assertIn("gradeit.elevation", metrics.summary())
+
+    def test_api_counters(self):
+        counts = {}
+        timings = []
+        metrics = CallbackMetrics(
+            on_timing=lambda stage, seconds: timings.append(stage),
+            on_count=lambda name, value: counts.update({name: counts.get(name, 0) + value}),
+        )
+        with FakeEPQSServer(fail_first=1) as server:
+            model = USGSApi(max_in_flight=1, backoff=0.0, url=server.url, metrics=metrics)
+            model.get_elevation_array(LATS[:3], LONS[:3])
+
+        self.assertEqual(timings, ["elevation.api"])
+        self.assertEqual(counts["api.requests"], 4)
+        self.assertEqual(counts["api.retries"], 1)
+        self.assertEqual(counts["elevation.api.points"], 3)
+
+    def test_null_metrics_is_disabled(self):
+        self.assertFalse(NULL_METRICS.enabled)
+        with NULL_METRICS.timer("stage") as timer:
+            pass
+        self.assertEqual(timer.start, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+import rasterio as rio
+from rasterio.transform import from_origin
+
+from gradeit.elevation.manifest import MANIFEST_NAME, TileManifest
+from gradeit.elevation.usgs_local import USGSLocal
+from gradeit.testing import (
+    synthetic_elevation_m,
+    synthetic_pixel_elevation_ft,
+    write_synthetic_tile,
+)
+
+
+def write_quarter_degree_tile(path, west, north, pixels_per_degree=1000):
+    # a tile that does not follow the 1x1 degree n##w### layout
+    pixel = 1.0 / pixels_per_degree
+    size = pixels_per_degree // 4
+    centers = (np.arange(size) + 0.5) * pixel
+    elevation = synthetic_elevation_m((north - centers)[:, None], (west + centers)[None, :])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with rio.open(
+        path,
+        "w",
+        driver="GTiff",
+        height=size,
+        width=size,
+        count=1,
+        dtype="float32",
+        crs="EPSG:4269",
+        transform=from_origin(west, north, pixel, pixel),
+    ) as dst:
+        dst.write(elevation.astype(np.float32), 1)
+
+
+class ManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmpdir.name)
+        write_synthetic_tile(self.db_path, "n40w106")
+        write_synthetic_tile(self.db_path, "n41w106")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_locate_standard_layout(self):
+        manifest = TileManifest.load(self.db_path)
+        self.assertTrue((self.db_path / MANIFEST_NAME).exists())
+        self.assertEqual(manifest.tiles[0].block_shape, [256, 256])
+
+        lats = np.array([39.5, 40.5, 39.9999, 35.5, np.nan])
+        lons = np.array([-105.5, -105.5, -105.0001, -100.5, -105.5])
+        paths = [manifest.tiles[i].path if i >= 0 else None for i in manifest.locate(lats, lons)]
+        self.assertEqual(
+            paths,
+            ["n40w106/USGS_13_n40w106.tif", "n41w106/USGS_13_n41w106.tif"]
+            + ["n40w106/USGS_13_n40w106.tif", None, None],
+        )
+
+        coverage = manifest.coverage(lats, lons)
+        self.assertFalse(coverage.complete)
+        self.assertEqual(len(coverage.tiles), 2)
+        self.assertEqual(coverage.uncovered.tolist(), [3, 4])
+        self.assertEqual(coverage.missing_grid_refs, ["n36w101"])
+
+    def test_load_refreshes_changed_tiles(self):
+        manifest = TileManifest.load(self.db_path)
+        self.assertEqual(len(manifest.tiles), 2)
+
+        write_synthetic_tile(self.db_path, "n40w105")
+        manifest = TileManifest.load(self.db_path)
+        self.assertEqual(len(manifest.tiles), 3)
+        tile = manifest.tiles[manifest.locate([39.5], [-104.5])[0]]
+        self.assertEqual(tile.path, "n40w105/USGS_13_n40w105.tif")
+
+    def test_failed_save_keeps_the_old_manifest(self):
+        TileManifest.load(self.db_path)
+        manifest_path = self.db_path / MANIFEST_NAME
+        contents = manifest_path.read_text()
+
+        def write_part(obj, f):
+            f.write(json.dumps(obj)[:10])
+            raise OSError("no space left on device")
+
+        write_synthetic_tile(self.db_path, "n40w105")
+        with patch("gradeit.elevation.manifest.json.dump", write_part), self.assertLogs(
+            "gradeit.elevation.manifest", "WARNING"
+        ):
+            TileManifest.load(self.db_path)
+
+        self.assertEqual(manifest_path.read_text(), contents)
+        self.assertEqual([p.name for p in self.db_path.glob(".*")], [MANIFEST_NAME])
+        self.assertEqual(len(TileManifest.load(self.db_path).tiles), 3)
+
+    def test_model_with_manifest(self):
+        write_quarter_degree_tile(self.db_path / "custom" / "quarter.tif", west=-100.0, north=35.0)
+        model = USGSLocal(self.db_path, manifest=TileManifest.load(self.db_path))
+
+        lats = np.array([39.5, 34.9, 34.5, 40.5])
+        lons = np.array([-105.5, -99.9, -99.9, -105.6])
+        elevation = model.get_elevation_array(lats, lons)
+
+        expected = synthetic_pixel_elevation_ft(lats, lons)
+        np.testing.assert_allclose(elevation[[0, 1, 3]], expected[[0, 1, 3]])
+        # the point south of the quarter degree tile is not covered
+        self.assertTrue(np.isnan(elevation[2]))
+
+    def test_model_outside_the_western_northern_hemisphere(self):
+        write_quarter_degree_tile(self.db_path / "custom" / "east.tif", west=144.0, north=-37.0)
+        model = USGSLocal(self.db_path, manifest=TileManifest.load(self.db_path))
+
+        lats = np.array([-37.1, -37.2, 39.5])
+        lons = np.array([144.1, 144.2, -105.5])
+        elevation = model.get_elevation_array(lats, lons)
+
+        np.testing.assert_allclose(elevation, synthetic_pixel_elevation_ft(lats, lons))
+
+
+if __name__ == "__main__":
+    unittest.main()
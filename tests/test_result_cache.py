@@ -0,0 +1,158 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from gradeit.elevation.elevation_model import ElevationModel
+from gradeit.elevation.manifest import TileManifest
+from gradeit.elevation.tile_store import USGSCompiled, compile_tile
+from gradeit.elevation.usgs_local import USGSLocal
+from gradeit.filter_bridge import BridgeParams
+from gradeit.gradeit import gradeit
+from gradeit.instrumentation import RecordingMetrics
+from gradeit.result_cache import ResultCache
+from gradeit.testing import synthetic_elevation_m, write_synthetic_tile
+
+LATS = np.linspace(39.702730, 39.695368, 40)
+LONS = np.linspace(-105.245678, -105.209049, 40)
+
+
+class CountingModel(ElevationModel):
+    source_id = "counting"  # type: ignore[assignment]
+
+    def __init__(self):
+        self.queried = 0
+
+    def get_elevation(self, trace):
+        self.queried += len(trace)
+        return [float(synthetic_elevation_m(c.latitude, c.longitude)) for c in trace]
+
+
+def trip(offset: float = 0.0) -> pd.DataFrame:
+    return pd.DataFrame({"latitude": LATS + offset, "longitude": LONS})
+
+
+class ResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_path = Path(self.tmpdir.name) / "results"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_hit_skips_grading(self):
+        cache = ResultCache(self.cache_path)
+        model = CountingModel()
+        options = dict(
+            elevation_model=model, filtering=True, des_sg=5, bridge_params=BridgeParams()
+        )
+
+        first = gradeit(trip(), result_cache=cache, **options)
+        metrics = RecordingMetrics()
+        second = gradeit(trip(), result_cache=cache, metrics=metrics, **options)
+
+        pd.testing.assert_frame_equal(first, second)
+        self.assertEqual(model.queried, len(LATS))
+        self.assertEqual((cache.stats.hits, cache.stats.misses, cache.stats.writes), (1, 1, 1))
+        self.assertEqual(metrics.counters["result_cache.hits"], 1)
+        self.assertNotIn("gradeit.elevation", metrics.seconds)
+
+    def test_key_covers_points_and_options(self):
+        cache = ResultCache(self.cache_path)
+        model = CountingModel()
+
+        gradeit(trip(), elevation_model=model, result_cache=cache)
+        gradeit(trip(0.001), elevation_model=model, result_cache=cache)
+        gradeit(trip(), elevation_model=model, filtering=True, result_cache=cache)
+        gradeit(trip(), elevation_model=model, filtering=True, des_sg=5, result_cache=cache)
+        # des_sg does not matter without filtering
+        gradeit(trip(), elevation_model=model, des_sg=5, result_cache=cache)
+
+        self.assertEqual(cache.stats.misses, 4)
+        self.assertEqual(cache.stats.hits, 1)
+
+    def test_tile_changes_invalidate(self):
+        db_path = Path(self.tmpdir.name) / "tiles"
+        write_synthetic_tile(db_path, "n40w106")
+        cache = ResultCache(self.cache_path)
+
+        model = USGSLocal(db_path, manifest=TileManifest.load(db_path))
+        gradeit(trip(), elevation_model=model, result_cache=cache)
+        gradeit(trip(), elevation_model=model, result_cache=cache)
+        self.assertEqual(cache.stats.hits, 1)
+
+        write_synthetic_tile(db_path, "n41w106")
+        model = USGSLocal(db_path, manifest=TileManifest.load(db_path))
+        gradeit(trip(), elevation_model=model, result_cache=cache)
+        self.assertEqual(cache.stats.misses, 2)
+
+    def test_tile_replaced_in_place_invalidates(self):
+        db_path = Path(self.tmpdir.name) / "tiles"
+        tile_path = write_synthetic_tile(db_path, "n40w106")
+        store_path = Path(self.tmpdir.name) / "compiled"
+        compile_tile(tile_path, store_path)
+        cache = ResultCache(self.cache_path)
+
+        models = [USGSLocal(db_path), USGSCompiled(store_path)]
+        for model in models:
+            gradeit(trip(), elevation_model=model, result_cache=cache)
+            gradeit(trip(), elevation_model=model, result_cache=cache)
+        self.assertEqual((cache.stats.hits, cache.stats.misses), (2, 2))
+
+        # replace the tile, and then its compiled copy, with a newer one
+        write_synthetic_tile(db_path, "n40w106")
+        for path in [tile_path, *store_path.rglob("*.bin")]:
+            stat = path.stat()
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        # the models only scan their tiles once, until they are refreshed
+        for model in models:
+            gradeit(trip(), elevation_model=model, result_cache=cache)
+        self.assertEqual((cache.stats.hits, cache.stats.misses), (4, 2))
+        for model in models:
+            model.refresh()
+            gradeit(trip(), elevation_model=model, result_cache=cache)
+        self.assertEqual((cache.stats.hits, cache.stats.misses), (4, 4))
+
+    def test_model_without_source_id(self):
+        class AnonymousModel(CountingModel):
+            source_id = None  # type: ignore[assignment]
+
+        with self.assertRaises(ValueError):
+            gradeit(
+                trip(), elevation_model=AnonymousModel(), result_cache=ResultCache(self.cache_path)
+            )
+
+    def test_evicts_by_age_and_size(self):
+        columns = {"elevation_ft": np.arange(1000.0)}
+        cache = ResultCache(self.cache_path, max_age_s=3600)
+        cache.put("a" * 64, columns)
+        entry = next(self.cache_path.glob("*/*.npz"))
+        old = time.time() - 7200
+        os.utime(entry, (old, old))
+
+        self.assertIsNone(cache.get("a" * 64))
+        self.assertFalse(entry.exists())
+
+        entry_bytes = 8000 + 1000  # the array plus the npz overhead, roughly
+        cache = ResultCache(self.cache_path, max_bytes=3 * entry_bytes)
+        for i, key in enumerate(["b", "c", "d"]):
+            cache.put(key * 64, columns)
+            os.utime(self.cache_path / (key * 2) / f"{key * 64}.npz", (1000.0 + i, time.time()))
+        # reading "b" makes "c" the least recently used
+        np.testing.assert_array_equal(cache.get("b" * 64)["elevation_ft"], columns["elevation_ft"])
+        cache.put("e" * 64, columns)
+
+        self.assertIsNone(cache.get("c" * 64))
+        self.assertIsNotNone(cache.get("e" * 64))
+        self.assertLessEqual(
+            sum(p.stat().st_size for p in self.cache_path.glob("*/*.npz")), 3 * entry_bytes
+        )
+
+
+if __name__ == "__main__":
+    unittest.main(warnings="ignore")
@@ -0,0 +1,198 @@
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from gradeit.coordinate import Coordinate
+from gradeit.elevation.coalescing import CoalescingElevationModel
+from gradeit.elevation.elevation_model import ElevationModel
+from gradeit.elevation.raster_cache import RasterCache
+from gradeit.elevation.usgs_local import USGSLocal
+from gradeit.gradeit import gradeit
+from gradeit.server import GradeClient, GradeServer, main
+from gradeit.testing import synthetic_pixel_elevation_ft, write_synthetic_tile
+
+LATS = np.linspace(39.702730, 39.695368, 10)
+LONS = np.linspace(-105.245678, -105.209049, 10)
+
+
+class SlowModel(ElevationModel):
+    """
+    Records the size of every lookup and takes a while to answer
+    """
+
+    def __init__(self):
+        self.calls: List[int] = []
+
+    def get_elevation(self, trace: List[Coordinate]) -> List[float]:
+        self.calls.append(len(trace))
+        time.sleep(0.05)
+        return [c.latitude + c.longitude for c in trace]
+
+
+class CoalescingTest(unittest.TestCase):
+    def test_concurrent_lookups_are_batched(self):
+        slow = SlowModel()
+        model = CoalescingElevationModel(slow, n_workers=1)
+        try:
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                results = list(
+                    pool.map(lambda i: model.get_elevation_array(LATS + i, LONS), range(8))
+                )
+        finally:
+            model.close()
+
+        for i, elevation in enumerate(results):
+            np.testing.assert_allclose(elevation, LATS + i + LONS)
+        self.assertLess(len(slow.calls), 8)
+        self.assertEqual(model.stats.lookups, 8)
+        self.assertEqual(model.stats.points, 8 * len(LATS))
+        self.assertEqual(sum(slow.calls), model.stats.distinct_points)
+
+    def test_failed_lookup_does_not_fail_its_batch(self):
+        class FailingModel(SlowModel):
+            def get_elevation(self, trace: List[Coordinate]) -> List[float]:
+                if any(c.latitude < 0 for c in trace):
+                    self.calls.append(len(trace))
+                    raise ValueError("no data south of the equator")
+                return super().get_elevation(trace)
+
+        failing = FailingModel()
+        model = CoalescingElevationModel(failing, n_workers=1)
+        try:
+            with ThreadPoolExecutor(max_workers=3) as pool:
+                # keep the worker busy so that the next two lookups share a batch
+                busy = pool.submit(model.get_elevation_array, LATS, LONS)
+                time.sleep(0.01)
+                bad = pool.submit(model.get_elevation_array, -LATS, LONS)
+                good = pool.submit(model.get_elevation_array, LATS + 1, LONS)
+
+                np.testing.assert_allclose(good.result(), LATS + 1 + LONS)
+                with self.assertRaises(ValueError):
+                    bad.result()
+                busy.result()
+        finally:
+            model.close()
+
+        # the busy lookup, the merged batch that failed, then each on its own
+        self.assertEqual(failing.calls, [10, 20, 10, 10])
+
+    def test_raster_cache_decodes_a_block_once(self):
+        cache = RasterCache()
+        loads = []
+
+        def loader():
+            loads.append(1)
+            time.sleep(0.05)
+            return np.zeros(4, dtype=np.float32)
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            blocks = list(pool.map(lambda _: cache.block("key", loader), range(4)))
+
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(cache.stats.block_misses, 1)
+        self.assertEqual(cache.stats.block_coalesced + cache.stats.block_hits, 3)
+        self.assertTrue(all(block is blocks[0] for block in blocks))
+
+
+class GradeServerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmpdir.name) / "tiles"
+        write_synthetic_tile(self.db_path, "n40w106")
+        self.model = USGSLocal(self.db_path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def check_concurrent_clients(self, server: GradeServer):
+        offsets = [i * 0.001 for i in range(6)]
+
+        def run(offset):
+            with GradeClient(server.url) as client:
+                traces = [(LATS + offset, LONS), (LATS - offset, LONS)]
+                return client.grade(traces, filtering=True, des_sg=5)
+
+        with ThreadPoolExecutor(max_workers=len(offsets)) as pool:
+            responses = list(pool.map(run, offsets))
+
+        for offset, graded in zip(offsets, responses):
+            self.assertEqual(len(graded), 2)
+            df = pd.DataFrame({"latitude": LATS + offset, "longitude": LONS})
+            expected = gradeit(df, elevation_model=self.model, filtering=True, des_sg=5)
+            pd.testing.assert_frame_equal(
+                graded[0], expected.drop(columns=["latitude", "longitude"])
+            )
+            np.testing.assert_allclose(
+                graded[1]["elevation_ft"], synthetic_pixel_elevation_ft(LATS - offset, LONS)
+            )
+
+        with GradeClient(server.url) as client:
+            stats = client.stats()
+        self.assertEqual(stats["requests"], len(offsets))
+        self.assertEqual(stats["traces"], 2 * len(offsets))
+        self.assertEqual(stats["coalescing"]["lookups"], 2 * len(offsets))
+
+    def test_tcp(self):
+        with GradeServer(self.model, port=0) as server:
+            self.check_concurrent_clients(server)
+
+    def test_unix_socket(self):
+        socket_path = str(Path(self.tmpdir.name) / "gradeit.sock")
+        with GradeServer(self.model, unix_socket=socket_path) as server:
+            self.check_concurrent_clients(server)
+        self.assertFalse(Path(socket_path).exists())
+
+    def test_unix_socket_in_use_or_not_a_socket(self):
+        socket_path = str(Path(self.tmpdir.name) / "gradeit.sock")
+
+        # a socket left behind by a server that died is replaced
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(socket_path)
+        stale.close()
+        with GradeServer(self.model, unix_socket=socket_path) as server:
+            # the socket of a running server is not taken over
+            with self.assertRaises(OSError):
+                GradeServer(self.model, unix_socket=socket_path)
+            with GradeClient(server.url) as client:
+                self.assertEqual(client.stats()["requests"], 0)
+
+        Path(socket_path).write_text("not a socket")
+        with self.assertRaises(FileExistsError):
+            GradeServer(self.model, unix_socket=socket_path)
+        self.assertEqual(Path(socket_path).read_text(), "not a socket")
+
+    def test_manifest_needs_local_tiles(self):
+        with patch("sys.stderr"), self.assertRaises(SystemExit) as raised:
+            main(["--source", "usgs-api", "--manifest"])
+        self.assertEqual(raised.exception.code, 2)
+
+    def test_bad_request(self):
+        with GradeServer(self.model, port=0) as server, GradeClient(server.url) as client:
+            with self.assertRaises(RuntimeError):
+                client._request("POST", "/grade", b'{"traces": [{"latitude": [1.0]}]}')
+            # the connection is still usable
+            graded = client.grade([(LATS, LONS)])
+            self.assertEqual(client.stats()["errors"], 1)
+
+        np.testing.assert_allclose(
+            graded[0]["elevation_ft"], synthetic_pixel_elevation_ft(LATS, LONS)
+        )
+
+    def test_close_without_serving(self):
+        server = GradeServer(self.model, port=0)
+        done = threading.Event()
+        threading.Thread(target=lambda: (server.close(), done.set()), daemon=True).start()
+        self.assertTrue(done.wait(5))
+
+
+if __name__ == "__main__":
+    unittest.main(warnings="ignore")
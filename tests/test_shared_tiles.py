@@ -0,0 +1,103 @@
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+
+import numpy as np
+
+from gradeit.elevation.shared_tiles import SharedTileRegistry, segment_name
+from gradeit.elevation.usgs_local import USGSLocal
+from gradeit.testing import synthetic_pixel_elevation_ft, write_synthetic_tile
+
+
+def lookup(db_path, registry, lats, lons):
+    return USGSLocal(db_path, shared_tiles=registry).get_elevation_array(lats, lons)
+
+
+class SharedTilesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmpdir.name)
+        write_synthetic_tile(self.db_path, "n40w106")
+        write_synthetic_tile(self.db_path, "n41w106")
+        self.registry = SharedTileRegistry(max_bytes=64 * 1024 * 1024)
+
+    def tearDown(self):
+        self.registry.close()
+        self.tmpdir.cleanup()
+
+    def test_workers_share_one_copy(self):
+        lats = np.linspace(39.2, 39.8, 100)
+        lons = np.linspace(-105.8, -105.2, 100)
+
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            futures = [
+                pool.submit(lookup, self.db_path, self.registry, lats, lons) for _ in range(4)
+            ]
+            for future in futures:
+                np.testing.assert_allclose(
+                    future.result(), synthetic_pixel_elevation_ft(lats, lons)
+                )
+
+        stats = self.registry.stats
+        self.assertEqual(stats["loads"], 1)
+        self.assertEqual(stats["attaches"], 3)
+
+    def test_decode_does_not_block_published_tiles(self):
+        published = self.db_path / "n40w106" / "USGS_13_n40w106.tif"
+        loading = self.db_path / "n41w106" / "USGS_13_n41w106.tif"
+        with self.registry.tile(published, lambda: np.ones((10, 10))):
+            pass
+
+        started, release = threading.Event(), threading.Event()
+
+        def slow_loader():
+            started.set()
+            release.wait(10)
+            return np.zeros((10, 10))
+
+        def use(path, loader):
+            with self.registry.tile(path, loader) as tile:
+                return tile.sum()
+
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            decoding = pool.submit(use, loading, slow_loader)
+            self.assertTrue(started.wait(10))
+            # attaching to a published tile does not wait for the decode
+            self.assertEqual(pool.submit(use, published, None).result(timeout=5), 100)
+            # a second user of the tile waits for it instead of decoding it again
+            waiting = pool.submit(use, loading, lambda: np.ones((10, 10)))
+            self.assertFalse(waiting.done())
+            release.set()
+            self.assertEqual(decoding.result(timeout=10), 0)
+            self.assertEqual(waiting.result(timeout=10), 0)
+
+        self.assertEqual(self.registry.stats["loads"], 2)
+
+    def test_eviction_and_close(self):
+        tile_path = self.db_path / "n40w106" / "USGS_13_n40w106.tif"
+        with self.registry.tile(tile_path, lambda: np.ones((1000, 1000))) as tile:
+            nbytes = tile.nbytes
+        self.registry.max_bytes = nbytes
+
+        other_path = self.db_path / "n41w106" / "USGS_13_n41w106.tif"
+        with self.registry.tile(other_path, lambda: np.zeros((1000, 1000))) as tile:
+            # the idle tile was evicted to make room
+            self.assertEqual(self.registry.stats["evictions"], 1)
+            with self.assertRaises(FileNotFoundError):
+                SharedMemory(name=segment_name(tile_path))
+
+            # a tile that does not fit while the other is in use is private
+            with self.registry.tile(tile_path, lambda: np.ones((1000, 1000))) as private:
+                self.assertEqual(private.sum(), 1000 * 1000)
+            self.assertEqual(tile.sum(), 0)
+
+        self.registry.close()
+        with self.assertRaises(FileNotFoundError):
+            SharedMemory(name=segment_name(other_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
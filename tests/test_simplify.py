@@ -0,0 +1,90 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from gradeit.elevation.elevation_cache import PIXELS_PER_DEGREE
+from gradeit.elevation.elevation_model import ElevationModel
+from gradeit.grade import get_distances
+from gradeit.gradeit import gradeit
+from gradeit.simplify import get_simplified_elevation, thin_by_distance, thin_by_pixel
+from gradeit.testing import synthetic_elevation_m
+from gradeit.trace import Trace
+
+
+class PixelModel(ElevationModel):
+    """
+    Returns the synthetic surface sampled at the DEM pixel of each point
+    """
+
+    def __init__(self):
+        self.queried = 0
+
+    def get_elevation(self, trace):
+        return self.get_elevation_array(
+            [c.latitude for c in trace], [c.longitude for c in trace]
+        ).tolist()
+
+    def get_elevation_array(self, latitude, longitude):
+        self.queried += len(latitude)
+        lats = np.floor(np.asarray(latitude) * PIXELS_PER_DEGREE) / PIXELS_PER_DEGREE
+        lons = np.floor(np.asarray(longitude) * PIXELS_PER_DEGREE) / PIXELS_PER_DEGREE
+        return synthetic_elevation_m(lats, lons) * 3.28084
+
+
+def dense_trace(n=2000):
+    # ~2 ft between samples, with a stop in the middle
+    lats = np.linspace(39.50, 39.51, n)
+    lons = np.linspace(-105.50, -105.49, n)
+    lats[900:1100] = lats[900]
+    lons[900:1100] = lons[900]
+    return Trace.from_lat_lon(lats, lons)
+
+
+class SimplifyTest(unittest.TestCase):
+    def test_thin_by_pixel(self):
+        keep = thin_by_pixel(
+            [39.5, 39.5, 39.5, 39.6, 39.5], [-105.5, -105.5, -105.5, -105.5, -105.5]
+        )
+        self.assertEqual(keep.tolist(), [0, 3, 4])
+
+    def test_thin_by_distance(self):
+        cum_dist = np.array([0.0, 10.0, 20.0, 20.0, 35.0, 40.0, 41.0])
+        self.assertEqual(thin_by_distance(cum_dist, 15.0).tolist(), [0, 2, 4, 6])
+
+    def test_pixel_mode_is_exact(self):
+        trace = dense_trace()
+        full = PixelModel().get_elevation_array(trace.latitude, trace.longitude)
+
+        model = PixelModel()
+        elevation = get_simplified_elevation(model, trace)
+
+        np.testing.assert_array_equal(elevation, full)
+        self.assertLess(model.queried, len(trace) / 10)
+
+    def test_distance_mode_interpolates(self):
+        trace = dense_trace()
+        full = PixelModel().get_elevation_array(trace.latitude, trace.longitude)
+
+        model = PixelModel()
+        elevation = get_simplified_elevation(model, trace, spacing_ft=50.0)
+
+        self.assertLess(model.queried, len(trace) / 20)
+        cum_dist = np.append(0, np.cumsum(get_distances(trace)))
+        self.assertEqual(model.queried, len(np.unique(np.floor(cum_dist / 50.0))) + 1)
+        np.testing.assert_allclose(elevation, full, atol=1.0)
+
+    def test_gradeit_simplify(self):
+        trace = dense_trace()
+        df = pd.DataFrame({"latitude": trace.latitude, "longitude": trace.longitude})
+
+        expected = gradeit(df.copy(), elevation_model=PixelModel())
+        model = PixelModel()
+        result = gradeit(df.copy(), elevation_model=model, simplify=True)
+
+        pd.testing.assert_frame_equal(result, expected)
+        self.assertLess(model.queried, len(df) / 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
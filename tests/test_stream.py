@@ -0,0 +1,165 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from gradeit import repo_root
+from gradeit.elevation.usgs_local import USGSLocal, build_grid_refs
+from gradeit.gradeit import gradeit
+from gradeit.stream import GradeStream, gradeit_chunks, read_trace_chunks
+from gradeit.testing import write_synthetic_tile
+
+
+class StreamTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmpdir.name)
+        self.trip_path = repo_root() / "examples/data/sample_trip_1.csv"
+        self.df = pd.read_csv(self.trip_path)
+        for grid_ref in set(build_grid_refs(self.df.latitude.values, self.df.longitude.values)):
+            write_synthetic_tile(self.db_path, grid_ref)
+        self.emodel = USGSLocal(self.db_path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_chunks_match_whole_trace(self):
+        """
+        Chunked grading, including the filter at chunk boundaries, is
+        identical to grading the whole trace at once
+        """
+        whole = gradeit(self.df.copy(), filtering=True, elevation_model=self.emodel)
+
+        for chunksize in [5, 64, 1000, len(self.df)]:
+            chunks = read_trace_chunks(self.trip_path, chunksize=chunksize)
+            graded = pd.concat(
+                list(gradeit_chunks(chunks, filtering=True, elevation_model=self.emodel))
+            )
+            pd.testing.assert_frame_equal(graded, whole, check_exact=True)
+
+    def test_chunks_without_filtering(self):
+        whole = gradeit(self.df.copy(), elevation_model=self.emodel)
+
+        chunks = read_trace_chunks(self.trip_path, chunksize=100)
+        graded = pd.concat(list(gradeit_chunks(chunks, elevation_model=self.emodel)))
+
+        pd.testing.assert_frame_equal(graded, whole, check_exact=True)
+
+    def test_single_row_chunks(self):
+        whole = gradeit(self.df[:50].copy(), elevation_model=self.emodel)
+
+        chunks = (self.df[i : i + 1] for i in range(50))
+        graded = pd.concat(list(gradeit_chunks(chunks, elevation_model=self.emodel)))
+
+        pd.testing.assert_frame_equal(graded, whole, check_exact=True)
+
+    def test_requested_window_waits_for_enough_rows(self):
+        # des_sg=4 is rounded up to 5, which check_sg accepts once there are 5 rows
+        whole = gradeit(self.df.copy(), filtering=True, des_sg=4, elevation_model=self.emodel)
+
+        for chunksize in [1, 3]:
+            chunks = read_trace_chunks(self.trip_path, chunksize=chunksize)
+            graded = pd.concat(
+                list(gradeit_chunks(chunks, filtering=True, des_sg=4, elevation_model=self.emodel))
+            )
+            pd.testing.assert_frame_equal(graded, whole, check_exact=True)
+
+    def test_default_window_with_small_chunks(self):
+        for des_sg in [0, 3]:
+            for chunksize in [1, 2]:
+                chunks = read_trace_chunks(self.trip_path, chunksize=chunksize)
+                graded = pd.concat(
+                    list(
+                        gradeit_chunks(
+                            chunks, filtering=True, des_sg=des_sg, elevation_model=self.emodel
+                        )
+                    )
+                )
+                self.assertEqual(graded.index.tolist(), list(range(len(self.df))))
+                self.assertFalse(graded.isna().any().any())
+
+    def test_short_trace_is_left_unfiltered(self):
+        # three points are too few to fit the polynomial, as in elevation_filter
+        short = self.df[:3]
+        whole = gradeit(short.copy(), filtering=True, des_sg=0, elevation_model=self.emodel)
+
+        chunks = (short[i : i + 1] for i in range(3))
+        graded = pd.concat(
+            list(gradeit_chunks(chunks, filtering=True, des_sg=0, elevation_model=self.emodel))
+        )
+
+        pd.testing.assert_frame_equal(graded, whole, check_exact=True)
+        np.testing.assert_array_equal(graded.elevation_ft_filtered, graded.elevation_ft)
+
+    def test_read_parquet_chunks(self):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+
+        parquet_path = self.db_path / "trip.parquet"
+        self.df.to_parquet(parquet_path)
+
+        chunks = list(read_trace_chunks(parquet_path, chunksize=500))
+
+        self.assertEqual([len(c) for c in chunks], [500, 500, len(self.df) - 1000])
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), self.df)
+
+
+class GradeStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmpdir.name)
+        self.df = pd.read_csv(repo_root() / "examples/data/sample_trip_1.csv")
+        for grid_ref in set(build_grid_refs(self.df.latitude.values, self.df.longitude.values)):
+            write_synthetic_tile(self.db_path, grid_ref)
+        self.emodel = USGSLocal(self.db_path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def stream(self, grade_stream, batch_size):
+        lats, lons = self.df.latitude.values, self.df.longitude.values
+        graded = [
+            grade_stream.push(lats[i : i + batch_size], lons[i : i + batch_size])
+            for i in range(0, len(self.df), batch_size)
+        ]
+        return graded + [grade_stream.flush()]
+
+    def test_centered_stream_matches_gradeit(self):
+        whole = gradeit(self.df.copy(), filtering=True, des_sg=17, elevation_model=self.emodel)
+
+        for batch_size in [1, 7, 500]:
+            graded = pd.concat(self.stream(GradeStream(self.emodel, sg_window=17), batch_size))
+            pd.testing.assert_frame_equal(
+                graded, whole[graded.columns], check_exact=False, rtol=1e-9
+            )
+
+    def test_fixed_lag_latency_and_state(self):
+        grade_stream = GradeStream(self.emodel, sg_window=9, lag=2)
+        graded = self.stream(grade_stream, 1)
+
+        # nothing until the first window is full, then one point per point
+        self.assertEqual([len(g) for g in graded[:8]], [0] * 8)
+        self.assertEqual(len(graded[8]), 7)
+        self.assertTrue(all(len(g) == 1 for g in graded[9:-1]))
+        self.assertEqual(len(graded[-1]), 2)
+        self.assertLessEqual(len(grade_stream._elev), 9)
+
+        result = pd.concat(graded)
+        self.assertEqual(result.index.tolist(), list(range(len(self.df))))
+        self.assertFalse(result.isna().any().any())
+
+    def test_short_trip(self):
+        grade_stream = GradeStream(self.emodel)
+        self.assertEqual(len(grade_stream.push(self.df.latitude[:5], self.df.longitude[:5])), 0)
+
+        graded = grade_stream.flush()
+        self.assertEqual(len(graded), 5)
+        np.testing.assert_allclose(graded.elevation_ft_filtered, graded.elevation_ft, atol=5.0)
+
+
+if __name__ == "__main__":
+    unittest.main(warnings="ignore")
@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+from gradeit.elevation.elevation_cache import ElevationCache, MemoryElevationCache
+from gradeit.elevation.manifest import TileManifest
+from gradeit.elevation.tiered import TieredElevationModel
+from gradeit.elevation.usgs_api import USGSApi
+from gradeit.elevation.usgs_local import USGSLocal
+from gradeit.gradeit import build_elevation_model
+from gradeit.testing import (
+    FakeEPQSServer,
+    synthetic_elevation_m,
+    synthetic_pixel_elevation_ft,
+    write_synthetic_tile,
+)
+
+# mostly inside the local tile, with a few points outside of it
+LATS = np.concatenate([np.linspace(39.2, 39.8, 20), [36.5, 36.6]])
+LONS = np.concatenate([np.linspace(-105.8, -105.2, 20), [-100.5, -100.6]])
+
+
+class TieredModelTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmpdir.name) / "tiles"
+        write_synthetic_tile(self.db_path, "n40w106")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def build_model(self, url):
+        return TieredElevationModel(
+            [
+                ("memory", MemoryElevationCache()),
+                ("local", USGSLocal(self.db_path, manifest=TileManifest.load(self.db_path))),
+                ("disk", ElevationCache(Path(self.tmpdir.name) / "elevation.sqlite")),
+                ("api", USGSApi(url=url)),
+            ]
+        )
+
+    def test_tiers_and_write_back(self):
+        with FakeEPQSServer() as server:
+            model = self.build_model(server.url)
+            elevation = model.get_elevation_array(LATS, LONS)
+            self.assertEqual(server.requests, 2)
+
+            np.testing.assert_allclose(
+                elevation[:20], synthetic_pixel_elevation_ft(LATS[:20], LONS[:20])
+            )
+            np.testing.assert_allclose(
+                elevation[20:], synthetic_elevation_m(LATS[20:], LONS[20:]) * 3.28084
+            )
+            self.assertEqual(model.stats["local"].hits, 20)
+            self.assertEqual(model.stats["api"].hits, 2)
+
+            # a second lookup is answered from memory
+            np.testing.assert_array_equal(model.get_elevation_array(LATS, LONS), elevation)
+            self.assertEqual(model.stats["memory"].hits, 22)
+
+            # a new model with a cold memory cache finds the api answers on disk
+            model = self.build_model(server.url)
+            np.testing.assert_array_equal(model.get_elevation_array(LATS, LONS), elevation)
+            self.assertEqual(model.stats["disk"].hits, 2)
+            self.assertEqual(model.stats["api"].hits + model.stats["api"].misses, 0)
+            self.assertEqual(server.requests, 2)
+
+    def test_nodata_falls_through(self):
+        import rasterio as rio
+        from rasterio.windows import Window
+
+        # a hole in the tile around the first point
+        with rio.open(self.db_path / "n40w106" / "USGS_13_n40w106.tif", "r+") as dst:
+            dst.nodata = -999999
+            row, col = dst.index(LONS[0], LATS[0])
+            window = Window(col - 1, row - 1, 3, 3)
+            dst.write(np.full((3, 3), -999999, dtype=np.float32), 1, window=window)
+
+        with FakeEPQSServer() as server:
+            model = self.build_model(server.url)
+            elevation = model.get_elevation_array(LATS, LONS)
+
+            self.assertEqual(server.requests, 3)
+            self.assertEqual(model.stats["local"].hits, 19)
+            self.assertAlmostEqual(
+                elevation[0], synthetic_elevation_m(LATS[0], LONS[0]) * 3.28084, places=6
+            )
+            np.testing.assert_allclose(
+                elevation[1:20], synthetic_pixel_elevation_ft(LATS[1:20], LONS[1:20])
+            )
+
+            # the caches hold the api answer, not the nodata value
+            model = self.build_model(server.url)
+            np.testing.assert_array_equal(model.get_elevation_array(LATS, LONS), elevation)
+            self.assertEqual(model.stats["disk"].hits, 3)
+
+    def test_built_models_share_their_stores(self):
+        cache_home = Path(self.tmpdir.name) / "cache"
+        with patch.dict(os.environ, {"XDG_CACHE_HOME": str(cache_home)}):
+            first = build_elevation_model("usgs-tiered", self.db_path)
+            second = build_elevation_model("usgs-tiered", str(self.db_path))
+
+        first_tiers, second_tiers = dict(first.tiers), dict(second.tiers)
+        self.assertIs(first_tiers["memory"], second_tiers["memory"])
+        self.assertIs(first_tiers["local"].manifest, second_tiers["local"].manifest)
+        self.assertIs(first_tiers["disk"], second_tiers["disk"])
+        self.assertEqual(first_tiers["disk"].path, cache_home / "gradeit/elevation.sqlite")
+
+
+if __name__ == "__main__":
+    unittest.main()
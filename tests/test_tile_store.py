@@ -0,0 +1,64 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from gradeit.elevation.tile_store import USGSCompiled, compile_tile
+from gradeit.elevation.usgs_local import USGSLocal
+from gradeit.gradeit import gradeit
+from gradeit.testing import write_synthetic_tile
+
+LATS = np.linspace(39.702730, 40.695368, 50)
+LONS = np.linspace(-105.245678, -105.209049, 50)
+
+
+class TileStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmpdir.name) / "tiles"
+        self.store_path = Path(self.tmpdir.name) / "compiled"
+        self.tif_paths = [
+            write_synthetic_tile(self.db_path, "n40w106"),
+            write_synthetic_tile(self.db_path, "n41w106"),
+        ]
+        self.expected = USGSLocal(self.db_path).get_elevation_array(LATS, LONS)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_compiled_matches_geotiff(self):
+        for tif_path in self.tif_paths:
+            compile_tile(tif_path, self.store_path)
+
+        elevation_ft = USGSCompiled(self.store_path).get_elevation_array(LATS, LONS)
+
+        np.testing.assert_array_equal(elevation_ft, self.expected)
+
+    def test_quantized_within_a_decimeter(self):
+        for tif_path in self.tif_paths:
+            compile_tile(tif_path, self.store_path, quantize=True)
+
+        emodel = USGSCompiled(self.store_path)
+        elevation_ft = emodel.get_elevation_array(LATS, LONS)
+
+        self.assertEqual(emodel._tile("n40w106")[0].dtype, np.int16)
+        np.testing.assert_allclose(elevation_ft, self.expected, atol=0.05 * 3.28084 + 1e-9)
+
+    def test_gradeit_source(self):
+        for tif_path in self.tif_paths:
+            compile_tile(tif_path, self.store_path)
+        df = pd.DataFrame({"latitude": LATS, "longitude": LONS})
+
+        graded = gradeit(df, source="usgs-compiled", usgs_db_path=self.store_path)
+
+        np.testing.assert_array_equal(graded.elevation_ft, self.expected)
+
+    def test_missing_tile_raises(self):
+        with self.assertRaisesRegex(FileNotFoundError, "The compiled tile .* does not exist"):
+            USGSCompiled(self.store_path).get_elevation_array(LATS, LONS)
+
+
+if __name__ == "__main__":
+    unittest.main(warnings="ignore")